@@ -1,16 +1,53 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, Header, HTTPException, Query, Request, Response
 from dotenv import load_dotenv
+from fastapi.responses import StreamingResponse
 from starlette.middleware.cors import CORSMiddleware
+from starlette.datastructures import Headers, MutableHeaders
 import os
+import io
+import csv
+import json
+import base64
+import tempfile
+import asyncio
+import calendar
+import functools
+import itertools
+import threading
+import time
 import logging
+import unicodedata
+import anyio
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict
+from collections import Counter, OrderedDict, deque
+from pydantic import BaseModel, Field, ConfigDict, ValidationError
 from typing import List, Optional
 import uuid
-from datetime import datetime, timezone
-from supabase import create_client, Client
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from supabase import create_client, Client, ClientOptions
+from postgrest.exceptions import APIError
 import jwt
 import hashlib
+import hmac
+import bisect
+import contextlib
+import contextvars
+import sys
+import zlib
+import random
+import httpx
+
+# orjson e brotli são opcionais: sem eles ficam o encoder JSON padrão e só gzip
+try:
+    import orjson  # noqa: F401 (usado pelo ORJSONResponse)
+    from fastapi.responses import ORJSONResponse as RespostaJSON
+except ImportError:
+    from fastapi.responses import JSONResponse as RespostaJSON
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 
 ROOT_DIR = Path(__file__).parent
@@ -19,10 +56,580 @@ load_dotenv(ROOT_DIR / '.env')
 # Supabase connection
 supabase_url = os.environ['SUPABASE_URL']
 supabase_key = os.environ['SUPABASE_KEY']
-supabase: Client = create_client(supabase_url, supabase_key)
+SUPABASE_TIMEOUT = float(os.environ.get('SUPABASE_TIMEOUT', '10'))
+SUPABASE_MAX_CONCURRENCY = int(os.environ.get('SUPABASE_MAX_CONCURRENCY', '20'))
+supabase: Client = create_client(
+    supabase_url,
+    supabase_key,
+    options=ClientOptions(postgrest_client_timeout=SUPABASE_TIMEOUT)
+)
+
+# O cliente supabase é síncrono: as chamadas rodam em threads de trabalho,
+# limitadas a SUPABASE_MAX_CONCURRENCY simultâneas, para não bloquear o event
+# loop. O cliente HTTP por baixo é compartilhado e mantém conexões keep-alive.
+_supabase_limiter = anyio.CapacityLimiter(SUPABASE_MAX_CONCURRENCY)
+
+async def _em_thread(funcao, *args):
+    """Run a blocking function that talks to Supabase in the bounded worker pool"""
+    chamada = functools.partial(funcao, *args)
+    perfil = _perfil_atual.get()
+    if perfil is not None:
+        chamada = perfil.na_thread(chamada)
+    return await anyio.to_thread.run_sync(chamada, limiter=_supabase_limiter)
+
+# ==================== MÉTRICAS ====================
+# GET /metrics no formato de exposição do Prometheus. Os valores ficam em
+# memória, por processo: cada worker do uvicorn expõe os seus.
+METRICAS_TOKEN = os.environ.get('METRICAS_TOKEN')
+METRICAS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+_METRICAS = []
+
+def _escapar_rotulo(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _rotulos_prometheus(nomes: tuple, valores: tuple, extra: str = "") -> str:
+    pares = [f'{nome}="{_escapar_rotulo(valor)}"' for nome, valor in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+class _Contador:
+    """In-process Prometheus counter keyed by label values"""
+
+    tipo = "counter"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: tuple):
+        self.nome, self.ajuda, self.rotulos = nome, ajuda, rotulos
+        self._series = {}
+        self._lock = threading.Lock()
+        _METRICAS.append(self)
+
+    def inc(self, valor: float = 1, *rotulos):
+        with self._lock:
+            self._series[rotulos] = self._series.get(rotulos, 0) + valor
+
+    def exportar(self) -> list:
+        with self._lock:
+            series = sorted(self._series.items())
+        return [f"{self.nome}{_rotulos_prometheus(self.rotulos, r)} {v}" for r, v in series]
+
+class _Histograma(_Contador):
+    """In-process Prometheus histogram keyed by label values.
+
+    An observation is a bisect and two additions under a lock, cheap enough
+    to leave on for every request and every query.
+    """
+
+    tipo = "histogram"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: tuple, buckets: tuple = METRICAS_BUCKETS):
+        super().__init__(nome, ajuda, rotulos)
+        self.buckets = buckets
+
+    def observar(self, valor: float, *rotulos):
+        with self._lock:
+            serie = self._series.get(rotulos)
+            if serie is None:
+                # Contagem por bucket (a última é o +Inf) e, no fim, a soma
+                serie = self._series[rotulos] = [0] * (len(self.buckets) + 1) + [0.0]
+            serie[bisect.bisect_left(self.buckets, valor)] += 1
+            serie[-1] += valor
+
+    def exportar(self) -> list:
+        with self._lock:
+            series = sorted((r, list(s)) for r, s in self._series.items())
+        linhas = []
+        for rotulos, serie in series:
+            acumulado = 0
+            for limite, quantidade in zip(self.buckets + ("+Inf",), serie):
+                acumulado += quantidade
+                le = f'le="{limite}"'
+                linhas.append(f"{self.nome}_bucket{_rotulos_prometheus(self.rotulos, rotulos, le)} {acumulado}")
+            linhas.append(f"{self.nome}_sum{_rotulos_prometheus(self.rotulos, rotulos)} {serie[-1]}")
+            linhas.append(f"{self.nome}_count{_rotulos_prometheus(self.rotulos, rotulos)} {acumulado}")
+        return linhas
+
+class _Medidor(_Contador):
+    """In-process Prometheus gauge keyed by label values (``inc`` takes negatives)"""
+
+    tipo = "gauge"
+
+def _exportar_metricas() -> str:
+    linhas = []
+    for metrica in _METRICAS:
+        linhas += [f"# HELP {metrica.nome} {metrica.ajuda}", f"# TYPE {metrica.nome} {metrica.tipo}"]
+        linhas += metrica.exportar()
+    return "\n".join(linhas) + "\n"
+
+_metrica_http = _Histograma(
+    "http_request_duration_seconds", "HTTP request latency (the _count series is the request count)",
+    ("method", "route", "status")
+)
+_metrica_consultas = _Histograma(
+    "supabase_query_duration_seconds", "Latency of each outbound Supabase call",
+    ("table", "operation", "outcome")
+)
+_metrica_relatorio = _Histograma(
+    "report_compute_duration_seconds", "Time to compute a report on a cache miss",
+    ("driver", "backend")
+)
+_metrica_relatorio_linhas = _Contador(
+    "report_rows_scanned_total", "Rows read to aggregate reports, by source table",
+    ("source",)
+)
+_metrica_relatorio_coalescidas = _Contador(
+    "report_requests_coalesced_total", "Report requests that waited on an identical computation already in flight",
+    ()
+)
+_metrica_admissao_fila = _Medidor(
+    "report_admission_queue_depth", "Heavy report computations waiting for a slot", ()
+)
+_metrica_admissao_ativas = _Medidor(
+    "report_admission_in_flight", "Heavy report computations running", ()
+)
+_metrica_admissao_recusadas = _Contador(
+    "report_admission_rejected_total", "Heavy report computations refused with 429",
+    ("reason",)
+)
+_metrica_tentativas = _Contador(
+    "supabase_retries_total", "Supabase reads retried after a transient failure",
+    ("table", "operation")
+)
+_metrica_disjuntor = _Medidor(
+    "supabase_circuit_open", "1 while the Supabase circuit breaker is open", ()
+)
+_metrica_disjuntor_recusadas = _Contador(
+    "supabase_circuit_rejected_total", "Supabase calls failed fast by the open circuit breaker", ()
+)
+_metrica_desatualizadas = _Contador(
+    "stale_responses_total", "Responses served from the last good copy while Supabase was failing",
+    ("resource",)
+)
+_metrica_sse_assinantes = _Medidor(
+    "sse_subscribers", "Open /api/stream/lancamentos connections", ()
+)
+_metrica_sse_publicados = _Contador(
+    "sse_events_published_total", "Lancamentos events published to the SSE broker",
+    ("type",)
+)
+_metrica_sse_descartados = _Contador(
+    "sse_events_dropped_total", "SSE events dropped for subscribers too slow to keep up", ()
+)
+
+_OPERACOES_HTTP = {"GET": "select", "HEAD": "count", "PATCH": "update", "DELETE": "delete"}
+
+def _rotulos_consulta(query) -> tuple:
+    """Table (or rpc/<function>) and operation of a postgrest request builder"""
+    requisicao = getattr(query, "request", None)
+    if requisicao is None:
+        return "unknown", "unknown"
+    tabela = str(requisicao.path).split("/rest/v1/", 1)[-1].split("?", 1)[0]
+    if tabela.startswith("rpc/"):
+        return tabela, "rpc"
+    if requisicao.http_method == "POST":
+        upsert = "resolution=" in (requisicao.headers or {}).get("prefer", "")
+        return tabela, "upsert" if upsert else "insert"
+    return tabela, _OPERACOES_HTTP.get(requisicao.http_method, str(requisicao.http_method).lower())
+
+@contextlib.contextmanager
+def _medir_consulta(tabela: str, operacao: str):
+    perfil = _perfil_atual.get()
+    if perfil is not None:
+        perfil.consultas(1)
+    inicio = time.perf_counter()
+    resultado = "error"
+    try:
+        yield
+        resultado = "ok"
+    finally:
+        _metrica_consultas.observar(time.perf_counter() - inicio, tabela, operacao, resultado)
+        if perfil is not None:
+            perfil.consultas(-1)
+
+# ==================== RESILIÊNCIA ====================
+# Toda chamada ao Supabase passa por _executar_medido (e, com DB_DRIVER=postgres,
+# toda consulta do asyncpg por _LancamentosPostgres._buscar). Leituras idempotentes
+# (select, count e as RPCs de consulta) que falham por erro transitório (rede,
+# timeout, 5xx do gateway, Postgres sem conexões) são repetidas até
+# SUPABASE_TENTATIVAS vezes, com backoff exponencial e jitter. O timeout de
+# cada tentativa é o SUPABASE_TIMEOUT do cliente. Um disjuntor compartilhado
+# abre depois de DISJUNTOR_FALHAS falhas transitórias seguidas: por
+# DISJUNTOR_PAUSA segundos as chamadas falham na hora, sem prender threads
+# esperando o timeout, e as rotas respondem 503 com Retry-After (variáveis e
+# relatórios respondem a última cópia boa, com X-Stale: true). Passada a
+# pausa, uma chamada de teste decide se ele fecha ou abre de novo.
+SUPABASE_TENTATIVAS = int(os.environ.get('SUPABASE_TENTATIVAS', '3'))
+SUPABASE_BACKOFF_MS = float(os.environ.get('SUPABASE_BACKOFF_MS', '100'))
+SUPABASE_BACKOFF_MAX_MS = float(os.environ.get('SUPABASE_BACKOFF_MAX_MS', '2000'))
+DISJUNTOR_FALHAS = int(os.environ.get('DISJUNTOR_FALHAS', '5'))
+DISJUNTOR_PAUSA = float(os.environ.get('DISJUNTOR_PAUSA', '15'))
+
+# RPCs que só leem e podem ser repetidas
+_RPCS_LEITURA = {"rpc/relatorio_agregado", "rpc/sugerir_referencias", "rpc/rollup_mantido_por_trigger"}
+# Erros do lado do banco, não da requisição. Sem corpo JSON (HTML do
+# gateway) o código do APIError é o status HTTP
+_CODIGOS_TRANSITORIOS = {
+    "PGRST000", "PGRST001", "PGRST002",  # PostgREST sem conexão com o Postgres
+    "57014",  # statement_timeout
+    "53300",  # too_many_connections
+    "57P01", "57P02", "57P03",  # Postgres reiniciando
+    "08000", "08001", "08003", "08004", "08006",  # conexão
+    "500", "502", "503", "504",
+}
+
+class _SupabaseIndisponivel(Exception):
+    """Raised without calling Supabase while the circuit breaker is open"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Banco de dados indisponível no momento, tente novamente em instantes")
+        self.retry_after = retry_after
+
+def _falha_transitoria(e: Exception) -> bool:
+    """Whether an error means Supabase is unhealthy rather than the request being wrong"""
+    if isinstance(e, (_SupabaseIndisponivel, httpx.TransportError, ConnectionError, TimeoutError)):
+        return True
+    if isinstance(e, APIError):
+        return str(e.code) in _CODIGOS_TRANSITORIOS
+    # DB_DRIVER=postgres: erros do asyncpg trazem o SQLSTATE; as classes 08
+    # (conexão) e 57P (servidor reiniciando) são inteiras transitórias
+    sqlstate = getattr(e, "sqlstate", None)
+    return sqlstate in _CODIGOS_TRANSITORIOS or str(sqlstate).startswith(("08", "57P"))
+
+class _Disjuntor:
+    """Circuit breaker shared by every Supabase call of the process"""
+
+    def __init__(self, falhas_max: int, pausa: float, relogio=time.monotonic):
+        self.falhas_max, self.pausa = max(falhas_max, 1), pausa
+        self._relogio = relogio
+        self._falhas = 0
+        self._aberto_ate = 0.0
+        self._testando = False
+        self._lock = threading.Lock()
+
+    @property
+    def aberto(self) -> bool:
+        return self._falhas >= self.falhas_max
+
+    def retry_after(self) -> int:
+        return max(1, int(self._aberto_ate - self._relogio() + 0.999))
+
+    def liberar(self):
+        """Raise _SupabaseIndisponivel unless a call may go to Supabase now"""
+        with self._lock:
+            if not self.aberto:
+                return
+            if self._relogio() >= self._aberto_ate and not self._testando:
+                self._testando = True  # meio aberto: só esta chamada passa
+                return
+        _metrica_disjuntor_recusadas.inc()
+        raise _SupabaseIndisponivel(self.retry_after())
+
+    def sucesso(self):
+        with self._lock:
+            if self.aberto:
+                logger.info("Supabase circuit breaker closed")
+                _metrica_disjuntor.inc(-1)
+            self._falhas = 0
+            self._testando = False
+
+    def falha(self):
+        with self._lock:
+            self._falhas += 1
+            # Abre na falha que atinge o limite ou na da chamada de teste;
+            # chamadas que já estavam em andamento não estendem a pausa
+            if self._falhas == self.falhas_max or self._testando:
+                if self._falhas == self.falhas_max:
+                    _metrica_disjuntor.inc(1)
+                logger.warning(f"Supabase circuit breaker open for {self.pausa:g}s")
+                self._aberto_ate = self._relogio() + self.pausa
+            self._testando = False
+
+_disjuntor = _Disjuntor(DISJUNTOR_FALHAS, DISJUNTOR_PAUSA)
+
+def _tentativas(tabela: str, operacao: str) -> int:
+    """Attempts for a call: only idempotent reads are retried"""
+    leitura = operacao in ("select", "count") or tabela in _RPCS_LEITURA
+    return max(SUPABASE_TENTATIVAS, 1) if leitura else 1
+
+def _pausa_tentativa(tentativa: int) -> float:
+    """Seconds to wait before retrying, exponential backoff with full jitter"""
+    return random.uniform(0, min(SUPABASE_BACKOFF_MAX_MS, SUPABASE_BACKOFF_MS * 2 ** tentativa)) / 1000
+
+def _executar_medido(query):
+    """Execute a supabase query builder, timing it by table and operation.
+
+    Every attempt goes through the circuit breaker; idempotent reads that
+    fail transiently are retried with exponential backoff and full jitter.
+    """
+    tabela, operacao = _rotulos_consulta(query)
+    tentativas = _tentativas(tabela, operacao)
+    for tentativa in range(tentativas):
+        _disjuntor.liberar()
+        try:
+            with _medir_consulta(tabela, operacao):
+                resposta = query.execute()
+        except Exception as e:
+            if not _falha_transitoria(e):
+                _disjuntor.sucesso()  # o Supabase respondeu; o erro é da requisição
+                raise
+            _disjuntor.falha()
+            if tentativa + 1 >= tentativas or _disjuntor.aberto:
+                raise
+            _metrica_tentativas.inc(1, tabela, operacao)
+            time.sleep(_pausa_tentativa(tentativa))
+        else:
+            _disjuntor.sucesso()
+            return resposta
+
+def _erro_http(e: Exception) -> HTTPException:
+    """HTTPException for an unexpected handler error: 503 with Retry-After when Supabase is failing"""
+    if isinstance(e, HTTPException):
+        return e
+    if _falha_transitoria(e):
+        retry_after = e.retry_after if isinstance(e, _SupabaseIndisponivel) else 1
+        return HTTPException(
+            status_code=503,
+            detail="Banco de dados indisponível no momento, tente novamente em instantes",
+            headers={"Retry-After": str(retry_after)}
+        )
+    return HTTPException(status_code=500, detail=str(e))
+
+def _resposta_desatualizada(dados, recurso: str, erro: Exception):
+    """Last good copy of a resource, marked stale, served while Supabase is failing"""
+    logger.warning(f"Serving stale {recurso}: {erro}")
+    _metrica_desatualizadas.inc(1, recurso)
+    return RespostaJSON(dados, headers={"X-Stale": "true", "Cache-Control": "no-store"})
+
+async def _executar(query):
+    """Execute a supabase query builder without blocking the event loop"""
+    return await _em_thread(_executar_medido, query)
+
+# ==================== PROFILER ====================
+# Perfil de uma única chamada a GET /api/lancamentos ou /api/relatorios, pedido
+# com o header X-Profile (ou ?profile=) igual a PROFILER_TOKEN; sem o token
+# configurado o modo fica desligado. Uma thread amostra, a cada
+# PROFILER_INTERVALO_MS, as pilhas das threads que atendem a requisição: a do
+# endpoint e as de trabalho chamadas por _em_thread. O tempo por etapa volta no
+# header Server-Timing e o perfil fica em memória (os últimos PROFILER_MAX) em
+# GET /api/profiles/{id}, com as pilhas no formato "collapsed" do flamegraph.pl
+# e do speedscope; com X-Profile-Output: inline ele volta no lugar da resposta.
+# O endpoint roda no event loop: com outras requisições em andamento no mesmo
+# worker, as pilhas delas também podem aparecer.
+PROFILER_TOKEN = os.environ.get('PROFILER_TOKEN')
+PROFILER_INTERVALO_MS = float(os.environ.get('PROFILER_INTERVALO_MS', '1'))
+PROFILER_MAX = int(os.environ.get('PROFILER_MAX', '20'))
+_perfil_atual = contextvars.ContextVar("perfil_atual", default=None)
+_perfis = OrderedDict()
+_perfis_lock = threading.Lock()
+_perfis_ativos = 0
+_intervalo_gil = sys.getswitchinterval()
+
+# Cada pilha amostrada vai para a etapa do quadro mais interno reconhecido;
+# com várias threads ocupadas no mesmo instante vale a primeira desta ordem
+PERFIL_ETAPAS = ("aggregate", "decode", "serialize", "db", "other")
+_PERFIL_FUNCOES = {
+    "_agregar_lancamentos": "aggregate",
+    "_agregado_de_linhas_rpc": "aggregate",
+    "_agregar_rollup": "aggregate",
+    "_montar_relatorio": "aggregate",
+    "_com_percentual_perdas": "aggregate",
+    "_linha_json": "decode",
+    "_executar_medido": "db",
+    "_buscar": "db",
+}
+_PERFIL_ARQUIVOS = (
+    ("/json/decoder.py", "decode"),
+    ("/pydantic/", "decode"),
+    ("/json/encoder.py", "serialize"),
+    ("/fastapi/encoders.py", "serialize"),
+    ("/fastapi/responses.py", "serialize"),
+    ("/starlette/responses.py", "serialize"),
+)
+
+def _etapa_da_pilha(codigos: list) -> str:
+    """Breakdown stage of a sampled stack, given its code objects innermost first"""
+    for codigo in codigos:
+        if codigo.co_filename == __file__:
+            etapa = _PERFIL_FUNCOES.get(codigo.co_name)
+        else:
+            etapa = next((e for trecho, e in _PERFIL_ARQUIVOS if trecho in codigo.co_filename), None)
+        if etapa:
+            return etapa
+    return "other"
+
+def _nome_quadro(codigo) -> str:
+    return f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})"
+
+class _Perfil:
+    """Sampling profiler for one request.
+
+    Only threads registered with ``thread_atual`` are sampled, and only while
+    they run code from this module: an event loop parked in ``select`` is
+    waiting, not working. A tick where no registered thread is busy counts as
+    database wait if a query is in flight, so the stages add up to wall time.
+    """
+
+    def __init__(self, rota: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.rota = rota
+        self.inicio = datetime.now(timezone.utc)
+        self.duracao = 0.0
+        self.pilhas = Counter()
+        self.amostras = Counter()
+        self._consultas = 0
+        self._threads = Counter()
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._amostrador = threading.Thread(target=self._amostrar, name=f"perfil-{self.id}", daemon=True)
+
+    def __enter__(self):
+        global _perfis_ativos, _intervalo_gil
+        # A thread de amostragem só pega o GIL a cada switch interval (5 ms por
+        # padrão): enquanto houver perfil ativo ele cai para o intervalo de amostragem
+        with _perfis_lock:
+            if not _perfis_ativos:
+                _intervalo_gil = sys.getswitchinterval()
+                sys.setswitchinterval(min(_intervalo_gil, PROFILER_INTERVALO_MS / 1000))
+            _perfis_ativos += 1
+        self._relogio = time.perf_counter()
+        self._amostrador.start()
+        return self
+
+    def __exit__(self, *exc):
+        global _perfis_ativos
+        self._parar.set()
+        self._amostrador.join()
+        self.duracao = time.perf_counter() - self._relogio
+        with _perfis_lock:
+            _perfis_ativos -= 1
+            if not _perfis_ativos:
+                sys.setswitchinterval(_intervalo_gil)
+
+    def consultas(self, delta: int):
+        with self._lock:
+            self._consultas += delta
+
+    @contextlib.contextmanager
+    def thread_atual(self):
+        """Sample the calling thread while the block runs"""
+        ident = threading.get_ident()
+        with self._lock:
+            self._threads[ident] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._threads[ident] -= 1
+                if not self._threads[ident]:
+                    del self._threads[ident]
+
+    def na_thread(self, funcao):
+        def executar():
+            with self.thread_atual():
+                return funcao()
+        return executar
+
+    def _amostrar(self):
+        intervalo = PROFILER_INTERVALO_MS / 1000
+        while not self._parar.wait(intervalo):
+            with self._lock:
+                threads, consultas = list(self._threads), self._consultas
+            quadros = sys._current_frames()
+            etapas = []
+            for ident in threads:
+                quadro, codigos = quadros.get(ident), []
+                while quadro is not None:
+                    codigos.append(quadro.f_code)
+                    quadro = quadro.f_back
+                if not any(codigo.co_filename == __file__ for codigo in codigos):
+                    continue
+                etapas.append(_etapa_da_pilha(codigos))
+                self.pilhas[";".join(_nome_quadro(codigo) for codigo in reversed(codigos))] += 1
+            del quadros
+            if etapas:
+                self.amostras[min(etapas, key=PERFIL_ETAPAS.index)] += 1
+            elif consultas:
+                self.amostras["db"] += 1
+                self.pilhas["(aguardando o banco)"] += 1
+            else:
+                self.amostras["other"] += 1
+                self.pilhas["(aguardando)"] += 1
+
+    def etapas_ms(self) -> dict:
+        total = sum(self.amostras.values())
+        return {
+            etapa: round(self.duracao * 1000 * self.amostras[etapa] / total, 2) if total else 0.0
+            for etapa in PERFIL_ETAPAS
+        }
+
+    def server_timing(self) -> str:
+        etapas = [f"total;dur={self.duracao * 1000:.2f}"]
+        etapas += [f"{etapa};dur={ms}" for etapa, ms in self.etapas_ms().items()]
+        return ", ".join(etapas)
+
+    def folded(self) -> str:
+        return "".join(f"{pilha} {n}\n" for pilha, n in self.pilhas.most_common())
+
+    def resumo(self) -> dict:
+        return {
+            "id": self.id,
+            "rota": self.rota,
+            "inicio": self.inicio.isoformat(),
+            "duracao_ms": round(self.duracao * 1000, 2),
+            "intervalo_ms": PROFILER_INTERVALO_MS,
+            "amostras": sum(self.amostras.values()),
+            "etapas_ms": self.etapas_ms(),
+            "folded": self.folded()
+        }
+
+def _token_profiler_valido(valor: Optional[str]) -> bool:
+    return bool(PROFILER_TOKEN and valor) and hmac.compare_digest(valor.encode(), PROFILER_TOKEN.encode())
+
+def _guardar_perfil(perfil: _Perfil):
+    with _perfis_lock:
+        _perfis[perfil.id] = perfil
+        while len(_perfis) > PROFILER_MAX:
+            _perfis.popitem(last=False)
+
+def _perfilavel(endpoint):
+    """Let an endpoint (which must take ``request``) run under the profiler on demand.
+
+    Without PROFILER_TOKEN the only cost is one global lookup per request.
+    """
+    @functools.wraps(endpoint)
+    async def executar(**kwargs):
+        if not PROFILER_TOKEN:
+            return await endpoint(**kwargs)
+        request = kwargs["request"]
+        token = request.headers.get("x-profile") or request.query_params.get("profile")
+        if token is None:
+            return await endpoint(**kwargs)
+        if not _token_profiler_valido(token):
+            raise HTTPException(status_code=401, detail="Token do profiler inválido")
+
+        perfil = _Perfil(f"{request.method} {request.url.path}")
+        contexto = _perfil_atual.set(perfil)
+        try:
+            with perfil, perfil.thread_atual():
+                resposta = await endpoint(**kwargs)
+                if not isinstance(resposta, Response):
+                    # Serializa aqui para a etapa entrar no perfil
+                    resposta = RespostaJSON(resposta)
+        finally:
+            _perfil_atual.reset(contexto)
+            _guardar_perfil(perfil)
+        if request.headers.get("x-profile-output") == "inline":
+            resposta = RespostaJSON(perfil.resumo())
+        resposta.headers["Server-Timing"] = perfil.server_timing()
+        resposta.headers["X-Profile-Id"] = perfil.id
+        return resposta
+    return executar
+
+# Contadores dos caches em processo (GET /api/cache/stats)
+_cache_stats = {}
 
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(default_response_class=RespostaJSON)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -89,16 +696,16 @@ async def create_status_check(input: StatusCheckCreate):
     }
     
     try:
-        result = supabase.table("status_checks").insert(doc).execute()
+        result = await _executar(supabase.table("status_checks").insert(doc))
         return status_obj
     except Exception as e:
         logger.error(f"Error inserting status check: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise _erro_http(e)
 
 @api_router.get("/status", response_model=List[StatusCheck])
 async def get_status_checks():
     try:
-        response = supabase.table("status_checks").select("*").execute()
+        response = await _executar(supabase.table("status_checks").select("*"))
         
         # Convert ISO string timestamps back to datetime objects
         status_checks = []
@@ -110,7 +717,7 @@ async def get_status_checks():
         return status_checks
     except Exception as e:
         logger.error(f"Error fetching status checks: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise _erro_http(e)
 
 # Authentication endpoints
 @api_router.post("/auth/register")
@@ -130,12 +737,12 @@ async def register_user(user_data: UserRegister):
         }
         
         # Insert into Supabase
-        result = supabase.table("users").insert(user_doc).execute()
+        result = await _executar(supabase.table("users").insert(user_doc))
         
         return {"message": "Usuário cadastrado com sucesso!", "user_id": user_doc["id"]}
     except Exception as e:
         logger.error(f"Error registering user: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise _erro_http(e)
 
 @api_router.post("/auth/login")
 async def login_user(login_data: UserLogin):
@@ -144,7 +751,7 @@ async def login_user(login_data: UserLogin):
         password_hash = hashlib.sha256(login_data.senha.encode()).hexdigest()
         
         # Query user from Supabase
-        response = supabase.table("users").select("*").eq("email", login_data.email).eq("senha", password_hash).execute()
+        response = await _executar(supabase.table("users").select("*").eq("email", login_data.email).eq("senha", password_hash))
         
         if not response.data:
             raise HTTPException(status_code=401, detail="Credenciais inválidas")
@@ -167,26 +774,75 @@ async def login_user(login_data: UserLogin):
         raise
     except Exception as e:
         logger.error(f"Error logging in user: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise _erro_http(e)
 
 # ==================== VARIABLES ENDPOINTS ====================
 
+# Cache em memória da lista ordenada de variáveis. Turnos, formatos e cores
+# quase nunca mudam; as escritas abaixo invalidam o cache na hora.
+VARIAVEIS_CACHE_TTL = float(os.environ.get('VARIAVEIS_CACHE_TTL', '300'))
+# "boa" é a última lista lida com sucesso, que as invalidações não apagam
+_cache_variaveis = {"dados": None, "etag": None, "expira_em": 0.0, "geracao": 0, "boa": None}
+_cache_stats["variaveis"] = {"hits": 0, "misses": 0, "invalidacoes": 0}
+
+def _gerar_etag(dados) -> str:
+    # Fraco: o mesmo ETag vale para o corpo em gzip, brotli ou sem compressão
+    return 'W/"' + hashlib.sha1(json.dumps(dados, sort_keys=True, default=str).encode()).hexdigest() + '"'
+
+def _etag_confere(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header against an ETag"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    # Comparação fraca (RFC 9110): o prefixo W/ não conta
+    return etag.removeprefix('W/') in [t.strip().removeprefix('W/') for t in if_none_match.split(',')]
+
+def _invalidar_cache_variaveis():
+    _cache_variaveis["dados"] = None
+    _cache_variaveis["geracao"] += 1
+    _cache_stats["variaveis"]["invalidacoes"] += 1
+
+async def _variaveis_cacheadas() -> tuple:
+    """Return (ordered variables, etag), hitting Supabase only on a cache miss"""
+    if _cache_variaveis["dados"] is not None and time.monotonic() < _cache_variaveis["expira_em"]:
+        _cache_stats["variaveis"]["hits"] += 1
+        return _cache_variaveis["dados"], _cache_variaveis["etag"]
+    
+    _cache_stats["variaveis"]["misses"] += 1
+    geracao = _cache_variaveis["geracao"]
+    response = await _executar(supabase.table("variaveis").select("*").order("tipo").order("ordem", nullsfirst=False).order("nome"))
+    dados, etag = response.data, _gerar_etag(response.data)
+    _cache_variaveis["boa"] = dados
+    
+    # Uma escrita durante a consulta invalida o resultado: não guarda
+    if geracao == _cache_variaveis["geracao"]:
+        _cache_variaveis.update({"dados": dados, "etag": etag, "expira_em": time.monotonic() + VARIAVEIS_CACHE_TTL})
+    return dados, etag
+
 @api_router.get("/variaveis", response_model=List[Variable])
-async def listar_variaveis():
+async def listar_variaveis(request: Request, response: Response):
     """List all variables (turnos, formatos, cores)"""
     try:
-        response = supabase.table("variaveis").select("*").order("tipo").order("ordem", nullsfirst=False).order("nome").execute()
-        return response.data
+        dados, etag = await _variaveis_cacheadas()
+        if _etag_confere(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+        
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "no-cache"
+        return dados
     except Exception as e:
+        if _cache_variaveis["boa"] is not None and _falha_transitoria(e):
+            return _resposta_desatualizada(_cache_variaveis["boa"], "variaveis", e)
         logger.error(f"Error fetching variables: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise _erro_http(e)
 
 @api_router.post("/variaveis", response_model=Variable, status_code=201)
 async def criar_variavel(variable_data: VariableCreate):
     """Create a new variable"""
     try:
         # Check if variable already exists
-        existing = supabase.table("variaveis").select("*").eq("tipo", variable_data.tipo).eq("nome", variable_data.nome).execute()
+        existing = await _executar(supabase.table("variaveis").select("*").eq("tipo", variable_data.tipo).eq("nome", variable_data.nome))
         if existing.data:
             raise HTTPException(status_code=400, detail="Variável já existe")
         
@@ -199,35 +855,60 @@ async def criar_variavel(variable_data: VariableCreate):
         }
         
         # Insert into Supabase
-        result = supabase.table("variaveis").insert(variavel).execute()
+        result = await _executar(supabase.table("variaveis").insert(variavel))
+        _invalidar_cache_variaveis()
         return variavel
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error creating variable: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise _erro_http(e)
 
 @api_router.delete("/variaveis/{variavel_id}")
 async def deletar_variavel(variavel_id: str):
     """Delete a variable by ID"""
     try:
-        result = supabase.table("variaveis").delete().eq("id", variavel_id).execute()
+        result = await _executar(supabase.table("variaveis").delete().eq("id", variavel_id))
+        _invalidar_cache_variaveis()
         return {"success": True}
     except Exception as e:
         logger.error(f"Error deleting variable: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise _erro_http(e)
+
+# Reordenação em lote (função reordenar_variaveis, ver variaveis_schema.sql)
+_rpc_reordenar_disponivel = True
 
 @api_router.put("/variaveis/ordem")
 async def atualizar_ordem_variaveis(data: dict):
-    """Update the order of variables"""
+    """Update the order of variables in a single call and return the new ordered list"""
+    global _rpc_reordenar_disponivel
     try:
-        variaveis = data.get("variaveis", [])
+        variaveis = [{"id": item["id"], "ordem": item["ordem"]} for item in data.get("variaveis", [])]
+        
+        if _rpc_reordenar_disponivel:
+            try:
+                response = await _executar(supabase.rpc("reordenar_variaveis", {"p_itens": variaveis}))
+                _invalidar_cache_variaveis()
+                return {"success": True, "variaveis": response.data}
+            except APIError as e:
+                if e.code not in ('PGRST202', '42883'):
+                    raise
+                logger.warning("reordenar_variaveis RPC not installed, falling back to one update per variable")
+                _rpc_reordenar_disponivel = False
+        
         for item in variaveis:
-            supabase.table("variaveis").update({"ordem": item["ordem"]}).eq("id", item["id"]).execute()
-        return {"success": True}
+            await _executar(supabase.table("variaveis").update({"ordem": item["ordem"]}).eq("id", item["id"]))
+        _invalidar_cache_variaveis()
+        response = await _executar(supabase.table("variaveis").select("*").order("tipo").order("ordem", nullsfirst=False).order("nome"))
+        return {"success": True, "variaveis": response.data}
     except Exception as e:
         logger.error(f"Error updating variables order: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise _erro_http(e)
+
+@api_router.get("/cache/stats")
+async def estatisticas_cache():
+    """Hit/miss counters of the in-process caches"""
+    return _cache_stats
 
 # ==================== LANCAMENTOS ENDPOINTS ====================
 
@@ -247,96 +928,1043 @@ class LancamentoCreate(BaseModel):
     referencia_lote: Optional[str] = ""
     itens: List[ItemLancamento] = []
 
+# Com Idempotency-Key o id do lançamento é derivado da chave: a repetição de
+# uma requisição cai na chave primária e não cria outra linha
+_IDEMPOTENCIA_NS = uuid.uuid5(uuid.NAMESPACE_URL, "lancamentos/idempotency-key")
+
+def _id_lancamento(idempotency_key: Optional[str], indice: Optional[int] = None) -> str:
+    if not idempotency_key:
+        return str(uuid.uuid4())
+    chave = idempotency_key if indice is None else f"{idempotency_key}:{indice}"
+    return str(uuid.uuid5(_IDEMPOTENCIA_NS, chave))
+
+def _documento_lancamento(lancamento: LancamentoCreate, lancamento_id: str) -> dict:
+    """Build the full lancamentos row, totals included, for a single insert"""
+    itens_list = [
+        {
+            "formato": item.formato,
+            "cor": item.cor,
+            "pacote_kg": item.pacote_kg,
+            "producao_kg": item.producao_kg
+        } for item in lancamento.itens
+    ]
+    
+    return {
+        "id": lancamento_id,
+        "data": lancamento.data,
+        "turno": lancamento.turno,
+        "hora": lancamento.hora,
+        "orelha_kg": lancamento.orelha_kg,
+        "aparas_kg": lancamento.aparas_kg,
+        "referencia_producao": lancamento.referencia_producao,
+        "referencia_lote": lancamento.referencia_lote,
+        "itens": itens_list,
+        "producao_total": sum(item.producao_kg for item in lancamento.itens),
+        "perdas_total": lancamento.orelha_kg + lancamento.aparas_kg
+    }
+
+def _mesmo_conteudo(gravado: dict, documento: dict) -> bool:
+    """Whether a stored row holds the entry a document describes"""
+    return all(
+        str(gravado.get(campo))[:10] == str(valor)[:10] if campo == "data" else gravado.get(campo) == valor
+        for campo, valor in documento.items()
+    )
+
+async def _repeticoes_divergentes(docs: list) -> set:
+    """Ids of documents that were not inserted because their id is stored with other content.
+
+    With an Idempotency-Key that means the key was reused for another body.
+    """
+    if not docs:
+        return set()
+    gravados = await _lancamentos.obter_varios([doc["id"] for doc in docs])
+    return {doc["id"] for doc in docs if doc["id"] in gravados and not _mesmo_conteudo(gravados[doc["id"]], doc)}
+
+# Mesmo id (da Idempotency-Key ou do arquivo importado) com outro conteúdo:
+# a repetição não é a mesma requisição e não pode ser respondida como tal
+IDEMPOTENCIA_DIVERGENTE = "Já existe um lançamento com este id e outro conteúdo (Idempotency-Key reutilizada)"
+
 @api_router.post("/lancamentos")
-async def criar_lancamento(lancamento: LancamentoCreate):
-    """Create a new production entry"""
+async def criar_lancamento(
+    lancamento: LancamentoCreate,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None)
+):
+    """Create a new production entry.
+
+    With an ``Idempotency-Key`` header a retried request returns the id of
+    the entry created by the first attempt instead of creating a second one;
+    reusing the key with a different body gets 422.
+    """
     try:
-        lancamento_id = str(uuid.uuid4())
-        
-        itens_list = [
-            {
-                "formato": item.formato,
-                "cor": item.cor,
-                "pacote_kg": item.pacote_kg,
-                "producao_kg": item.producao_kg
-            } for item in lancamento.itens
-        ]
-        
-        producao_total = sum(item.producao_kg for item in lancamento.itens)
-        perdas_total = lancamento.orelha_kg + lancamento.aparas_kg
-        
-        lancamento_doc = {
-            "id": lancamento_id,
-            "data": lancamento.data,
-            "turno": lancamento.turno,
-            "hora": lancamento.hora,
-            "orelha_kg": lancamento.orelha_kg,
-            "aparas_kg": lancamento.aparas_kg,
-            "referencia_producao": lancamento.referencia_producao,
-            "referencia_lote": lancamento.referencia_lote,
-            "itens": itens_list,
-            "producao_total": producao_total,
-            "perdas_total": perdas_total
-        }
-        
-        supabase.table("lancamentos").insert(lancamento_doc).execute()
+        lancamento_id = _id_lancamento(idempotency_key)
+        documento = _documento_lancamento(lancamento, lancamento_id)
+        inseridos = await _lancamentos.inserir([documento])
+        if lancamento_id in inseridos:
+            await _invalidar_relatorios(lancamento.data)
+            _publicar_lancamento("criado", documento, lancamento.data)
+        elif await _repeticoes_divergentes([documento]):
+            raise HTTPException(status_code=422, detail=IDEMPOTENCIA_DIVERGENTE)
+        else:
+            response.headers["Idempotent-Replayed"] = "true"
         return {"success": True, "id": lancamento_id}
     except Exception as e:
         logger.error(f"Error creating lancamento: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise _erro_http(e)
 
-@api_router.get("/lancamentos")
-async def listar_lancamentos(data_inicio: Optional[str] = None, data_fim: Optional[str] = None, referencia_producao: Optional[str] = None):
-    """List all production entries"""
+LANCAMENTOS_BULK_MAX = int(os.environ.get('LANCAMENTOS_BULK_MAX', '1000'))
+LANCAMENTOS_BULK_LOTE = int(os.environ.get('LANCAMENTOS_BULK_LOTE', '200'))
+
+class LancamentosBulk(BaseModel):
+    lancamentos: List[dict]
+
+async def _gravar_lote(docs: list) -> tuple:
+    """Insert a chunk in one multi-row write, retrying row by row if it fails.
+
+    Returns (ids inserted, {id: error}) and evicts the affected reports. A
+    row whose id is already stored with other content is an error, not a
+    duplicate.
+    """
+    erros = {}
     try:
-        query = supabase.table("lancamentos").select("*")
+        inseridos = await _lancamentos.inserir(docs)
+    except Exception as e:
+        logger.warning(f"Bulk insert chunk failed, retrying row by row: {e}")
+        inseridos = set()
+        for doc in docs:
+            try:
+                inseridos |= await _lancamentos.inserir([doc])
+            except Exception as e_linha:
+                erros[doc["id"]] = str(e_linha)
+    repetidos = [doc for doc in docs if doc["id"] not in inseridos and doc["id"] not in erros]
+    for lancamento_id in await _repeticoes_divergentes(repetidos):
+        erros[lancamento_id] = IDEMPOTENCIA_DIVERGENTE
+    await _invalidar_relatorios(*[doc["data"] for doc in docs if doc["id"] in inseridos])
+    if inseridos:
+        _publicar_lancamento("recarregar")
+    return inseridos, erros
+
+@api_router.post("/lancamentos/bulk")
+async def criar_lancamentos_bulk(payload: LancamentosBulk, idempotency_key: Optional[str] = Header(None)):
+    """Validate and insert many production entries, returning one result per row.
+
+    Valid rows are written in multi-row inserts of ``LANCAMENTOS_BULK_LOTE``;
+    a failing chunk is retried row by row so one bad row does not reject its
+    neighbours. With ``Idempotency-Key`` each row id is derived from the key
+    and the row index, so resending the batch reports rows as ``duplicado``
+    (or ``erro`` when a row differs from the one stored).
+    """
+    if len(payload.lancamentos) > LANCAMENTOS_BULK_MAX:
+        raise HTTPException(status_code=413, detail=f"Máximo de {LANCAMENTOS_BULK_MAX} lançamentos por requisição")
+    
+    resultados = [None] * len(payload.lancamentos)
+    validos = []
+    for indice, bruto in enumerate(payload.lancamentos):
+        try:
+            lancamento = LancamentoCreate.model_validate(bruto)
+            date.fromisoformat(lancamento.data)
+        except (ValidationError, ValueError) as e:
+            resultados[indice] = {"indice": indice, "status": "erro", "erro": str(e)}
+            continue
+        validos.append((indice, _documento_lancamento(lancamento, _id_lancamento(idempotency_key, indice))))
+    
+    try:
+        for inicio in range(0, len(validos), LANCAMENTOS_BULK_LOTE):
+            lote = validos[inicio:inicio + LANCAMENTOS_BULK_LOTE]
+            inseridos, erros = await _gravar_lote([doc for _, doc in lote])
+            for indice, doc in lote:
+                if doc["id"] in erros:
+                    resultados[indice] = {"indice": indice, "status": "erro", "erro": erros[doc["id"]]}
+                else:
+                    status = "criado" if doc["id"] in inseridos else "duplicado"
+                    resultados[indice] = {"indice": indice, "status": status, "id": doc["id"]}
         
+        return {
+            "total": len(resultados),
+            "criados": sum(r["status"] == "criado" for r in resultados),
+            "duplicados": sum(r["status"] == "duplicado" for r in resultados),
+            "erros": sum(r["status"] == "erro" for r in resultados),
+            "resultados": resultados
+        }
+    except Exception as e:
+        logger.error(f"Error creating lancamentos in bulk: {e}")
+        raise _erro_http(e)
+
+# Colunas que podem ser pedidas em ?fields= na listagem
+LANCAMENTO_CAMPOS = (
+    "id", "data", "turno", "hora", "orelha_kg", "aparas_kg", "referencia_producao",
+    "referencia_lote", "itens", "producao_total", "perdas_total", "percentual_perdas"
+)
+
+def _codificar_cursor(lanc: dict) -> str:
+    """Encode the (data, hora, id) keyset position of a row as an opaque cursor"""
+    bruto = json.dumps([lanc['data'], lanc['hora'], lanc['id']])
+    return base64.urlsafe_b64encode(bruto.encode()).decode().rstrip('=')
+
+def _decodificar_cursor(cursor: str) -> tuple:
+    """Decode a cursor into (data, hora, id); hora is None for rows without one"""
+    try:
+        bruto = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        data, hora, lancamento_id = json.loads(bruto)
+        if not isinstance(lancamento_id, str) or not (hora is None or isinstance(hora, str)):
+            raise ValueError
+        valores = (date.fromisoformat(data).isoformat(), hora, lancamento_id)
+    except Exception:
+        raise ValueError("Cursor inválido")
+    # Os valores vão entre aspas no filtro or= do PostgREST
+    if any(v is not None and ('"' in v or '\\' in v) for v in valores):
+        raise ValueError("Cursor inválido")
+    return valores
+
+def _colunas_lancamentos(fields: Optional[str]) -> tuple:
+    """Resolve a ?fields= projection into (select columns, requested fields)"""
+    if not fields:
+        return "*", None
+    campos = [c.strip() for c in fields.split(',') if c.strip()]
+    invalidos = [c for c in campos if c not in LANCAMENTO_CAMPOS]
+    if invalidos:
+        raise ValueError(f"Campos inválidos: {', '.join(invalidos)}")
+    # id, data e hora formam o cursor; os totais alimentam percentual_perdas
+    colunas = {"id", "data", "hora"} | set(campos)
+    if "percentual_perdas" in colunas:
+        colunas |= {"producao_total", "perdas_total"}
+        colunas.discard("percentual_perdas")
+    return ",".join(c for c in LANCAMENTO_CAMPOS if c in colunas), campos
+
+def _filtrar_lancamentos(query, data_inicio: Optional[str], data_fim: Optional[str], referencia_producao: Optional[str]):
+    if data_inicio:
+        query = query.gte("data", data_inicio)
+    if data_fim:
+        query = query.lte("data", data_fim)
+    
+    # Trim e busca case-insensitive
+    if referencia_producao:
+        ref_trimmed = referencia_producao.strip()
+        if ref_trimmed:
+            query = query.ilike("referencia_producao", f"%{ref_trimmed}%")
+    return query
+
+def _apos_cursor(query, cursor: str):
+    """Restrict a (data, hora, id) DESC ordered query to rows after the cursor"""
+    data, hora, lancamento_id = _decodificar_cursor(cursor)
+    if hora is None:
+        # Em DESC os nulos vêm primeiro: depois de uma hora nula vêm as
+        # demais nulas do dia (por id) e então todas as horas preenchidas
+        return query.or_(
+            f'data.lt."{data}",'
+            f'and(data.eq."{data}",hora.not.is.null),'
+            f'and(data.eq."{data}",hora.is.null,id.lt."{lancamento_id}")'
+        )
+    return query.or_(
+        f'data.lt."{data}",'
+        f'and(data.eq."{data}",hora.lt."{hora}"),'
+        f'and(data.eq."{data}",hora.eq."{hora}",id.lt."{lancamento_id}")'
+    )
+
+def _com_percentual_perdas(lanc: dict) -> dict:
+    producao_total = float(lanc.get('producao_total') or 0)
+    perdas_total = float(lanc.get('perdas_total') or 0)
+    percentual_perdas = (perdas_total / producao_total * 100) if producao_total > 0 else 0
+    return {**lanc, 'percentual_perdas': round(percentual_perdas, 2)}
+
+# Acesso aos lançamentos nas consultas quentes (listagem, busca por id,
+# inserção e agregação de relatórios). DB_DRIVER=supabase (padrão) passa pelo
+# PostgREST via supabase-py; DB_DRIVER=postgres fala direto com o Postgres do
+# Supabase (DATABASE_URL) por um pool asyncpg. As demais rotas continuam no
+# cliente supabase.
+DB_DRIVER = os.environ.get('DB_DRIVER', 'supabase')
+DATABASE_URL = os.environ.get('DATABASE_URL')
+DATABASE_POOL_MIN = int(os.environ.get('DATABASE_POOL_MIN', '1'))
+DATABASE_POOL_MAX = int(os.environ.get('DATABASE_POOL_MAX', str(SUPABASE_MAX_CONCURRENCY)))
+# O pooler do Supabase em modo transação (porta 6543) não aceita prepared
+# statements: nesse caso use DATABASE_STATEMENT_CACHE=0 ou a conexão direta (5432)
+DATABASE_STATEMENT_CACHE = int(os.environ.get('DATABASE_STATEMENT_CACHE', '100'))
+
+class _LancamentosSupabase:
+    """Lancamentos data access through supabase-py and PostgREST"""
+
+    async def listar(self, colunas: str, data_inicio: Optional[str], data_fim: Optional[str],
+                     referencia: Optional[str], cursor: Optional[str] = None,
+                     limite: Optional[int] = None, contar: bool = False) -> tuple:
+        if contar:
+            query = supabase.table("lancamentos").select(colunas, count="exact")
+        else:
+            query = supabase.table("lancamentos").select(colunas)
+        query = _filtrar_lancamentos(query, data_inicio, data_fim, referencia)
+        if cursor:
+            query = _apos_cursor(query, cursor)
+        query = query.order("data", desc=True).order("hora", desc=True).order("id", desc=True)
+        if limite:
+            query = query.limit(limite)
+        response = await _executar(query)
+        return response.data or [], response.count
+
+    async def obter(self, lancamento_id: str) -> Optional[dict]:
+        try:
+            response = await _executar(supabase.table("lancamentos").select("*").eq("id", lancamento_id))
+        except APIError as e:
+            # 22P02: um id que nem converte para o tipo da coluna não existe
+            if e.code != '22P02':
+                raise
+            return None
+        return response.data[0] if response.data else None
+
+    async def obter_varios(self, ids: list) -> dict:
+        # Em partes: os ids vão na URL do GET
+        linhas = []
+        for inicio in range(0, len(ids), 100):
+            response = await _executar(supabase.table("lancamentos").select("*").in_("id", ids[inicio:inicio + 100]))
+            linhas += response.data or []
+        return {str(l["id"]): l for l in linhas}
+
+    async def inserir(self, docs: list) -> set:
+        # ignore_duplicates: ids já existentes (Idempotency-Key) não voltam na resposta
+        response = await _executar(
+            supabase.table("lancamentos").upsert(docs, on_conflict="id", ignore_duplicates=True)
+        )
+        return {str(l["id"]) for l in response.data or []}
+
+    async def agregar_relatorio(self, data_inicio: Optional[str], data_fim: Optional[str], referencia: Optional[str]) -> dict:
+        backend = RELATORIO_BACKENDS.get(RELATORIO_BACKEND, _relatorio_via_rollup)
+        return await _em_thread(backend, data_inicio, data_fim, referencia)
+
+    async def fechar(self):
+        pass
+
+
+class _LancamentosPostgres:
+    """Lancamentos data access straight to Postgres through an asyncpg pool.
+
+    Each query is built from a fixed set of clauses, so the SQL text repeats
+    and asyncpg prepares it once per connection and reuses it from its
+    statement cache. Values are converted to what PostgREST would return.
+    """
+
+    def __init__(self, dsn: str):
+        import asyncpg
+        self._asyncpg = asyncpg
+        self._dsn = dsn
+        self._pool = None
+        self._pool_lock = asyncio.Lock()
+
+    async def _conexoes(self):
+        if self._pool is None:
+            async with self._pool_lock:
+                if self._pool is None:
+                    self._pool = await self._asyncpg.create_pool(
+                        self._dsn,
+                        min_size=DATABASE_POOL_MIN,
+                        max_size=DATABASE_POOL_MAX,
+                        statement_cache_size=DATABASE_STATEMENT_CACHE,
+                        command_timeout=SUPABASE_TIMEOUT,
+                        init=self._configurar_conexao
+                    )
+        return self._pool
+
+    @staticmethod
+    async def _configurar_conexao(conn):
+        await conn.set_type_codec('jsonb', encoder=json.dumps, decoder=json.loads, schema='pg_catalog')
+
+    @staticmethod
+    def _linha_json(registro) -> dict:
+        linha = {}
+        for chave, valor in registro.items():
+            if isinstance(valor, Decimal):
+                valor = float(valor)
+            elif isinstance(valor, uuid.UUID):
+                valor = str(valor)
+            elif hasattr(valor, 'isoformat'):
+                # date, time e timestamp no formato ISO, como o PostgREST
+                valor = valor.isoformat()
+            linha[chave] = valor
+        return linha
+
+    async def _buscar(self, sql: str, *args, tabela: str = "lancamentos", operacao: str = "select") -> list:
+        """Run a query through the shared circuit breaker, retrying reads like _executar_medido"""
+        tentativas = _tentativas(tabela, operacao)
+        for tentativa in range(tentativas):
+            _disjuntor.liberar()
+            try:
+                pool = await self._conexoes()
+                with _medir_consulta(tabela, operacao):
+                    registros = await pool.fetch(sql, *args)
+            except Exception as e:
+                if not _falha_transitoria(e):
+                    _disjuntor.sucesso()  # o Postgres respondeu; o erro é da requisição
+                    raise
+                _disjuntor.falha()
+                if tentativa + 1 >= tentativas or _disjuntor.aberto:
+                    raise
+                _metrica_tentativas.inc(1, tabela, operacao)
+                await asyncio.sleep(_pausa_tentativa(tentativa))
+            else:
+                _disjuntor.sucesso()
+                return [self._linha_json(r) for r in registros]
+
+    @staticmethod
+    def _where(data_inicio: Optional[str], data_fim: Optional[str], referencia: Optional[str],
+               cursor: Optional[str] = None) -> tuple:
+        condicoes, args = [], []
         if data_inicio:
-            query = query.gte("data", data_inicio)
+            args.append(date.fromisoformat(data_inicio))
+            condicoes.append(f"data >= ${len(args)}")
         if data_fim:
-            query = query.lte("data", data_fim)
+            args.append(date.fromisoformat(data_fim))
+            condicoes.append(f"data <= ${len(args)}")
+        referencia = referencia.strip() if referencia else ""
+        if referencia:
+            args.append(referencia)
+            condicoes.append(f"referencia_producao ILIKE '%' || ${len(args)} || '%'")
+        if cursor:
+            data, hora, lancamento_id = _decodificar_cursor(cursor)
+            # jsonb_populate_record converte o cursor para os tipos das colunas
+            args.append({"data": data, "hora": hora, "id": lancamento_id})
+            posicao = f"FROM jsonb_populate_record(NULL::lancamentos, ${len(args)}::jsonb) c"
+            if hora is None:
+                # Mesma ordem do ORDER BY ... DESC, que põe os nulos primeiro
+                condicoes.append(
+                    f"(data < (SELECT c.data {posicao}) OR (data = (SELECT c.data {posicao}) "
+                    f"AND (hora IS NOT NULL OR id < (SELECT c.id {posicao}))))"
+                )
+            else:
+                condicoes.append(f"(data, hora, id) < (SELECT c.data, c.hora, c.id {posicao})")
+        return (" WHERE " + " AND ".join(condicoes)) if condicoes else "", args
+
+    async def listar(self, colunas: str, data_inicio: Optional[str], data_fim: Optional[str],
+                     referencia: Optional[str], cursor: Optional[str] = None,
+                     limite: Optional[int] = None, contar: bool = False) -> tuple:
+        if colunas != "*" and any(c not in LANCAMENTO_CAMPOS for c in colunas.split(',')):
+            raise ValueError(f"Campos inválidos: {colunas}")
+        where, args = self._where(data_inicio, data_fim, referencia, cursor)
+        sql = f"SELECT {colunas} FROM lancamentos{where} ORDER BY data DESC, hora DESC, id DESC"
+        if limite:
+            sql += f" LIMIT ${len(args) + 1}"
+        consulta = self._buscar(sql, *args, *([limite] if limite else []))
+        if not contar:
+            return await consulta, None
+
+        where_total, args_total = self._where(data_inicio, data_fim, referencia)
+        linhas, total = await asyncio.gather(consulta, self._buscar(
+            f"SELECT count(*) AS total FROM lancamentos{where_total}", *args_total, operacao="count"
+        ))
+        return linhas, total[0]['total']
+
+    async def obter(self, lancamento_id: str) -> Optional[dict]:
+        try:
+            linhas = await self._buscar(
+                "SELECT * FROM lancamentos WHERE id = "
+                "(SELECT c.id FROM jsonb_populate_record(NULL::lancamentos, $1::jsonb) c)",
+                {"id": lancamento_id}
+            )
+        except Exception as e:
+            # 22P02: um id que nem converte para o tipo da coluna não existe
+            if getattr(e, 'sqlstate', None) != '22P02':
+                raise
+            return None
+        return linhas[0] if linhas else None
+
+    async def obter_varios(self, ids: list) -> dict:
+        linhas = await self._buscar(
+            "SELECT * FROM lancamentos WHERE id IN "
+            "(SELECT c.id FROM jsonb_populate_recordset(NULL::lancamentos, $1::jsonb) c)",
+            [{"id": lancamento_id} for lancamento_id in ids]
+        )
+        return {l["id"]: l for l in linhas}
+
+    async def inserir(self, docs: list) -> set:
+        colunas = ", ".join(docs[0])
+        registros = await self._buscar(
+            f"INSERT INTO lancamentos ({colunas}) "
+            f"SELECT {colunas} FROM jsonb_populate_recordset(NULL::lancamentos, $1::jsonb) "
+            f"ON CONFLICT (id) DO NOTHING RETURNING id::text",
+            docs, operacao="insert"
+        )
+        return {r["id"] for r in registros}
+
+    async def agregar_relatorio(self, data_inicio: Optional[str], data_fim: Optional[str], referencia: Optional[str]) -> dict:
+        global _rpc_relatorio_disponivel
+        if not (data_inicio and data_fim):
+            data_inicio = data_fim = None
+
+        if RELATORIO_BACKEND != "python" and _rpc_relatorio_disponivel:
+            try:
+                linhas = await self._buscar(
+                    "SELECT * FROM relatorio_agregado($1::date, $2::date, $3::text)",
+                    date.fromisoformat(data_inicio) if data_inicio else None,
+                    date.fromisoformat(data_fim) if data_fim else None,
+                    referencia or None,
+                    tabela="rpc/relatorio_agregado", operacao="rpc"
+                )
+                return _agregado_de_linhas_rpc(linhas)
+            except Exception as e:
+                if getattr(e, 'sqlstate', None) != '42883':
+                    raise
+                logger.warning("relatorio_agregado function not installed, falling back to Python aggregation")
+                _rpc_relatorio_disponivel = False
+
+        where, args = self._where(data_inicio, data_fim, referencia)
+        linhas = await self._buscar(
+            f"SELECT data, referencia_producao, producao_total, perdas_total, itens FROM lancamentos{where}", *args
+        )
+        return await anyio.to_thread.run_sync(_agregar_lancamentos, linhas)
+
+    async def fechar(self):
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+
+def _criar_repositorio_lancamentos():
+    if DB_DRIVER == "postgres":
+        if not DATABASE_URL:
+            logging.getLogger(__name__).warning("DB_DRIVER=postgres without DATABASE_URL, using supabase driver")
+        else:
+            try:
+                return _LancamentosPostgres(DATABASE_URL)
+            except ImportError:
+                logging.getLogger(__name__).warning("asyncpg package not installed, using supabase driver")
+    return _LancamentosSupabase()
+
+
+_lancamentos = _criar_repositorio_lancamentos()
+
+@app.on_event("shutdown")
+async def fechar_conexoes():
+    await _lancamentos.fechar()
+
+@api_router.get("/lancamentos")
+@_perfilavel
+async def listar_lancamentos(
+    request: Request,
+    data_inicio: Optional[str] = None,
+    data_fim: Optional[str] = None,
+    referencia_producao: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """List production entries, newest first.
+
+    Without ``limit`` the whole filtered history is returned. With ``limit``
+    the list is keyset-paginated on (data, hora, id): the next page is
+    requested with ``cursor`` set to the ``X-Next-Cursor`` header, and the
+    first page also carries the filtered total in ``X-Total-Count``.
+    The rows are already JSON-ready, so the response is built directly
+    instead of going through FastAPI's jsonable_encoder.
+    """
+    try:
+        colunas, campos = _colunas_lancamentos(fields)
+        paginado = limit is not None or cursor is not None
+        tamanho_pagina = limit or 100
         
-        # Trim e busca case-insensitive
-        if referencia_producao:
-            ref_trimmed = referencia_producao.strip()
-            if ref_trimmed:
-                query = query.ilike("referencia_producao", f"%{ref_trimmed}%")
-            
-        response = query.order("data", desc=True).order("hora", desc=True).execute()
-        lancamentos = response.data
+        # Uma linha a mais indica se existe próxima página
+        lancamentos, total = await _lancamentos.listar(
+            colunas, data_inicio, data_fim, referencia_producao, cursor,
+            limite=tamanho_pagina + 1 if paginado else None,
+            contar=paginado and not cursor
+        )
+        
+        headers = {}
+        if paginado:
+            if total is not None:
+                headers["X-Total-Count"] = str(total)
+            if len(lancamentos) > tamanho_pagina:
+                lancamentos = lancamentos[:tamanho_pagina]
+                headers["X-Next-Cursor"] = _codificar_cursor(lancamentos[-1])
+        
+        if lancamentos and (campos is None or "percentual_perdas" in campos):
+            lancamentos = [_com_percentual_perdas(lanc) for lanc in lancamentos]
+        return RespostaJSON(lancamentos, headers=headers)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error listing lancamentos: {e}")
+        raise _erro_http(e)
+
+# Colunas do export (uma linha por item do lançamento)
+EXPORT_COLUNAS = (
+    "id", "data", "hora", "turno", "referencia_producao", "referencia_lote", "orelha_kg", "aparas_kg",
+    "producao_total", "perdas_total", "formato", "cor", "pacote_kg", "producao_kg"
+)
+EXPORT_FORMATOS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx"),
+}
+EXPORT_LOTE = int(os.environ.get('EXPORT_LOTE', '500'))
+
+async def _linhas_export(data_inicio: Optional[str], data_fim: Optional[str], referencia_producao: Optional[str]):
+    """Yield one flat row per item, paging through lancamentos by keyset.
+
+    Each page is fetched with _executar, under the same thread limit as
+    every other Supabase call.
+    """
+    cursor = None
+    while True:
+        query = _filtrar_lancamentos(supabase.table("lancamentos").select("*"), data_inicio, data_fim, referencia_producao)
+        if cursor:
+            query = _apos_cursor(query, cursor)
+        lote = (await _executar(query.order("data", desc=True).order("hora", desc=True).order("id", desc=True).limit(EXPORT_LOTE))).data or []
         
-        if not lancamentos:
-            return []
+        for lanc in lote:
+            base = {c: lanc.get(c) for c in EXPORT_COLUNAS[:10]}
+            itens = lanc.get('itens') if isinstance(lanc.get('itens'), list) else []
+            if not itens:
+                yield {**base, "formato": None, "cor": None, "pacote_kg": None, "producao_kg": None}
+            for item in itens:
+                yield {
+                    **base,
+                    "formato": item.get('formato'),
+                    "cor": item.get('cor'),
+                    "pacote_kg": item.get('pacote_kg'),
+                    "producao_kg": item.get('producao_kg')
+                }
         
-        result = []
-        for lanc in lancamentos:
-            producao_total = float(lanc.get('producao_total') or 0)
-            perdas_total = float(lanc.get('perdas_total') or 0)
-            percentual_perdas = (perdas_total / producao_total * 100) if producao_total > 0 else 0
-            
-            result.append({
-                **lanc,
-                'percentual_perdas': round(percentual_perdas, 2)
+        if len(lote) < EXPORT_LOTE:
+            break
+        cursor = _codificar_cursor(lote[-1])
+
+async def _serializar_export(linhas, formato: str):
+    """Encode export rows as a stream of bytes chunks"""
+    if formato == "ndjson":
+        async for linha in linhas:
+            yield (json.dumps(linha, ensure_ascii=False) + "\n").encode("utf-8")
+        return
+    
+    if formato == "csv":
+        # ';' e BOM para o Excel em pt-BR abrir direto
+        buffer = io.StringIO()
+        escritor = csv.writer(buffer, delimiter=';')
+        buffer.write("\ufeff")
+        escritor.writerow(EXPORT_COLUNAS)
+        n = 0
+        async for linha in linhas:
+            escritor.writerow(["" if linha[c] is None else linha[c] for c in EXPORT_COLUNAS])
+            n += 1
+            if n % EXPORT_LOTE == 0:
+                yield buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue().encode("utf-8")
+        return
+    
+    # xlsx: o modo write_only grava as linhas em disco em vez de manter a planilha em memória
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    planilha = workbook.create_sheet("Lançamentos")
+    planilha.append(list(EXPORT_COLUNAS))
+    async for linha in linhas:
+        planilha.append([linha[c] for c in EXPORT_COLUNAS])
+    with tempfile.TemporaryFile() as arquivo:
+        # Compactar a planilha é trabalho de CPU e disco: fora do event loop
+        await anyio.to_thread.run_sync(workbook.save, arquivo)
+        arquivo.seek(0)
+        while True:
+            bloco = arquivo.read(64 * 1024)
+            if not bloco:
+                break
+            yield bloco
+
+@api_router.get("/lancamentos/export")
+async def exportar_lancamentos(
+    formato: str = "csv",
+    data_inicio: Optional[str] = None,
+    data_fim: Optional[str] = None,
+    referencia_producao: Optional[str] = None
+):
+    """Stream the filtered history as CSV, NDJSON or XLSX, one row per item"""
+    if formato not in EXPORT_FORMATOS:
+        raise HTTPException(status_code=400, detail=f"Formato inválido: {formato}")
+    if formato == "xlsx":
+        try:
+            import openpyxl  # noqa: F401
+        except ImportError:
+            raise HTTPException(status_code=501, detail="Exportação xlsx requer o pacote openpyxl")
+    
+    media_type, extensao = EXPORT_FORMATOS[formato]
+    nome_arquivo = f"lancamentos_{datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')}.{extensao}"
+    linhas = _linhas_export(data_inicio, data_fim, referencia_producao)
+    return StreamingResponse(
+        _serializar_export(linhas, formato),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{nome_arquivo}"'}
+    )
+
+# Importação de histórico (POST /api/lancamentos/import): uma linha por item,
+# no layout do export; linhas seguidas do mesmo lançamento formam um
+# lançamento com vários itens
+IMPORT_LOTE = int(os.environ.get('IMPORT_LOTE', '500'))
+IMPORT_MAX_ERROS = int(os.environ.get('IMPORT_MAX_ERROS', '1000'))
+
+# Cabeçalhos aceitos para cada campo (comparados sem acento e sem caixa)
+IMPORT_CABECALHOS = {
+    "id": ("id",),
+    "data": ("data", "dia"),
+    "turno": ("turno",),
+    "hora": ("hora", "horário"),
+    "orelha_kg": ("orelha_kg", "orelha", "orelha (kg)"),
+    "aparas_kg": ("aparas_kg", "aparas", "aparas (kg)"),
+    "referencia_producao": ("referencia_producao", "referência", "referência de produção", "op"),
+    "referencia_lote": ("referencia_lote", "lote", "referência do lote"),
+    "formato": ("formato",),
+    "cor": ("cor",),
+    "pacote_kg": ("pacote_kg", "pacote", "pacote (kg)"),
+    "producao_kg": ("producao_kg", "produção", "produção (kg)"),
+}
+IMPORT_OBRIGATORIOS = ("data", "turno", "hora")
+
+def _normalizar_cabecalho(nome) -> str:
+    texto = unicodedata.normalize("NFKD", str(nome or "")).encode("ascii", "ignore").decode()
+    return " ".join(texto.lower().replace("_", " ").split())
+
+def _colunas_import(cabecalho: list, mapeamento: dict) -> dict:
+    """Map lancamento fields to column positions in the file header"""
+    apelidos = {_normalizar_cabecalho(a): campo for campo, nomes in IMPORT_CABECALHOS.items() for a in nomes}
+    apelidos.update({_normalizar_cabecalho(coluna): campo for coluna, campo in mapeamento.items()})
+    colunas = {}
+    for posicao, nome in enumerate(cabecalho):
+        campo = apelidos.get(_normalizar_cabecalho(nome))
+        if campo in IMPORT_CABECALHOS and campo not in colunas:
+            colunas[campo] = posicao
+    faltando = [c for c in IMPORT_OBRIGATORIOS if c not in colunas]
+    if faltando:
+        raise ValueError(f"Colunas obrigatórias ausentes: {', '.join(faltando)}")
+    return colunas
+
+def _abrir_import(arquivo, formato: str, mapeamento: dict) -> tuple:
+    """Read the header and return (column map, iterator of (line number, raw row))"""
+    if formato == "xlsx":
+        from openpyxl import load_workbook
+        # read_only lê as linhas sob demanda, sem carregar a planilha inteira
+        planilha = load_workbook(arquivo, read_only=True, data_only=True).active
+        linhas = planilha.iter_rows(values_only=True)
+    else:
+        texto = io.TextIOWrapper(arquivo, encoding="utf-8-sig", newline="")
+        primeira = texto.readline()
+        delimitador = max((";", ",", "\t"), key=primeira.count)
+        linhas = csv.reader(itertools.chain([primeira], texto), delimiter=delimitador)
+    
+    cabecalho = next(linhas, None)
+    if cabecalho is None:
+        raise ValueError("Arquivo vazio")
+    colunas = _colunas_import(list(cabecalho), mapeamento)
+    
+    def registros():
+        for numero, linha in enumerate(linhas, 2):
+            if any(v not in (None, "") for v in linha):
+                yield numero, {campo: linha[p] if p < len(linha) else None for campo, p in colunas.items()}
+    return colunas, registros()
+
+def _numero_import(valor) -> float:
+    if valor is None or valor == "":
+        return 0.0
+    if isinstance(valor, (int, float)):
+        return float(valor)
+    texto = str(valor).strip()
+    if "," in texto:
+        # 1.234,56 (pt-BR)
+        texto = texto.replace(".", "").replace(",", ".")
+    try:
+        return float(texto)
+    except ValueError:
+        raise ValueError(f"Número inválido: {valor}")
+
+def _data_import(valor) -> str:
+    if isinstance(valor, datetime):
+        return valor.date().isoformat()
+    if isinstance(valor, date):
+        return valor.isoformat()
+    texto = str(valor or "").strip()
+    try:
+        return date.fromisoformat(texto[:10]).isoformat()
+    except ValueError:
+        return datetime.strptime(texto, "%d/%m/%Y").date().isoformat()
+
+def _hora_import(valor) -> str:
+    if hasattr(valor, "strftime"):
+        return valor.strftime("%H:%M")
+    partes = str(valor or "").strip().split(":")
+    if len(partes) not in (2, 3) or not all(p.isdigit() for p in partes):
+        raise ValueError(f"Hora inválida: {valor}")
+    return f"{int(partes[0]):02d}:{int(partes[1]):02d}"
+
+def _texto_import(valor) -> str:
+    return "" if valor is None else str(valor).strip()
+
+def _variaveis_por_tipo(variaveis: list) -> dict:
+    """Index registered variables as {tipo: {casefolded nome: nome}}"""
+    conhecidas = {}
+    for v in variaveis:
+        conhecidas.setdefault(v["tipo"], {})[str(v["nome"]).strip().casefold()] = v["nome"]
+    return conhecidas
+
+def _conferir_variavel(conhecidas: dict, tipo: str, valor: str) -> str:
+    nomes = conhecidas.get(tipo)
+    # Sem nenhuma variável do tipo cadastrada não há o que conferir
+    if not nomes:
+        return valor
+    nome = nomes.get(valor.casefold())
+    if nome is None:
+        raise ValueError(f"{tipo} não cadastrado: {valor}")
+    return nome
+
+def _lancamentos_import(registros, conhecidas: dict, idempotency_key: Optional[str]):
+    """Group item rows into lancamentos and validate them.
+
+    Yields (first line number, document) for valid entries and (first line
+    number, error message) for invalid ones; only the entry being assembled
+    stays in memory.
+    """
+    def montar(numero, campos, itens, erros, indice):
+        if erros:
+            return numero, "; ".join(erros)
+        try:
+            turno = _conferir_variavel(conhecidas, "turno", _texto_import(campos.get("turno")))
+            for item in itens:
+                item["formato"] = _conferir_variavel(conhecidas, "formato", item["formato"])
+                item["cor"] = _conferir_variavel(conhecidas, "cor", item["cor"])
+            lancamento = LancamentoCreate.model_validate({
+                "data": _data_import(campos.get("data")),
+                "turno": turno,
+                "hora": _hora_import(campos.get("hora")),
+                "orelha_kg": _numero_import(campos.get("orelha_kg")),
+                "aparas_kg": _numero_import(campos.get("aparas_kg")),
+                "referencia_producao": _texto_import(campos.get("referencia_producao")),
+                "referencia_lote": _texto_import(campos.get("referencia_lote")),
+                "itens": itens
             })
+            # O id do export é mantido: reimportar o mesmo arquivo não duplica
+            lancamento_id = str(uuid.UUID(_texto_import(campos["id"]))) if _texto_import(campos.get("id")) else _id_lancamento(idempotency_key, indice)
+        except (ValidationError, ValueError, TypeError) as e:
+            return numero, str(e)
+        return numero, _documento_lancamento(lancamento, lancamento_id)
+    
+    chave_atual, atual, indice = None, None, 0
+    for numero, campos in registros:
+        chave = _texto_import(campos.get("id")) or tuple(
+            _texto_import(campos.get(c)) for c in ("data", "turno", "hora", "referencia_producao", "referencia_lote", "orelha_kg", "aparas_kg")
+        )
+        if chave != chave_atual:
+            if atual is not None:
+                yield montar(*atual, indice)
+                indice += 1
+            chave_atual, atual = chave, (numero, campos, [], [])
+        if _texto_import(campos.get("formato")) or _texto_import(campos.get("cor")):
+            try:
+                atual[2].append({
+                    "formato": _texto_import(campos.get("formato")),
+                    "cor": _texto_import(campos.get("cor")),
+                    "pacote_kg": _numero_import(campos.get("pacote_kg")),
+                    "producao_kg": _numero_import(campos.get("producao_kg"))
+                })
+            except ValueError as e:
+                # Um item inválido rejeita o lançamento inteiro
+                atual[3].append(f"linha {numero}: {e}")
+    if atual is not None:
+        yield montar(*atual, indice)
+
+@api_router.post("/lancamentos/import")
+async def importar_lancamentos(
+    request: Request,
+    formato: Optional[str] = None,
+    dry_run: bool = False,
+    mapeamento: Optional[str] = None,
+    idempotency_key: Optional[str] = Header(None)
+):
+    """Import production history from a CSV or XLSX file sent as the request body.
+
+    The file uses the export layout (one row per item); ``mapeamento`` is an
+    optional JSON object mapping extra header names to field names. Turnos,
+    formatos and cores are checked against the registered variables. Rows
+    are written in chunks of ``IMPORT_LOTE`` and the response streams NDJSON
+    events: ``erro`` per invalid row, ``progresso`` per chunk and a final
+    ``resumo``. With ``dry_run=true`` nothing is written.
+    """
+    try:
+        mapa = json.loads(mapeamento) if mapeamento else {}
+        if not isinstance(mapa, dict):
+            raise ValueError
+    except ValueError:
+        raise HTTPException(status_code=400, detail="mapeamento deve ser um objeto JSON {coluna: campo}")
+    
+    # O corpo vai para um arquivo temporário: memória constante para qualquer tamanho
+    arquivo = tempfile.TemporaryFile()
+    try:
+        async for bloco in request.stream():
+            await anyio.to_thread.run_sync(arquivo.write, bloco)
+        arquivo.seek(0)
+        if formato is None:
+            formato = "xlsx" if arquivo.read(4) == b"PK\x03\x04" else "csv"
+            arquivo.seek(0)
+        if formato not in ("csv", "xlsx"):
+            raise ValueError(f"Formato inválido: {formato}")
+        if formato == "xlsx":
+            try:
+                import openpyxl  # noqa: F401
+            except ImportError:
+                raise HTTPException(status_code=501, detail="Importação xlsx requer o pacote openpyxl")
+        _, registros = await anyio.to_thread.run_sync(_abrir_import, arquivo, formato, mapa)
+        variaveis, _ = await _variaveis_cacheadas()
+    except HTTPException:
+        arquivo.close()
+        raise
+    except Exception as e:
+        arquivo.close()
+        raise HTTPException(status_code=400, detail=f"Não foi possível ler o arquivo: {e}")
+    
+    lancamentos = _lancamentos_import(registros, _variaveis_por_tipo(variaveis), idempotency_key)
+    
+    async def eventos():
+        resumo = {"ultima_linha": 1, "lancamentos": 0, "gravados": 0, "duplicados": 0, "erros": 0}
+        
+        def evento(tipo, **dados):
+            return (json.dumps({"tipo": tipo, **dados}, ensure_ascii=False) + "\n").encode("utf-8")
         
-        return result
+        def erro(numero, mensagem):
+            resumo["erros"] += 1
+            if resumo["erros"] <= IMPORT_MAX_ERROS:
+                return evento("erro", linha=numero, erro=mensagem)
+            return b""
+        
+        try:
+            while True:
+                bloco = await anyio.to_thread.run_sync(lambda: list(itertools.islice(lancamentos, IMPORT_LOTE)))
+                if not bloco:
+                    break
+                lote = []
+                for numero, resultado in bloco:
+                    resumo["ultima_linha"] = numero
+                    if isinstance(resultado, str):
+                        yield erro(numero, resultado)
+                    else:
+                        lote.append((numero, resultado))
+                resumo["lancamentos"] += len(lote)
+                
+                if lote and not dry_run:
+                    inseridos, erros = await _gravar_lote([doc for _, doc in lote])
+                    for numero, doc in lote:
+                        if doc["id"] in erros:
+                            yield erro(numero, erros[doc["id"]])
+                        elif doc["id"] in inseridos:
+                            resumo["gravados"] += 1
+                        else:
+                            resumo["duplicados"] += 1
+                yield evento("progresso", **resumo)
+            yield evento("resumo", dry_run=dry_run, **resumo)
+        except Exception as e:
+            logger.error(f"Error importing lancamentos: {e}")
+            yield evento("falha", erro=str(e), **resumo)
+        finally:
+            arquivo.close()
+    
+    return StreamingResponse(eventos(), media_type="application/x-ndjson")
+
+# Sincronização incremental (lancamentos_sync_schema.sql): updated_at mantido
+# por trigger e uma marca em lancamentos_removidos por exclusão. O cursor guarda
+# a última posição (horário, id) lida em cada uma das duas listas. Só entram
+# alterações com mais de SYNC_ATRASO_MS: uma escrita ainda não confirmada pode
+# ter updated_at anterior ao de outra já visível, e o cursor passaria por ela.
+SYNC_ATRASO_MS = int(os.environ.get('SYNC_ATRASO_MS', '1000'))
+SYNC_RETENCAO_DIAS = int(os.environ.get('SYNC_RETENCAO_DIAS', '90'))
+SYNC_LIMITE_PADRAO = 1000
+
+def _codificar_cursor_sync(lancamentos: list, removidos: list) -> str:
+    bruto = json.dumps({"l": lancamentos, "r": removidos})
+    return base64.urlsafe_b64encode(bruto.encode()).decode().rstrip('=')
+
+def _decodificar_cursor_sync(cursor: str) -> tuple:
+    """(time, id) positions in the entries and in the tombstones lists"""
+    try:
+        bruto = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        lancamentos, removidos = ([str(v) for v in bruto[lista]] for lista in ("l", "r"))
+        datetime.fromisoformat(removidos[0])
+    except Exception:
+        raise ValueError("Cursor inválido")
+    if len(lancamentos) != 2 or len(removidos) != 2 or any('"' in v or '\\' in v for v in lancamentos + removidos):
+        raise ValueError("Cursor inválido")
+    return lancamentos, removidos
+
+def _alteracoes_desde(tabela: str, colunas: str, coluna_tempo: str, posicao: Optional[list],
+                      ate: str, limite: int) -> list:
+    """Rows of ``tabela`` after ``posicao`` in (coluna_tempo, id) order, up to ``ate``"""
+    query = supabase.table(tabela).select(colunas).lte(coluna_tempo, ate)
+    if posicao:
+        tempo, ultimo_id = posicao
+        query = query.or_(f'{coluna_tempo}.gt."{tempo}",and({coluna_tempo}.eq."{tempo}",id.gt."{ultimo_id}")')
+    return _executar_medido(query.order(coluna_tempo).order("id").limit(limite + 1)).data or []
+
+def _listar_alteracoes(since: Optional[str], limite: int) -> dict:
+    agora = datetime.now(timezone.utc)
+    ate = (agora - timedelta(milliseconds=SYNC_ATRASO_MS)).isoformat()
+    if since:
+        pos_lancamentos, pos_removidos = _decodificar_cursor_sync(since)
+        if datetime.fromisoformat(pos_removidos[0]) < agora - timedelta(days=SYNC_RETENCAO_DIAS):
+            raise HTTPException(status_code=410, detail="Cursor expirado: sincronize do zero (sem since)")
+    else:
+        # Primeira carga: todos os lançamentos atuais; exclusões só dali em diante
+        pos_lancamentos, pos_removidos = None, [ate, ""]
+
+    try:
+        lancamentos = _alteracoes_desde("lancamentos", "*", "updated_at", pos_lancamentos, ate, limite)
+        removidos = _alteracoes_desde("lancamentos_removidos", "id,deleted_at", "deleted_at", pos_removidos, ate, limite)
+    except APIError as e:
+        if e.code not in ('42703', 'PGRST204', 'PGRST205', '42P01'):
+            raise
+        raise HTTPException(status_code=501, detail="Sincronização requer lancamentos_sync_schema.sql")
+
+    # Lista esgotada: o cursor vai até o limite da consulta, assim ele não
+    # envelhece (nem expira) quando não há exclusões
+    mais = len(lancamentos) > limite or len(removidos) > limite
+    if len(lancamentos) > limite:
+        lancamentos = lancamentos[:limite]
+        pos_lancamentos = [lancamentos[-1]["updated_at"], lancamentos[-1]["id"]]
+    else:
+        pos_lancamentos = [ate, ""]
+    if len(removidos) > limite:
+        removidos = removidos[:limite]
+        pos_removidos = [removidos[-1]["deleted_at"], removidos[-1]["id"]]
+    else:
+        pos_removidos = [ate, ""]
+
+    return {
+        "lancamentos": [_com_percentual_perdas(lanc) for lanc in lancamentos],
+        "removidos": [r["id"] for r in removidos],
+        "cursor": _codificar_cursor_sync(pos_lancamentos, pos_removidos),
+        "mais": mais
+    }
+
+@api_router.get("/lancamentos/changes")
+async def alteracoes_lancamentos(since: Optional[str] = None, limit: int = Query(SYNC_LIMITE_PADRAO, ge=1, le=5000)):
+    """Entries created, updated or deleted since the ``since`` cursor, for clients keeping a local replica.
+
+    Without ``since`` every current entry is returned. Keep calling with the
+    returned ``cursor`` while ``mais`` is true: ``lancamentos`` are upserts by
+    id and ``removidos`` the deleted ids. A cursor older than
+    SYNC_RETENCAO_DIAS gets 410 and the client must start over.
+    """
+    try:
+        return await _em_thread(_listar_alteracoes, since, limit)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        logger.error(f"Error listing lancamentos: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        logger.error(f"Error listing lancamento changes: {e}")
+        raise _erro_http(e)
 
 @api_router.get("/lancamentos/{lancamento_id}")
 async def obter_lancamento(lancamento_id: str):
     """Get a specific production entry"""
     try:
-        response = supabase.table("lancamentos").select("*").eq("id", lancamento_id).execute()
-        if not response.data:
+        lanc = await _lancamentos.obter(lancamento_id)
+        if lanc is None:
             raise HTTPException(status_code=404, detail="Lançamento não encontrado")
-        return response.data[0]
+        return lanc
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error getting lancamento: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise _erro_http(e)
 
 @api_router.put("/lancamentos/{lancamento_id}")
 async def atualizar_lancamento(lancamento_id: str, lancamento: LancamentoCreate):
@@ -367,26 +1995,680 @@ async def atualizar_lancamento(lancamento_id: str, lancamento: LancamentoCreate)
             "perdas_total": perdas_total
         }
         
-        supabase.table("lancamentos").update(lancamento_update).eq("id", lancamento_id).execute()
+        anterior = await _executar(supabase.table("lancamentos").select("*").eq("id", lancamento_id))
+        response = await _executar(supabase.table("lancamentos").update(lancamento_update).eq("id", lancamento_id))
+        await _invalidar_relatorios(lancamento.data, *[a['data'] for a in anterior.data])
+        if response.data:
+            _publicar_lancamento("atualizado", response.data[0], lancamento.data, *[a['data'] for a in anterior.data])
         return {"success": True}
     except Exception as e:
         logger.error(f"Error updating lancamento: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise _erro_http(e)
 
 @api_router.delete("/lancamentos/{lancamento_id}")
 async def deletar_lancamento(lancamento_id: str):
     """Delete a production entry"""
     try:
-        supabase.table("lancamentos").delete().eq("id", lancamento_id).execute()
+        response = await _executar(supabase.table("lancamentos").delete().eq("id", lancamento_id))
+        if response.data:
+            await _invalidar_relatorios(response.data[0]['data'])
+            removido = {"id": response.data[0]['id'], "data": response.data[0]['data']}
+            _publicar_lancamento("removido", removido, removido['data'])
         return {"success": True}
     except Exception as e:
         logger.error(f"Error deleting lancamento: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise _erro_http(e)
 
 # ==================== RELATORIOS ENDPOINTS ====================
 
+# Backend de agregação dos relatórios: "rollup" lê os totais diários
+# mantidos por trigger (lancamentos_rollup_schema.sql), "rpc" empurra o
+# agrupamento para o Postgres (função relatorio_agregado, ver
+# relatorios_schema.sql) e "python" agrega as linhas brutas no processo.
+# Cada modo cai para o seguinte quando sua tabela/função não está instalada.
+RELATORIO_BACKEND = os.environ.get('RELATORIO_BACKEND', 'rollup')
+_rpc_relatorio_disponivel = True
+
+
+def _periodo_relatorio(periodo: str, data_inicio: Optional[str], data_fim: Optional[str]):
+    """Resolve the date range for a report period"""
+    from datetime import timedelta
+    hoje = datetime.now(timezone.utc).date()
+
+    if not data_inicio or not data_fim:
+        if periodo == 'semanal':
+            dias_desde_domingo = (hoje.weekday() + 1) % 7
+            data_inicio = (hoje - timedelta(days=dias_desde_domingo)).isoformat()
+            data_fim = (hoje + timedelta(days=(6 - dias_desde_domingo))).isoformat()
+        elif periodo == 'mensal':
+            data_inicio = hoje.replace(day=1).isoformat()
+            if hoje.month == 12:
+                data_fim = hoje.replace(day=31).isoformat()
+            else:
+                proximo_mes = hoje.replace(month=hoje.month + 1, day=1)
+                data_fim = (proximo_mes - timedelta(days=1)).isoformat()
+        elif periodo == 'anual':
+            data_inicio = hoje.replace(month=1, day=1).isoformat()
+            data_fim = hoje.replace(month=12, day=31).isoformat()
+
+    return data_inicio, data_fim
+
+
+def _agregar_lancamentos(lancamentos: list) -> dict:
+    """Aggregate raw lancamentos rows in Python (fallback backend)
+
+    Float sums are accumulated row by row in input order and groups keep
+    their first-occurrence order (benchmarks/bench_relatorio.py checks it).
+    """
+    _metrica_relatorio_linhas.inc(len(lancamentos), "lancamentos")
+    producao_total = 0
+    perdas_total = 0
+    dias_unicos = set()
+    stats_ref = {}
+    stats_itens = {}
+    # formato -> cor -> entrada de stats_itens: a chave "formato - cor" só é
+    # montada na primeira vez que o par aparece
+    entradas_itens = {}
+
+    for lanc in lancamentos:
+        get = lanc.get
+        prod_lanc = float(get('producao_total') or 0)
+        perd_lanc = float(get('perdas_total') or 0)
+        data = lanc['data']
+
+        producao_total += prod_lanc
+        perdas_total += perd_lanc
+        dias_unicos.add(data)
+
+        # Stats by reference
+        ref = get('referencia_producao') or 'Sem Referência'
+        stats = stats_ref.get(ref)
+        if stats is None:
+            stats = stats_ref[ref] = {"prod": 0, "perd": 0, "dias": set()}
+        stats["prod"] += prod_lanc
+        stats["perd"] += perd_lanc
+        stats["dias"].add(data)
+
+        # Stats by item (Format + Color)
+        itens_lanc = get('itens', [])
+        if isinstance(itens_lanc, list):
+            for item in itens_lanc:
+                # null no JSON vale como ausente, igual ao COALESCE do
+                # relatorio_agregado e dos rollups
+                formato = item.get('formato')
+                if formato is None:
+                    formato = 'N/A'
+                cor = item.get('cor')
+                if cor is None:
+                    cor = 'N/A'
+                por_cor = entradas_itens.get(formato)
+                if por_cor is None:
+                    por_cor = entradas_itens[formato] = {}
+                entrada = por_cor.get(cor)
+                if entrada is None:
+                    chave_item = f"{formato} - {cor}"
+                    entrada = stats_itens.get(chave_item)
+                    if entrada is None:
+                        entrada = stats_itens[chave_item] = {"formato": formato, "cor": cor, "producao": 0}
+                    por_cor[cor] = entrada
+                entrada["producao"] += float(item.get('producao_kg') or 0)
+
+    return {
+        "lancamentos": len(lancamentos),
+        "producao": producao_total,
+        "perdas": perdas_total,
+        "dias": len(dias_unicos),
+        "por_referencia": {
+            ref: {"prod": s["prod"], "perd": s["perd"], "dias": len(s["dias"])}
+            for ref, s in stats_ref.items()
+        },
+        "por_item": stats_itens
+    }
+
+
+def _agregado_de_linhas_rpc(linhas: list) -> dict:
+    """Convert relatorio_agregado rows into the aggregate structure"""
+    _metrica_relatorio_linhas.inc(len(linhas), "relatorio_agregado")
+    agregado = {"lancamentos": 0, "producao": 0, "perdas": 0, "dias": 0, "por_referencia": {}, "por_item": {}}
+    for linha in linhas:
+        if linha['tipo'] == 'total':
+            agregado["lancamentos"] = int(linha.get('lancamentos') or 0)
+            agregado["producao"] = float(linha.get('producao') or 0)
+            agregado["perdas"] = float(linha.get('perdas') or 0)
+            agregado["dias"] = int(linha.get('dias') or 0)
+        elif linha['tipo'] == 'referencia':
+            agregado["por_referencia"][linha['chave']] = {
+                "prod": float(linha.get('producao') or 0),
+                "perd": float(linha.get('perdas') or 0),
+                "dias": int(linha.get('dias') or 0)
+            }
+        elif linha['tipo'] == 'item':
+            agregado["por_item"][linha['chave']] = {
+                "formato": linha['formato'],
+                "cor": linha['cor'],
+                "producao": float(linha.get('producao') or 0)
+            }
+    return agregado
+
+
+def _relatorio_via_python(data_inicio: Optional[str], data_fim: Optional[str], referencia: Optional[str]) -> dict:
+    def montar_query():
+        query = supabase.table("lancamentos").select("data,referencia_producao,producao_total,perdas_total,itens")
+        if data_inicio and data_fim:
+            query = query.gte("data", data_inicio).lte("data", data_fim)
+        if referencia:
+            query = query.ilike("referencia_producao", f"%{referencia}%")
+        return query.order("id")
+
+    # Todas as páginas: uma consulta só pararia no limite de linhas do PostgREST
+    return _agregar_lancamentos(list(_paginar(montar_query)))
+
+
+def _relatorio_via_rpc(data_inicio: Optional[str], data_fim: Optional[str], referencia: Optional[str]) -> dict:
+    global _rpc_relatorio_disponivel
+    if not _rpc_relatorio_disponivel:
+        return _relatorio_via_python(data_inicio, data_fim, referencia)
+
+    params = {
+        "p_data_inicio": data_inicio if data_inicio and data_fim else None,
+        "p_data_fim": data_fim if data_inicio and data_fim else None,
+        "p_referencia": referencia or None
+    }
+    try:
+        response = _executar_medido(supabase.rpc("relatorio_agregado", params))
+    except APIError as e:
+        # PGRST202: função não encontrada no schema cache do PostgREST
+        if e.code not in ('PGRST202', '42883'):
+            raise
+        logger.warning("relatorio_agregado RPC not installed, falling back to Python aggregation")
+        _rpc_relatorio_disponivel = False
+        return _relatorio_via_python(data_inicio, data_fim, referencia)
+    return _agregado_de_linhas_rpc(response.data or [])
+
+
+def _paginar(montar_query, tamanho: int = 1000):
+    """Yield every row of a query, one PostgREST page at a time"""
+    inicio = 0
+    while True:
+        lote = _executar_medido(montar_query().range(inicio, inicio + tamanho - 1)).data or []
+        yield from lote
+        if len(lote) < tamanho:
+            break
+        inicio += tamanho
+
+
+# Rollups diários (lancamentos_diario / lancamentos_diario_itens), mantidos
+# pelo trigger de lancamentos_rollup_schema.sql. Só são lidos depois que
+# rollup_mantido_por_trigger() confirma o trigger: um banco com o schema
+# anterior, em que a API atualizava os rollups, cai para o relatorio_agregado
+# em vez de servir totais parados.
+_rollup_disponivel = None
+
+
+def _rollup_confirmado() -> bool:
+    global _rollup_disponivel
+    if _rollup_disponivel is None:
+        try:
+            confirmado = bool(_executar_medido(supabase.rpc("rollup_mantido_por_trigger", {})).data)
+        except APIError as e:
+            if e.code not in ('PGRST202', '42883'):
+                raise
+            confirmado = False
+        if not confirmado:
+            logger.warning("Daily rollups not maintained by trigger, falling back to RPC aggregation")
+        _rollup_disponivel = confirmado
+    return _rollup_disponivel
+
+
+def _agregar_rollup(linhas_dia, linhas_itens) -> dict:
+    """Aggregate daily rollup rows into the aggregate structure"""
+    _metrica_relatorio_linhas.inc(len(linhas_dia), "lancamentos_diario")
+    _metrica_relatorio_linhas.inc(len(linhas_itens), "lancamentos_diario_itens")
+    agregado = {"lancamentos": 0, "producao": 0, "perdas": 0, "dias": 0, "por_referencia": {}, "por_item": {}}
+    dias_unicos = set()
+    dias_ref = {}
+
+    for linha in linhas_dia:
+        prod = float(linha.get('producao') or 0)
+        perd = float(linha.get('perdas') or 0)
+        ref = linha.get('referencia_producao') or 'Sem Referência'
+
+        agregado["lancamentos"] += int(linha.get('lancamentos') or 0)
+        agregado["producao"] += prod
+        agregado["perdas"] += perd
+        dias_unicos.add(linha['data'])
+
+        if ref not in agregado["por_referencia"]:
+            agregado["por_referencia"][ref] = {"prod": 0, "perd": 0, "dias": 0}
+            dias_ref[ref] = set()
+        agregado["por_referencia"][ref]["prod"] += prod
+        agregado["por_referencia"][ref]["perd"] += perd
+        dias_ref[ref].add(linha['data'])
+
+    for linha in linhas_itens:
+        chave_item = f"{linha['formato']} - {linha['cor']}"
+        if chave_item not in agregado["por_item"]:
+            agregado["por_item"][chave_item] = {"formato": linha['formato'], "cor": linha['cor'], "producao": 0}
+        agregado["por_item"][chave_item]["producao"] += float(linha.get('producao') or 0)
+
+    agregado["dias"] = len(dias_unicos)
+    for ref, dias in dias_ref.items():
+        agregado["por_referencia"][ref]["dias"] = len(dias)
+    return agregado
+
+
+def _relatorio_via_rollup(data_inicio: Optional[str], data_fim: Optional[str], referencia: Optional[str]) -> dict:
+    global _rollup_disponivel
+    if not _rollup_confirmado():
+        return _relatorio_via_rpc(data_inicio, data_fim, referencia)
+
+    def filtrar(query):
+        if data_inicio and data_fim:
+            query = query.gte("data", data_inicio).lte("data", data_fim)
+        if referencia:
+            query = query.ilike("referencia_producao", f"%{referencia}%")
+        return query
+
+    try:
+        linhas_dia = list(_paginar(lambda: filtrar(
+            supabase.table("lancamentos_diario").select("data,turno,referencia_producao,producao,perdas,lancamentos")
+        ).order("data").order("turno").order("referencia_producao")))
+        linhas_itens = list(_paginar(lambda: filtrar(
+            supabase.table("lancamentos_diario_itens").select("data,referencia_producao,formato,cor,producao")
+        ).order("data").order("referencia_producao").order("formato").order("cor")))
+    except APIError as e:
+        # PGRST205: tabela não encontrada no schema cache do PostgREST
+        if e.code not in ('PGRST205', '42P01'):
+            raise
+        logger.warning("Daily rollup tables not installed, falling back to RPC aggregation")
+        _rollup_disponivel = False
+        return _relatorio_via_rpc(data_inicio, data_fim, referencia)
+    return _agregar_rollup(linhas_dia, linhas_itens)
+
+
+RELATORIO_BACKENDS = {
+    "python": _relatorio_via_python,
+    "rpc": _relatorio_via_rpc,
+    "rollup": _relatorio_via_rollup,
+}
+
+
+def _montar_relatorio(agregado: dict, data_inicio: Optional[str], data_fim: Optional[str]) -> dict:
+    """Build the report JSON from an aggregate structure"""
+    if not agregado["lancamentos"]:
+        return {
+            "producao_total": 0,
+            "perdas_total": 0,
+            "percentual_perdas": 0,
+            "dias_produzidos": 0,
+            "media_diaria": 0,
+            "data_inicio": data_inicio,
+            "data_fim": data_fim,
+            "por_referencia": {},
+            "por_item": []
+        }
+
+    producao_total = agregado["producao"]
+    perdas_total = agregado["perdas"]
+    dias_total = agregado["dias"]
+
+    return {
+        "producao_total": round(producao_total, 2),
+        "perdas_total": round(perdas_total, 2),
+        "percentual_perdas": round((perdas_total / producao_total * 100) if producao_total > 0 else 0, 2),
+        "dias_produzidos": dias_total,
+        "media_diaria": round(producao_total / dias_total if dias_total > 0 else 0, 2),
+        "data_inicio": data_inicio,
+        "data_fim": data_fim,
+        "por_referencia": {
+            ref: {
+                "producao": round(s["prod"], 2),
+                "perdas": round(s["perd"], 2),
+                "dias_produzidos": s["dias"],
+                "media_diaria": round(s["prod"] / s["dias"] if s["dias"] else 0, 2),
+                "percentual_perdas": round((s["perd"] / s["prod"] * 100) if s["prod"] > 0 else 0, 2)
+            } for ref, s in agregado["por_referencia"].items()
+        },
+        "por_item": [
+            {
+                "item": chave,
+                "formato": dados["formato"],
+                "cor": dados["cor"],
+                "producao": round(dados["producao"], 2)
+            } for chave, dados in sorted(agregado["por_item"].items(), key=lambda x: x[1]['producao'], reverse=True)
+        ]
+    }
+
+
+# Cache dos resultados de relatório, chaveado pelo intervalo de datas já
+# resolvido e pela referência normalizada. Escritas em lancamentos removem
+# apenas os intervalos que contêm a data afetada. Por padrão o cache fica em
+# memória (por worker); com RELATORIO_CACHE_URL=redis://... fica compartilhado.
+RELATORIO_CACHE_URL = os.environ.get('RELATORIO_CACHE_URL')
+RELATORIO_CACHE_TTL = float(os.environ.get('RELATORIO_CACHE_TTL', '300'))
+RELATORIO_CACHE_MAX = int(os.environ.get('RELATORIO_CACHE_MAX', '256'))
+_cache_stats["relatorios"] = {"hits": 0, "misses": 0, "invalidacoes": 0, "coalescidas": 0}
+
+
+def _chave_relatorio(data_inicio: Optional[str], data_fim: Optional[str], referencia: Optional[str]) -> str:
+    return f"{data_inicio or ''}|{data_fim or ''}|{(referencia or '').strip().lower()}"
+
+
+def _chave_contem_data(chave: str, data: str) -> bool:
+    data_inicio, data_fim, _ = chave.split('|', 2)
+    return (not data_inicio or data_inicio <= data) and (not data_fim or data <= data_fim)
+
+
+def _meses_chave(chave: str) -> Optional[list]:
+    """Months (YYYY-MM) spanned by a cache key's range, or None when it is open-ended"""
+    data_inicio, data_fim, _ = chave.split('|', 2)
+    if not data_inicio or not data_fim:
+        return None
+    try:
+        ano, mes = int(data_inicio[:4]), int(data_inicio[5:7])
+    except ValueError:
+        return None
+    meses = []
+    while f"{ano:04d}-{mes:02d}" <= data_fim[:7]:
+        meses.append(f"{ano:04d}-{mes:02d}")
+        ano, mes = (ano + 1, 1) if mes == 12 else (ano, mes + 1)
+    return meses
+
+
+class _RelatorioCacheMemoria:
+    """Bounded in-process LRU cache with TTL for report results"""
+
+    def __init__(self, max_itens: int, ttl: float):
+        self._max_itens = max_itens
+        self._ttl = ttl
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def obter(self, chave: str) -> Optional[dict]:
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                return None
+            expira_em, valor = item
+            if time.monotonic() >= expira_em:
+                del self._itens[chave]
+                return None
+            self._itens.move_to_end(chave)
+            return valor
+
+    async def guardar(self, chave: str, valor: dict):
+        with self._lock:
+            self._itens[chave] = (time.monotonic() + self._ttl, valor)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self._max_itens:
+                self._itens.popitem(last=False)
+
+    async def remover(self, chave: str):
+        with self._lock:
+            self._itens.pop(chave, None)
+
+    async def invalidar_data(self, data: str) -> int:
+        with self._lock:
+            chaves = [c for c in self._itens if _chave_contem_data(c, data)]
+            for chave in chaves:
+                del self._itens[chave]
+            return len(chaves)
+
+
+class _RelatorioCacheRedis:
+    """Report cache in a Redis-compatible store, shared between workers.
+
+    Keys are indexed in one set per month of their range (open-ended ranges
+    in a set of their own), each expiring with its newest key, so an
+    invalidation reads only the sets of the written date's month.
+    """
+
+    PREFIXO = "forte:relatorio:"
+
+    def __init__(self, url: str, ttl: float):
+        import redis.asyncio
+        self._redis = redis.asyncio.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self._ttl = max(int(ttl), 1)
+
+    def _conjuntos(self, chave: str) -> list:
+        meses = _meses_chave(chave)
+        if meses is None:
+            return [self.PREFIXO + "aberto"]
+        return [self.PREFIXO + "mes:" + mes for mes in meses]
+
+    async def obter(self, chave: str) -> Optional[dict]:
+        try:
+            valor = await self._redis.get(self.PREFIXO + chave)
+        except Exception as e:
+            logger.warning(f"Report cache unavailable: {e}")
+            return None
+        return json.loads(valor) if valor else None
+
+    async def guardar(self, chave: str, valor: dict):
+        try:
+            async with self._redis.pipeline() as pipe:
+                pipe.setex(self.PREFIXO + chave, self._ttl, json.dumps(valor))
+                for conjunto in self._conjuntos(chave):
+                    pipe.sadd(conjunto, chave)
+                    pipe.expire(conjunto, self._ttl)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Report cache unavailable: {e}")
+
+    async def remover(self, chave: str):
+        try:
+            async with self._redis.pipeline() as pipe:
+                pipe.delete(self.PREFIXO + chave)
+                for conjunto in self._conjuntos(chave):
+                    pipe.srem(conjunto, chave)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"Report cache unavailable: {e}")
+
+    async def invalidar_data(self, data: str) -> int:
+        try:
+            conjuntos = [self.PREFIXO + "mes:" + data[:7], self.PREFIXO + "aberto"]
+            async with self._redis.pipeline() as pipe:
+                for conjunto in conjuntos:
+                    pipe.smembers(conjunto)
+                membros = [{c.decode() for c in m} for m in await pipe.execute()]
+            chaves = sorted(set().union(*membros))
+            if not chaves:
+                return 0
+            async with self._redis.pipeline() as pipe:
+                for chave in chaves:
+                    pipe.exists(self.PREFIXO + chave)
+                existem = dict(zip(chaves, await pipe.execute()))
+            # Sai do índice quem contém a data e quem já expirou pelo TTL
+            invalidadas = {c for c in chaves if existem[c] and _chave_contem_data(c, data)}
+            async with self._redis.pipeline() as pipe:
+                if invalidadas:
+                    pipe.delete(*[self.PREFIXO + c for c in invalidadas])
+                for conjunto, m in zip(conjuntos, membros):
+                    expiradas = [c for c in m if not existem[c]]
+                    if expiradas:
+                        pipe.srem(conjunto, *expiradas)
+                for chave in invalidadas:
+                    for conjunto in self._conjuntos(chave):
+                        pipe.srem(conjunto, chave)
+                await pipe.execute()
+            return len(invalidadas)
+        except Exception as e:
+            logger.warning(f"Report cache unavailable: {e}")
+            return 0
+
+
+def _criar_cache_relatorios():
+    if RELATORIO_CACHE_URL:
+        try:
+            return _RelatorioCacheRedis(RELATORIO_CACHE_URL, RELATORIO_CACHE_TTL)
+        except ImportError:
+            logging.getLogger(__name__).warning("redis package not installed, using in-memory report cache")
+    return _RelatorioCacheMemoria(RELATORIO_CACHE_MAX, RELATORIO_CACHE_TTL)
+
+
+_cache_relatorios = _criar_cache_relatorios()
+
+
+# Admissão dos relatórios pesados: um intervalo de anos com RELATORIO_BACKEND
+# python lê a tabela inteira e, sem limite, poucos usuários ocupam todas as
+# threads e conexões. O custo é estimado pelos dias do intervalo; acima de
+# RELATORIO_PESADO_DIAS o cálculo (só no cache miss) espera uma das
+# RELATORIO_PESADO_VAGAS vagas, numa fila de até RELATORIO_PESADO_FILA por no
+# máximo RELATORIO_PESADO_ESPERA segundos, ou recebe 429 com Retry-After. O
+# restante de SUPABASE_MAX_CONCURRENCY fica para listagens e escritas.
+RELATORIO_PESADO_DIAS = int(os.environ.get('RELATORIO_PESADO_DIAS', '92'))
+RELATORIO_PESADO_VAGAS = int(os.environ.get('RELATORIO_PESADO_VAGAS', '2'))
+RELATORIO_PESADO_FILA = int(os.environ.get('RELATORIO_PESADO_FILA', '4'))
+RELATORIO_PESADO_ESPERA = float(os.environ.get('RELATORIO_PESADO_ESPERA', '10'))
+
+
+def _relatorio_pesado(data_inicio: Optional[str], data_fim: Optional[str]) -> bool:
+    """Whether a resolved report range is long enough to need admission"""
+    if not data_inicio or not data_fim:
+        return True  # sem um dos limites o intervalo vai até a ponta da tabela
+    try:
+        dias = (date.fromisoformat(data_fim[:10]) - date.fromisoformat(data_inicio[:10])).days + 1
+    except ValueError:
+        return True
+    return dias > RELATORIO_PESADO_DIAS
+
+
+class _Admissao:
+    """Concurrency limit with a bounded wait queue for heavy computations"""
+
+    def __init__(self, vagas: int, fila_max: int, espera: float):
+        self.vagas, self.fila_max, self.espera = max(vagas, 1), fila_max, espera
+        self._semaforo = asyncio.Semaphore(self.vagas)
+        self.na_fila = 0
+        # Média móvel da duração de um cálculo, para o Retry-After
+        self._duracao = 1.0
+
+    def _recusar(self, motivo: str):
+        _metrica_admissao_recusadas.inc(1, motivo)
+        retry_after = max(1, int(self._duracao * (self.na_fila + 1) / self.vagas + 0.999))
+        raise HTTPException(
+            status_code=429,
+            detail="Muitos relatórios pesados em andamento, tente novamente em instantes",
+            headers={"Retry-After": str(retry_after)}
+        )
+
+    @contextlib.asynccontextmanager
+    async def vaga(self):
+        if self._semaforo.locked() and self.na_fila >= self.fila_max:
+            self._recusar("queue_full")
+        self.na_fila += 1
+        _metrica_admissao_fila.inc(1)
+        try:
+            await asyncio.wait_for(self._semaforo.acquire(), self.espera)
+        except asyncio.TimeoutError:
+            self._recusar("timeout")
+        finally:
+            self.na_fila -= 1
+            _metrica_admissao_fila.inc(-1)
+        _metrica_admissao_ativas.inc(1)
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._duracao = 0.7 * self._duracao + 0.3 * (time.perf_counter() - inicio)
+            _metrica_admissao_ativas.inc(-1)
+            self._semaforo.release()
+
+
+_admissao_relatorios = _Admissao(RELATORIO_PESADO_VAGAS, RELATORIO_PESADO_FILA, RELATORIO_PESADO_ESPERA)
+
+
+# Último relatório calculado por chave, servido com X-Stale enquanto o
+# Supabase falha; as invalidações não o apagam
+_relatorios_bons = OrderedDict()
+
+def _guardar_relatorio_bom(chave: str, relatorio: dict):
+    _relatorios_bons[chave] = relatorio
+    _relatorios_bons.move_to_end(chave)
+    while len(_relatorios_bons) > max(RELATORIO_CACHE_MAX, 1):
+        _relatorios_bons.popitem(last=False)
+
+
+# Cálculos de relatório em andamento por chave (single-flight): numa troca de
+# turno dezenas de dashboards pedem o mesmo relatório ao mesmo tempo e só o
+# primeiro pedido calcula; os demais aguardam a mesma tarefa. Vale por worker.
+_relatorios_em_andamento = {}
+
+
+async def _invalidar_relatorios(*datas):
+    """Evict cached reports whose range contains any of the given dates"""
+    datas = {d for d in datas if d}
+    # Pedidos novos não entram num cálculo que começou antes da escrita
+    for data in datas:
+        for chave in [c for c in _relatorios_em_andamento if _chave_contem_data(c, data)]:
+            del _relatorios_em_andamento[chave]
+    for data in datas:
+        _cache_stats["relatorios"]["invalidacoes"] += await _cache_relatorios.invalidar_data(data)
+
+
+async def _calcular_relatorio(chave: str, data_inicio: Optional[str], data_fim: Optional[str], referencia: str) -> dict:
+    if _relatorio_pesado(data_inicio, data_fim):
+        async with _admissao_relatorios.vaga():
+            return await _agregar_e_guardar(chave, data_inicio, data_fim, referencia)
+    return await _agregar_e_guardar(chave, data_inicio, data_fim, referencia)
+
+
+async def _agregar_e_guardar(chave: str, data_inicio: Optional[str], data_fim: Optional[str], referencia: str) -> dict:
+    inicio = time.perf_counter()
+    agregado = await _lancamentos.agregar_relatorio(data_inicio, data_fim, referencia)
+    relatorio = _montar_relatorio(agregado, data_inicio, data_fim)
+    _metrica_relatorio.observar(time.perf_counter() - inicio, DB_DRIVER, RELATORIO_BACKEND)
+    _guardar_relatorio_bom(chave, relatorio)
+    # Invalidado durante o cálculo: o resultado serve a quem já esperava, mas não vai para o cache
+    if _relatorios_em_andamento.get(chave) is asyncio.current_task():
+        await _cache_relatorios.guardar(chave, relatorio)
+        # Uma escrita que chegou enquanto o cache gravava já não enxerga esta chave
+        if _relatorios_em_andamento.get(chave) is not asyncio.current_task():
+            await _cache_relatorios.remover(chave)
+    return relatorio
+
+
+def _fim_calculo_relatorio(chave: str, tarefa: asyncio.Task):
+    if _relatorios_em_andamento.get(chave) is tarefa:
+        del _relatorios_em_andamento[chave]
+    if not tarefa.cancelled():
+        tarefa.exception()  # quem aguardava já recebeu o erro; evita o aviso de exceção não lida
+
+
+async def _relatorio_cacheado(data_inicio: Optional[str], data_fim: Optional[str], referencia: str) -> dict:
+    """Return the report for a resolved range, computing it only on a cache miss.
+
+    Concurrent misses for the same key share one computation. It runs as its
+    own task, so a client that disconnects does not cancel it for the others.
+    """
+    chave = _chave_relatorio(data_inicio, data_fim, referencia)
+    # Com o profiler ligado o relatório é sempre recalculado, na própria requisição
+    if _perfil_atual.get() is not None:
+        _cache_stats["relatorios"]["misses"] += 1
+        return await _calcular_relatorio(chave, data_inicio, data_fim, referencia)
+
+    relatorio = await _cache_relatorios.obter(chave)
+    if relatorio is not None:
+        _cache_stats["relatorios"]["hits"] += 1
+        return relatorio
+
+    tarefa = _relatorios_em_andamento.get(chave)
+    if tarefa is not None:
+        _cache_stats["relatorios"]["coalescidas"] += 1
+        _metrica_relatorio_coalescidas.inc()
+    else:
+        _cache_stats["relatorios"]["misses"] += 1
+        tarefa = asyncio.ensure_future(_calcular_relatorio(chave, data_inicio, data_fim, referencia))
+        _relatorios_em_andamento[chave] = tarefa
+        tarefa.add_done_callback(functools.partial(_fim_calculo_relatorio, chave))
+    return await asyncio.shield(tarefa)
+
+
 @api_router.get("/relatorios")
+@_perfilavel
 async def gerar_relatorio(
+    request: Request,
     periodo: str = "mensal",
     data_inicio: Optional[str] = None,
     data_fim: Optional[str] = None,
@@ -394,121 +2676,531 @@ async def gerar_relatorio(
 ):
     """Generate production report"""
     try:
-        from datetime import timedelta
-        hoje = datetime.now(timezone.utc).date()
-        
-        # Calculate date range based on period
-        if not data_inicio or not data_fim:
-            if periodo == 'semanal':
-                dias_desde_domingo = (hoje.weekday() + 1) % 7
-                data_inicio = (hoje - timedelta(days=dias_desde_domingo)).isoformat()
-                data_fim = (hoje + timedelta(days=(6 - dias_desde_domingo))).isoformat()
-            elif periodo == 'mensal':
-                data_inicio = hoje.replace(day=1).isoformat()
-                if hoje.month == 12:
-                    data_fim = hoje.replace(day=31).isoformat()
-                else:
-                    proximo_mes = hoje.replace(month=hoje.month + 1, day=1)
-                    data_fim = (proximo_mes - timedelta(days=1)).isoformat()
-            elif periodo == 'anual':
-                data_inicio = hoje.replace(month=1, day=1).isoformat()
-                data_fim = hoje.replace(month=12, day=31).isoformat()
-        
-        # Query lancamentos
-        query = supabase.table("lancamentos").select("*")
-        if data_inicio and data_fim:
-            query = query.gte("data", data_inicio).lte("data", data_fim)
-        
+        data_inicio, data_fim = _periodo_relatorio(periodo, data_inicio, data_fim)
+
         # Trim e busca case-insensitive
-        if referencia_producao:
-            ref_trimmed = referencia_producao.strip()
-            if ref_trimmed:
-                query = query.ilike("referencia_producao", f"%{ref_trimmed}%")
-        
-        response = query.execute()
-        lancamentos = response.data
-        
-        if not lancamentos:
-            return {
-                "producao_total": 0,
-                "perdas_total": 0,
-                "percentual_perdas": 0,
-                "dias_produzidos": 0,
-                "media_diaria": 0,
-                "data_inicio": data_inicio,
-                "data_fim": data_fim,
-                "por_referencia": {},
-                "por_item": []
-            }
-        
-        producao_total = 0
-        perdas_total = 0
-        dias_unicos = set()
-        stats_ref = {}
-        stats_itens = {}
-        
-        for lanc in lancamentos:
-            prod_lanc = float(lanc.get('producao_total') or 0)
-            perd_lanc = float(lanc.get('perdas_total') or 0)
-            ref = lanc.get('referencia_producao') or 'Sem Referência'
-            
-            producao_total += prod_lanc
-            perdas_total += perd_lanc
-            dias_unicos.add(lanc['data'])
-            
-            # Stats by reference
-            if ref not in stats_ref:
-                stats_ref[ref] = {"prod": 0, "perd": 0, "dias": set()}
-            stats_ref[ref]["prod"] += prod_lanc
-            stats_ref[ref]["perd"] += perd_lanc
-            stats_ref[ref]["dias"].add(lanc['data'])
-            
-            # Stats by item (Format + Color)
-            itens_lanc = lanc.get('itens', [])
-            if isinstance(itens_lanc, list):
-                for item in itens_lanc:
-                    formato = item.get('formato', 'N/A')
-                    cor = item.get('cor', 'N/A')
-                    chave_item = f"{formato} - {cor}"
-                    prod_item = float(item.get('producao_kg') or 0)
-                    
-                    if chave_item not in stats_itens:
-                        stats_itens[chave_item] = {"formato": formato, "cor": cor, "producao": 0}
-                    stats_itens[chave_item]["producao"] += prod_item
-        
-        dias_total = len(dias_unicos)
+        ref_trimmed = referencia_producao.strip() if referencia_producao else ""
+
+        return await _relatorio_cacheado(data_inicio, data_fim, ref_trimmed)
+    except HTTPException:
+        raise
+    except Exception as e:
+        if _falha_transitoria(e):
+            bom = _relatorios_bons.get(_chave_relatorio(data_inicio, data_fim, ref_trimmed))
+            if bom is not None:
+                return _resposta_desatualizada(bom, "relatorios", e)
+        logger.error(f"Error generating report: {e}")
+        raise _erro_http(e)
+
+# ==================== REFERENCIAS ENDPOINT ====================
+
+# Autocomplete do filtro de referência: a função sugerir_referencias
+# (referencias_schema.sql) lê as contagens mantidas por trigger; sem ela as
+# sugestões saem dos REFERENCIAS_AMOSTRA lançamentos mais recentes que casam
+REFERENCIAS_CAMPOS = {"producao": "referencia_producao", "lote": "referencia_lote"}
+REFERENCIAS_AMOSTRA = int(os.environ.get('REFERENCIAS_AMOSTRA', '1000'))
+_rpc_sugestoes_disponivel = True
+
+def _sugestoes_via_lancamentos(q: str, campo: str, limite: int) -> list:
+    coluna = REFERENCIAS_CAMPOS[campo]
+    response = _executar_medido(supabase.table("lancamentos").select(coluna).ilike(coluna, f"%{q}%")
+        .order("data", desc=True).limit(REFERENCIAS_AMOSTRA))
+    contagem = Counter(l[coluna] for l in response.data or [] if (l.get(coluna) or "").strip())
+    prefixo = q.casefold()
+    ordenadas = sorted(contagem.items(), key=lambda x: (not x[0].casefold().startswith(prefixo), -x[1], x[0]))
+    return [{"referencia": ref, "lancamentos": n} for ref, n in ordenadas[:limite]]
+
+def _sugerir_referencias(q: str, campo: str, limite: int) -> list:
+    global _rpc_sugestoes_disponivel
+    if _rpc_sugestoes_disponivel:
+        try:
+            response = _executar_medido(supabase.rpc("sugerir_referencias", {"p_q": q, "p_campo": campo, "p_limite": limite}))
+            return [{"referencia": l["referencia"], "lancamentos": int(l["lancamentos"])} for l in response.data or []]
+        except APIError as e:
+            if e.code not in ('PGRST202', '42883'):
+                raise
+            logger.warning("sugerir_referencias RPC not installed, suggesting from recent lancamentos")
+            _rpc_sugestoes_disponivel = False
+    return _sugestoes_via_lancamentos(q, campo, limite)
+
+@api_router.get("/referencias/suggest")
+async def sugerir_referencias(q: str = "", campo: str = "producao", limite: int = Query(10, ge=1, le=50)):
+    """Distinct references containing ``q`` with their entry counts, prefix matches first"""
+    if campo not in REFERENCIAS_CAMPOS:
+        raise HTTPException(status_code=400, detail=f"Campo inválido: {campo}")
+    q = q.strip()
+    if not q:
+        return []
+    try:
+        return await _em_thread(_sugerir_referencias, q, campo, limite)
+    except Exception as e:
+        logger.error(f"Error suggesting referencias: {e}")
+        raise _erro_http(e)
+
+# ==================== DASHBOARD ENDPOINT ====================
+
+# Colunas dos lançamentos recentes do dashboard (sem itens)
+DASHBOARD_CAMPOS = "data,hora,turno,referencia_producao,producao_total,perdas_total,percentual_perdas"
+
+@api_router.get("/dashboard")
+async def obter_dashboard(limite: int = Query(50, ge=1, le=1000), desde: Optional[str] = None):
+    """Latest month with data, its report and the most recent entries in one call"""
+    async def periodo_e_relatorio():
+        # max(data) pelo índice de data: uma linha só
+        ultimo, _ = await _lancamentos.listar("data", None, None, None, limite=1)
+        if ultimo:
+            ultima_data = date.fromisoformat(str(ultimo[0]['data'])[:10])
+        else:
+            ultima_data = datetime.now(timezone.utc).date()
         
-        relatorio = {
-            "producao_total": round(producao_total, 2),
-            "perdas_total": round(perdas_total, 2),
-            "percentual_perdas": round((perdas_total / producao_total * 100) if producao_total > 0 else 0, 2),
-            "dias_produzidos": dias_total,
-            "media_diaria": round(producao_total / dias_total if dias_total > 0 else 0, 2),
-            "data_inicio": data_inicio,
-            "data_fim": data_fim,
-            "por_referencia": {
-                ref: {
-                    "producao": round(s["prod"], 2),
-                    "perdas": round(s["perd"], 2),
-                    "dias_produzidos": len(s["dias"]),
-                    "media_diaria": round(s["prod"] / len(s["dias"]) if s["dias"] else 0, 2),
-                    "percentual_perdas": round((s["perd"] / s["prod"] * 100) if s["prod"] > 0 else 0, 2)
-                } for ref, s in stats_ref.items()
-            },
-            "por_item": [
-                {
-                    "item": chave,
-                    "formato": dados["formato"],
-                    "cor": dados["cor"],
-                    "producao": round(dados["producao"], 2)
-                } for chave, dados in sorted(stats_itens.items(), key=lambda x: x[1]['producao'], reverse=True)
-            ]
+        data_inicio = ultima_data.replace(day=1)
+        data_fim = ultima_data.replace(day=calendar.monthrange(ultima_data.year, ultima_data.month)[1])
+        periodo = {
+            "ano": ultima_data.year,
+            "mes": ultima_data.month,
+            "data_inicio": data_inicio.isoformat(),
+            "data_fim": data_fim.isoformat()
+        }
+        return periodo, await _relatorio_cacheado(periodo["data_inicio"], periodo["data_fim"], "")
+    
+    async def recentes():
+        colunas, _ = _colunas_lancamentos(DASHBOARD_CAMPOS)
+        lancamentos, _ = await _lancamentos.listar(colunas, desde, None, None, limite=limite)
+        return [_com_percentual_perdas(lanc) for lanc in lancamentos]
+    
+    try:
+        (periodo, relatorio), lancamentos = await asyncio.gather(periodo_e_relatorio(), recentes())
+        return {
+            "periodo_referencia": periodo,
+            "relatorio": relatorio,
+            "lancamentos_recentes": lancamentos
         }
-        
-        return relatorio
     except Exception as e:
-        logger.error(f"Error generating report: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        logger.error(f"Error loading dashboard: {e}")
+        raise _erro_http(e)
+
+# ==================== STREAM (SSE) ====================
+# GET /api/stream/lancamentos empurra aos dashboards cada lançamento criado,
+# alterado ou excluído, com os totais atualizados do mês, no lugar do polling.
+# Cada assinante é uma fila em memória: uma conexão ociosa custa a fila e um
+# heartbeat a cada SSE_HEARTBEAT segundos. Sem SSE_BROKER_URL os eventos valem
+# para o worker que recebeu a escrita; com SSE_BROKER_URL=redis://... passam
+# pelo pub/sub do Redis e chegam aos assinantes de todos os workers. Na Vercel
+# (api/index.py) não há conexões longas e o frontend continua no polling.
+SSE_BROKER_URL = os.environ.get('SSE_BROKER_URL')
+SSE_MAX_ASSINANTES = int(os.environ.get('SSE_MAX_ASSINANTES', '500'))
+SSE_FILA_MAX = int(os.environ.get('SSE_FILA_MAX', '64'))
+SSE_HISTORICO = int(os.environ.get('SSE_HISTORICO', '256'))
+SSE_HEARTBEAT = float(os.environ.get('SSE_HEARTBEAT', '25'))
+SSE_RETRY_MS = int(os.environ.get('SSE_RETRY_MS', '3000'))
+# Campos do relatório mensal que acompanham cada evento
+SSE_CAMPOS_TOTAIS = ("producao_total", "perdas_total", "percentual_perdas", "dias_produzidos", "media_diaria")
+
+def _mensagem_sse(dados: dict, evento_id: Optional[str] = None) -> bytes:
+    linhas = [f"id: {evento_id}"] if evento_id else []
+    linhas += ["event: lancamento", "data: " + json.dumps(dados, ensure_ascii=False, default=str)]
+    return ("\n".join(linhas) + "\n\n").encode("utf-8")
+
+# Sem id: o cliente relê os lançamentos (delta sync) e os totais
+_SSE_RECARREGAR = _mensagem_sse({"tipo": "recarregar"})
+
+
+class _BrokerLancamentos:
+    """In-process fan-out of lancamentos events to the SSE subscribers of this worker"""
+
+    def __init__(self, fila_max: int, historico: int):
+        self._fila_max = max(fila_max, 1)
+        self._assinantes = set()
+        # Últimos eventos (id, mensagem), para quem reconecta com Last-Event-ID
+        self._historico = deque(maxlen=historico)
+        self._instancia = uuid.uuid4().hex[:8]
+        self._sequencia = itertools.count(1)
+
+    def __len__(self) -> int:
+        return len(self._assinantes)
+
+    def tem_assinantes(self) -> bool:
+        return bool(self._assinantes)
+
+    def assinar(self, ultimo_id: Optional[str] = None) -> asyncio.Queue:
+        """Register a subscriber, replaying what it missed since ``ultimo_id``"""
+        fila = asyncio.Queue(maxsize=self._fila_max)
+        if ultimo_id:
+            ids = [evento_id for evento_id, _ in self._historico]
+            perdidas = [m for _, m in list(self._historico)[ids.index(ultimo_id) + 1:]] if ultimo_id in ids else None
+            if perdidas is None or len(perdidas) >= self._fila_max:
+                fila.put_nowait(_SSE_RECARREGAR)
+            else:
+                for mensagem in perdidas:
+                    fila.put_nowait(mensagem)
+        self._assinantes.add(fila)
+        _metrica_sse_assinantes.inc(1)
+        return fila
+
+    def cancelar(self, fila: asyncio.Queue):
+        if fila in self._assinantes:
+            self._assinantes.discard(fila)
+            _metrica_sse_assinantes.inc(-1)
+
+    def lacuna(self):
+        """Forget the history: an event was skipped, so nobody can resume past it"""
+        self._historico.clear()
+
+    async def publicar(self, dados: dict):
+        self.entregar(f"{self._instancia}-{next(self._sequencia)}", dados)
+
+    def entregar(self, evento_id: str, dados: dict):
+        # Serializado uma vez para todos os assinantes
+        mensagem = _mensagem_sse(dados, evento_id)
+        self._historico.append((evento_id, mensagem))
+        for fila in self._assinantes:
+            self._enfileirar(fila, mensagem)
+
+    def ressincronizar(self):
+        """Tell every subscriber to reload: events may have been lost"""
+        self.lacuna()
+        for fila in self._assinantes:
+            self._enfileirar(fila, _SSE_RECARREGAR)
+
+    def _enfileirar(self, fila: asyncio.Queue, mensagem: bytes):
+        try:
+            fila.put_nowait(mensagem)
+        except asyncio.QueueFull:
+            # Assinante lento: o que estava na fila vira um único "recarregar"
+            _metrica_sse_descartados.inc(fila.qsize())
+            while not fila.empty():
+                fila.get_nowait()
+            fila.put_nowait(_SSE_RECARREGAR)
+
+    async def iniciar(self):
+        pass
+
+    async def fechar(self):
+        pass
+
+
+class _BrokerLancamentosRedis(_BrokerLancamentos):
+    """Broker relaying events through Redis pub/sub to the subscribers of every worker"""
+
+    CANAL = "forte:lancamentos"
+
+    def __init__(self, url: str, fila_max: int, historico: int):
+        super().__init__(fila_max, historico)
+        import redis.asyncio
+        self._redis = redis.asyncio.Redis.from_url(url, socket_connect_timeout=0.5)
+        self._ouvinte = None
+
+    def tem_assinantes(self) -> bool:
+        return True  # os assinantes dos outros workers não são visíveis daqui
+
+    async def publicar(self, dados: dict):
+        evento_id = f"{self._instancia}-{next(self._sequencia)}"
+        try:
+            await self._redis.publish(self.CANAL, json.dumps({"id": evento_id, "dados": dados}, default=str))
+        except Exception as e:
+            logger.warning(f"SSE broker unavailable, delivering to this worker only: {e}")
+            self.entregar(evento_id, dados)
+
+    async def iniciar(self):
+        self._ouvinte = asyncio.ensure_future(self._ouvir())
+
+    async def _ouvir(self):
+        while True:
+            try:
+                async with self._redis.pubsub() as pubsub:
+                    await pubsub.subscribe(self.CANAL)
+                    async for mensagem in pubsub.listen():
+                        if mensagem["type"] == "message":
+                            evento = json.loads(mensagem["data"])
+                            self.entregar(evento["id"], evento["dados"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"SSE broker subscription lost: {e}")
+                # O que foi publicado durante a queda não chegou aqui
+                self.ressincronizar()
+                await asyncio.sleep(1)
+
+    async def fechar(self):
+        if self._ouvinte is not None:
+            self._ouvinte.cancel()
+        await self._redis.close()
+
+
+def _criar_broker_lancamentos():
+    if SSE_BROKER_URL:
+        try:
+            return _BrokerLancamentosRedis(SSE_BROKER_URL, SSE_FILA_MAX, SSE_HISTORICO)
+        except ImportError:
+            logging.getLogger(__name__).warning("redis package not installed, using in-process SSE broker")
+    return _BrokerLancamentos(SSE_FILA_MAX, SSE_HISTORICO)
+
+
+_broker_lancamentos = _criar_broker_lancamentos()
+
+@app.on_event("startup")
+async def iniciar_broker():
+    await _broker_lancamentos.iniciar()
+
+@app.on_event("shutdown")
+async def fechar_broker():
+    await _broker_lancamentos.fechar()
+
+
+def _mes_da_data(data) -> tuple:
+    dia = date.fromisoformat(str(data)[:10])
+    return dia.replace(day=1).isoformat(), dia.replace(day=calendar.monthrange(dia.year, dia.month)[1]).isoformat()
+
+
+async def _totais_meses(datas) -> list:
+    """Totals of each month touched by a write, from the (cached) monthly report"""
+    meses = sorted({_mes_da_data(d) for d in datas if d})
+    relatorios = await asyncio.gather(*[_relatorio_cacheado(inicio, fim, "") for inicio, fim in meses])
+    return [
+        {"mes": inicio[:7], **{campo: relatorio[campo] for campo in SSE_CAMPOS_TOTAIS}}
+        for (inicio, _), relatorio in zip(meses, relatorios)
+    ]
+
+
+# Publicações em andamento (referência forte até terminarem); o lock mantém a
+# ordem das escritas, já que o cálculo dos totais tem duração variável
+_publicacoes = set()
+_publicacoes_lock = asyncio.Lock()
+
+
+def _publicar_lancamento(tipo: str, lancamento: Optional[dict] = None, *datas):
+    """Publish a committed lancamentos write to the SSE stream, in the background.
+
+    ``tipo`` is criado, atualizado, removido or recarregar (many rows at once).
+    The write's response never waits for the event or fails because of it.
+    """
+    if not _broker_lancamentos.tem_assinantes():
+        _broker_lancamentos.lacuna()
+        return
+    tarefa = asyncio.ensure_future(_enviar_lancamento(tipo, lancamento, datas))
+    _publicacoes.add(tarefa)
+    tarefa.add_done_callback(_publicacoes.discard)
+
+
+async def _enviar_lancamento(tipo: str, lancamento: Optional[dict], datas: tuple):
+    _perfil_atual.set(None)  # a tarefa herda o contexto da requisição de escrita
+    _metrica_sse_publicados.inc(1, tipo)
+    dados = {"tipo": tipo}
+    if lancamento is not None:
+        dados["lancamento"] = _com_percentual_perdas(lancamento) if tipo != "removido" else lancamento
+    async with _publicacoes_lock:
+        try:
+            if datas:
+                dados["totais_mes"] = await _totais_meses(datas)
+        except Exception as e:
+            # Sem os totais o cliente recarrega o dashboard
+            logger.warning(f"Monthly totals unavailable for SSE event: {e}")
+        try:
+            await _broker_lancamentos.publicar(dados)
+        except Exception as e:
+            logger.error(f"Error publishing SSE event: {e}")
+            _broker_lancamentos.lacuna()
+
+
+@api_router.get("/stream/lancamentos")
+async def stream_lancamentos(request: Request, last_event_id: Optional[str] = Header(None)):
+    """Server-Sent Events for every lancamento created, updated or deleted.
+
+    Each ``lancamento`` event carries ``tipo`` (criado, atualizado, removido),
+    the row (only ``id`` and ``data`` when removed) and ``totais_mes`` with
+    the updated totals of the affected months. ``tipo: recarregar`` means
+    events were skipped and the client should resync. Reconnections with
+    ``Last-Event-ID`` replay the events missed in between.
+    """
+    if len(_broker_lancamentos) >= SSE_MAX_ASSINANTES:
+        raise HTTPException(
+            status_code=503,
+            detail="Limite de conexões de atualização atingido",
+            headers={"Retry-After": str(max(SSE_RETRY_MS // 1000, 1))}
+        )
+    fila = _broker_lancamentos.assinar(last_event_id)
+
+    async def eventos():
+        try:
+            yield f"retry: {SSE_RETRY_MS}\n\n".encode()
+            while True:
+                try:
+                    yield await asyncio.wait_for(fila.get(), SSE_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    # O comentário mantém proxies e balanceadores com a conexão aberta
+                    if await request.is_disconnected():
+                        break
+                    yield b": ping\n\n"
+        finally:
+            _broker_lancamentos.cancelar(fila)
+
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Compressão das respostas: brotli ou gzip, conforme o Accept-Encoding, para
+# corpos a partir de COMPRESSAO_MIN_BYTES (listagens completas passam de MBs)
+COMPRESSAO_MIN_BYTES = int(os.environ.get('COMPRESSAO_MIN_BYTES', '1024'))
+COMPRESSAO_NIVEL_GZIP = int(os.environ.get('COMPRESSAO_NIVEL_GZIP', '6'))
+COMPRESSAO_NIVEL_BROTLI = int(os.environ.get('COMPRESSAO_NIVEL_BROTLI', '4'))
+# Já comprimidos (xlsx é zip) ou que não podem esperar o buffer do compressor
+COMPRESSAO_TIPOS_IGNORADOS = ("text/event-stream", "image/", "application/zip", "application/vnd.openxmlformats")
+# Corpos maiores que isto são comprimidos fora do event loop
+COMPRESSAO_THREAD_BYTES = 64 * 1024
+
+def _escolher_codificacao(accept_encoding: str) -> Optional[str]:
+    """Pick 'br' or 'gzip' from an Accept-Encoding header, honouring q-values"""
+    aceitas = {}
+    for parte in accept_encoding.lower().split(","):
+        nome, _, parametros = parte.strip().partition(";")
+        q = 1.0
+        if parametros.strip().startswith("q="):
+            try:
+                q = float(parametros.strip()[2:])
+            except ValueError:
+                q = 0.0
+        aceitas[nome.strip()] = q
+    curinga = aceitas.get("*", 0.0)
+    candidatas = [("br", aceitas.get("br", curinga))] if brotli is not None else []
+    candidatas.append(("gzip", aceitas.get("gzip", curinga)))
+    # max fica com a primeira em caso de empate: br antes de gzip
+    codificacao, q = max(candidatas, key=lambda c: c[1])
+    return codificacao if q > 0 else None
+
+def _compressor(codificacao: str):
+    """Return comprimir(dados, fim) for one brotli or gzip stream.
+
+    Until ``fim`` each call flushes what it compressed, so streamed bodies
+    (NDJSON export/import progress) still arrive chunk by chunk.
+    """
+    if codificacao == "br":
+        compressor = brotli.Compressor(quality=COMPRESSAO_NIVEL_BROTLI)
+        return lambda dados, fim: compressor.process(dados) + (compressor.finish() if fim else compressor.flush())
+    # wbits=31: formato gzip (cabeçalho e CRC)
+    compressor = zlib.compressobj(COMPRESSAO_NIVEL_GZIP, zlib.DEFLATED, 31)
+    return lambda dados, fim: compressor.compress(dados) + compressor.flush(zlib.Z_FINISH if fim else zlib.Z_SYNC_FLUSH)
+
+class CompressaoMiddleware:
+    """ASGI middleware compressing responses negotiated via Accept-Encoding.
+
+    Small bodies, responses that already carry a Content-Encoding and the
+    types in COMPRESSAO_TIPOS_IGNORADOS pass through unchanged.
+    """
+
+    def __init__(self, app, minimo: int = COMPRESSAO_MIN_BYTES):
+        self.app = app
+        self.minimo = minimo
+
+    async def __call__(self, scope, receive, send):
+        codificacao = None
+        if scope["type"] == "http":
+            codificacao = _escolher_codificacao(Headers(scope=scope).get("accept-encoding", ""))
+        if codificacao is None:
+            await self.app(scope, receive, send)
+            return
+
+        inicio = None
+        comprimir = None
+
+        async def enviar(mensagem):
+            nonlocal inicio, comprimir
+            if mensagem["type"] == "http.response.start":
+                inicio = mensagem
+                return
+            if mensagem["type"] != "http.response.body":
+                await send(mensagem)
+                return
+
+            corpo = mensagem.get("body", b"")
+            mais = mensagem.get("more_body", False)
+            if inicio is not None:
+                # Primeiro pedaço do corpo: decide se comprime
+                mensagem_inicio, inicio = inicio, None
+                headers = MutableHeaders(raw=mensagem_inicio["headers"])
+                tipo = headers.get("content-type", "")
+                if (
+                    "content-encoding" in headers
+                    or tipo.startswith(COMPRESSAO_TIPOS_IGNORADOS)
+                    or (not mais and len(corpo) < self.minimo)
+                ):
+                    await send(mensagem_inicio)
+                    await send(mensagem)
+                    return
+                comprimir = _compressor(codificacao)
+                headers["Content-Encoding"] = codificacao
+                headers.add_vary_header("Accept-Encoding")
+                del headers["content-length"]
+                corpo = await self._comprimir(comprimir, corpo, not mais)
+                if not mais:
+                    headers["Content-Length"] = str(len(corpo))
+                await send(mensagem_inicio)
+                await send({"type": "http.response.body", "body": corpo, "more_body": mais})
+                return
+
+            if comprimir is not None:
+                corpo = await self._comprimir(comprimir, corpo, not mais)
+            await send({"type": "http.response.body", "body": corpo, "more_body": mais})
+
+        await self.app(scope, receive, enviar)
+
+    @staticmethod
+    async def _comprimir(comprimir, corpo: bytes, fim: bool) -> bytes:
+        if len(corpo) >= COMPRESSAO_THREAD_BYTES:
+            return await anyio.to_thread.run_sync(comprimir, corpo, fim)
+        return comprimir(corpo, fim)
+
+class MetricasMiddleware:
+    """ASGI middleware timing every request by method, route template and status"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        inicio = time.perf_counter()
+        status = 500
+
+        async def enviar(mensagem):
+            nonlocal status
+            if mensagem["type"] == "http.response.start":
+                status = mensagem["status"]
+            await send(mensagem)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            # O template da rota (/api/lancamentos/{lancamento_id}) mantém os rótulos finitos
+            rota = getattr(scope.get("route"), "path", None) or "unmatched"
+            _metrica_http.observar(time.perf_counter() - inicio, scope["method"], rota, str(status))
+
+@app.get("/metrics", include_in_schema=False)
+@api_router.get("/metrics", include_in_schema=False)
+async def exportar_metricas(authorization: Optional[str] = Header(None)):
+    """Prometheus metrics; requires ``Authorization: Bearer <METRICAS_TOKEN>`` when set"""
+    if METRICAS_TOKEN and not hmac.compare_digest(authorization or "", f"Bearer {METRICAS_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Token de métricas inválido")
+    return Response(content=_exportar_metricas(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@api_router.get("/profiles/{perfil_id}", include_in_schema=False)
+async def obter_perfil(perfil_id: str, formato: str = "json", x_profile: Optional[str] = Header(None)):
+    """Profile of a request made with ``X-Profile``: stage breakdown and collapsed stacks.
+
+    ``formato=folded`` returns only the stacks, ready for flamegraph.pl or speedscope.
+    """
+    if not _token_profiler_valido(x_profile):
+        raise HTTPException(status_code=401, detail="Token do profiler inválido")
+    with _perfis_lock:
+        perfil = _perfis.get(perfil_id)
+    if perfil is None:
+        raise HTTPException(status_code=404, detail="Perfil não encontrado")
+    if formato == "folded":
+        return Response(content=perfil.folded(), media_type="text/plain; charset=utf-8")
+    return perfil.resumo()
 
 # Include the router in the main app
 app.include_router(api_router)
@@ -519,8 +3211,12 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count", "X-Next-Cursor", "ETag", "Retry-After", "X-Stale"],
 )
 
+app.add_middleware(CompressaoMiddleware)
+app.add_middleware(MetricasMiddleware)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
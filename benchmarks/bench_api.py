@@ -0,0 +1,289 @@
+"""
+Benchmark dos caminhos críticos da API sobre um Supabase em memória.
+
+Popula benchmarks/fake_supabase.py com um volume configurável de
+lançamentos, dispara requisições concorrentes contra o app (FastAPI em
+backend/server.py ou Flask em api/index.py) sem rede nem servidor, e mede
+p50/p95/p99 e requisições por segundo de cada cenário. O resultado vai para
+um JSON em test_reports/bench/ para comparar entre commits.
+
+Uso:
+    python benchmarks/bench_api.py --alvo fastapi --lancamentos 10000 --itens 1-20
+    python benchmarks/bench_api.py --alvo flask --concorrencia 32 --comparar test_reports/bench/anterior.json
+
+O cache de relatórios fica desligado (RELATORIO_CACHE_MAX=0) para medir o
+cálculo; use --com-cache para medir o comportamento de produção.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from time import perf_counter
+
+from fake_supabase import FakeSupabase
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+TURNOS = ["Manhã", "Tarde", "Noite"]
+FORMATOS = [f"{l}x{a}" for l in (20, 25, 30, 35, 40, 45) for a in (30, 40, 50, 60, 70)][:30]
+CORES = ["Branca", "Preta", "Azul", "Verde", "Vermelha", "Amarela", "Cinza", "Rosa", "Laranja"] * 3
+REFERENCIAS = [f"OP-{n:04d}" for n in range(1, 41)] + [""]
+
+
+def _gerar_lancamento(rng, dia, itens_min, itens_max):
+    itens = [
+        {
+            "formato": rng.choice(FORMATOS),
+            "cor": rng.choice(CORES),
+            "pacote_kg": round(rng.uniform(5, 25), 2),
+            "producao_kg": round(rng.uniform(50, 800), 2)
+        }
+        for _ in range(rng.randint(itens_min, itens_max))
+    ]
+    orelha, aparas = round(rng.uniform(0, 30), 2), round(rng.uniform(0, 30), 2)
+    return {
+        "id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "data": dia.isoformat(),
+        "turno": rng.choice(TURNOS),
+        "hora": f"{rng.randint(0, 23):02d}:{rng.choice((0, 15, 30, 45)):02d}",
+        "orelha_kg": orelha,
+        "aparas_kg": aparas,
+        "referencia_producao": rng.choice(REFERENCIAS),
+        "referencia_lote": f"L{rng.randint(1, 999):03d}",
+        "itens": itens,
+        "producao_total": sum(i["producao_kg"] for i in itens),
+        "perdas_total": orelha + aparas
+    }
+
+
+def popular(banco, total, itens_min, itens_max, seed):
+    """Seed lancamentos (three shifts a day, going back from today) and variaveis"""
+    rng = random.Random(seed)
+    hoje = date.today()
+    dias = max(total // 3, 1)
+    banco.criar_tabela("lancamentos", (
+        _gerar_lancamento(rng, hoje - timedelta(days=rng.randrange(dias)), itens_min, itens_max)
+        for _ in range(total)
+    ))
+    variaveis = [("turno", n) for n in TURNOS] + [("formato", n) for n in FORMATOS] + [("cor", n) for n in dict.fromkeys(CORES)]
+    banco.criar_tabela("variaveis", [
+        {"id": str(uuid.uuid4()), "tipo": tipo, "nome": nome, "ordem": i, "created_at": datetime.now().isoformat()}
+        for i, (tipo, nome) in enumerate(variaveis)
+    ])
+    banco.criar_tabela("users")
+    return dias
+
+
+def carregar_app(alvo, banco):
+    """Import the chosen app and point its Supabase client at the fake"""
+    os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+    os.environ.setdefault("SUPABASE_KEY", "bench.bench.bench")
+    if alvo == "fastapi":
+        sys.path.insert(0, str(ROOT_DIR / "backend"))
+        import server as modulo
+    else:
+        sys.path.insert(0, str(ROOT_DIR / "api"))
+        import index as modulo
+    modulo.supabase = banco
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    return modulo.app
+
+
+def montar_cenarios(banco, dias, rng):
+    hoje = date.today()
+    formatos = [v for v in banco.tabelas["variaveis"] if v["tipo"] == "formato"]
+
+    def mes_aleatorio():
+        inicio = (hoje - timedelta(days=rng.randrange(dias))).replace(day=1)
+        fim = (inicio + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        return inicio.isoformat(), fim.isoformat()
+
+    def listar():
+        return "GET", "/api/lancamentos?limit=100", None
+
+    def listar_periodo():
+        inicio, fim = mes_aleatorio()
+        return "GET", f"/api/lancamentos?limit=100&data_inicio={inicio}&data_fim={fim}&fields=data,hora,turno,referencia_producao,producao_total,perdas_total,percentual_perdas", None
+
+    def relatorio_mensal():
+        inicio, fim = mes_aleatorio()
+        return "GET", f"/api/relatorios?periodo=customizado&data_inicio={inicio}&data_fim={fim}", None
+
+    def relatorio_anual():
+        ano = hoje.year - rng.randrange(max(dias // 365, 1))
+        return "GET", f"/api/relatorios?periodo=customizado&data_inicio={ano}-01-01&data_fim={ano}-12-31", None
+
+    def criar():
+        lanc = _gerar_lancamento(rng, hoje - timedelta(days=rng.randrange(dias)), 1, 5)
+        corpo = {k: lanc[k] for k in ("data", "turno", "hora", "orelha_kg", "aparas_kg", "referencia_producao", "referencia_lote", "itens")}
+        return "POST", "/api/lancamentos", corpo
+
+    def reordenar():
+        ordem = formatos[:]
+        rng.shuffle(ordem)
+        return "PUT", "/api/variaveis/ordem", {"variaveis": [{"id": v["id"], "ordem": i} for i, v in enumerate(ordem)]}
+
+    return {
+        "listar_lancamentos": listar,
+        "listar_lancamentos_periodo": listar_periodo,
+        "gerar_relatorio_mensal": relatorio_mensal,
+        "gerar_relatorio_anual": relatorio_anual,
+        "criar_lancamento": criar,
+        "atualizar_ordem_variaveis": reordenar,
+    }
+
+
+async def _rodar_asgi(app, gerar, requisicoes, concorrencia):
+    import httpx
+
+    latencias, erros = [], 0
+    pendentes = iter(range(requisicoes))
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def trabalhador():
+            nonlocal erros
+            for _ in pendentes:
+                metodo, caminho, corpo = gerar()
+                inicio = perf_counter()
+                resposta = await client.request(metodo, caminho, json=corpo)
+                latencias.append(perf_counter() - inicio)
+                erros += resposta.status_code >= 400
+
+        inicio = perf_counter()
+        await asyncio.gather(*(trabalhador() for _ in range(concorrencia)))
+        return latencias, erros, perf_counter() - inicio
+
+
+def _rodar_wsgi(app, gerar, requisicoes, concorrencia):
+    latencias, erros = [], 0
+    pendentes = iter(range(requisicoes))
+    lock = threading.Lock()
+
+    def trabalhador():
+        nonlocal erros
+        client = app.test_client()
+        while True:
+            with lock:
+                if next(pendentes, None) is None:
+                    return
+                metodo, caminho, corpo = gerar()
+            inicio = perf_counter()
+            resposta = client.open(caminho, method=metodo, json=corpo)
+            resposta.get_data()
+            duracao = perf_counter() - inicio
+            with lock:
+                latencias.append(duracao)
+                erros += resposta.status_code >= 400
+
+    inicio = perf_counter()
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        for futuro in [executor.submit(trabalhador) for _ in range(concorrencia)]:
+            futuro.result()
+    return latencias, erros, perf_counter() - inicio
+
+
+def _percentil(ordenadas, p):
+    if not ordenadas:
+        return 0.0
+    indice = min(len(ordenadas) - 1, max(0, round(p / 100 * len(ordenadas) + 0.5) - 1))
+    return ordenadas[indice]
+
+
+def resumir(latencias, erros, duracao):
+    ordenadas = sorted(latencias)
+    return {
+        "requisicoes": len(latencias),
+        "erros": erros,
+        "p50_ms": round(_percentil(ordenadas, 50) * 1000, 3),
+        "p95_ms": round(_percentil(ordenadas, 95) * 1000, 3),
+        "p99_ms": round(_percentil(ordenadas, 99) * 1000, 3),
+        "rps": round(len(latencias) / duracao, 1) if duracao else 0.0
+    }
+
+
+def _commit_atual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def comparar(atual, anterior):
+    print(f"\nComparação com {anterior.get('commit')} ({anterior.get('timestamp')}):")
+    for nome, res in atual["resultados"].items():
+        base = anterior.get("resultados", {}).get(nome)
+        if not base:
+            continue
+        variacoes = []
+        for campo in ("p50_ms", "p95_ms", "rps"):
+            if base[campo]:
+                variacoes.append(f"{campo} {(res[campo] - base[campo]) / base[campo] * 100:+.1f}%")
+        print(f"   {nome:<28} " + "  ".join(variacoes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dos endpoints críticos da API")
+    parser.add_argument("--alvo", choices=("fastapi", "flask"), default="fastapi")
+    parser.add_argument("--lancamentos", type=int, default=10000)
+    parser.add_argument("--itens", default="1-20", help="faixa de itens por lançamento, ex.: 1-20")
+    parser.add_argument("--requisicoes", type=int, default=200, help="requisições por cenário")
+    parser.add_argument("--concorrencia", type=int, default=16)
+    parser.add_argument("--latencia-ms", type=float, default=2.0, help="latência simulada por chamada ao Supabase")
+    parser.add_argument("--cenarios", help="lista separada por vírgulas (padrão: todos)")
+    parser.add_argument("--com-cache", action="store_true", help="mantém o cache de relatórios ligado")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--saida", help="arquivo JSON de saída (padrão: test_reports/bench/...)")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior para comparar")
+    args = parser.parse_args()
+
+    if not args.com_cache:
+        os.environ["RELATORIO_CACHE_MAX"] = "0"
+    itens_min, itens_max = (int(n) for n in args.itens.split("-"))
+
+    banco = FakeSupabase(latencia_ms=args.latencia_ms)
+    print(f"📦 Populando {args.lancamentos} lançamentos com {args.itens} itens...")
+    dias = popular(banco, args.lancamentos, itens_min, itens_max, args.seed)
+    app = carregar_app(args.alvo, banco)
+
+    cenarios = montar_cenarios(banco, dias, random.Random(args.seed))
+    if args.cenarios:
+        cenarios = {nome: cenarios[nome] for nome in args.cenarios.split(",")}
+
+    resultado = {
+        "commit": _commit_atual(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("saida", "comparar")},
+        "resultados": {}
+    }
+    for nome, gerar in cenarios.items():
+        if args.alvo == "fastapi":
+            latencias, erros, duracao = asyncio.run(_rodar_asgi(app, gerar, args.requisicoes, args.concorrencia))
+        else:
+            latencias, erros, duracao = _rodar_wsgi(app, gerar, args.requisicoes, args.concorrencia)
+        res = resumir(latencias, erros, duracao)
+        resultado["resultados"][nome] = res
+        print(f"   {nome:<28} p50={res['p50_ms']:>9.2f}ms  p95={res['p95_ms']:>9.2f}ms  "
+              f"p99={res['p99_ms']:>9.2f}ms  rps={res['rps']:>8.1f}  erros={res['erros']}")
+
+    saida = Path(args.saida) if args.saida else (
+        ROOT_DIR / "test_reports" / "bench" / f"api_{args.alvo}_{datetime.now():%Y%m%d_%H%M%S}_{resultado['commit'] or 'local'}.json"
+    )
+    saida.parent.mkdir(parents=True, exist_ok=True)
+    saida.write_text(json.dumps(resultado, indent=2, ensure_ascii=False))
+    print(f"\n💾 Resultado salvo em {saida}")
+
+    if args.comparar:
+        comparar(resultado, json.loads(Path(args.comparar).read_text()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""
+Mede o cold start da função Python do Vercel (api/index.py): cada rodada sobe
+um interpretador novo, importa o app e faz a primeira e a segunda requisição
+de cada rota pelo test client do Flask.
+
+- import_ms: tempo do `import index` (dependências + corpo do módulo)
+- processo_ms: do spawn do interpretador até ele terminar
+- por rota: a primeira requisição (cria o cliente PostgREST e importa o que a
+  rota carrega sob demanda) e a segunda (instância quente)
+
+As consultas vão para um PostgREST falso em 127.0.0.1 que responde [] a tudo,
+então a primeira requisição inclui a conexão HTTP, mas não a latência do
+Supabase. Com --sem-bytecode cada rodada usa um PYTHONPYCACHEPREFIX vazio, como
+um deploy sem __pycache__, e paga a compilação dos .py.
+
+Uso:
+    python benchmarks/bench_cold_start.py
+    python benchmarks/bench_cold_start.py --rodadas 20 --sem-bytecode --importtime
+    python benchmarks/bench_cold_start.py --comparar test_reports/bench/cold_start_anterior.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from time import perf_counter
+
+from bench_api import ROOT_DIR, _commit_atual, _percentil
+
+ROTAS = "/api,/api/variaveis,/api/lancamentos?limit=10,/api/relatorios"
+
+# Roda no interpretador novo; a configuração chega como JSON em argv[1]
+FILHO = """
+import json, sys, time
+config = json.loads(sys.argv[1])
+inicio = time.perf_counter()
+sys.path.insert(0, config["api"])
+import index
+resultado = {"import_ms": (time.perf_counter() - inicio) * 1000, "rotas": {}}
+cliente = index.app.test_client()
+for rota in config["rotas"]:
+    tempos = []
+    for _ in range(2):
+        t = time.perf_counter()
+        resposta = cliente.get(rota)
+        tempos.append((time.perf_counter() - t) * 1000)
+    resultado["rotas"][rota] = {"status": resposta.status_code, "primeira_ms": tempos[0], "segunda_ms": tempos[1]}
+print(json.dumps(resultado))
+"""
+
+
+class _PostgrestFalso(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Cabeçalho e corpo num único envio, sem esperar o ACK atrasado do cliente
+    disable_nagle_algorithm = True
+    wbufsize = 64 * 1024
+
+    def _responder(self):
+        tamanho = int(self.headers.get("Content-Length") or 0)
+        if tamanho:
+            self.rfile.read(tamanho)
+        corpo = b"[]"
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Range", "*/0")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(corpo)
+
+    do_GET = do_POST = do_PATCH = do_DELETE = do_HEAD = _responder
+
+    def log_message(self, *args):
+        pass
+
+
+def rodar(config, env):
+    inicio = perf_counter()
+    processo = subprocess.run(
+        [sys.executable, "-c", FILHO, json.dumps(config)], env=env, capture_output=True, text=True
+    )
+    processo_ms = (perf_counter() - inicio) * 1000
+    if processo.returncode != 0:
+        raise RuntimeError(processo.stderr.strip().splitlines()[-1] if processo.stderr else "falhou")
+    # O app imprime avisos no stdout; o resultado é a última linha
+    resultado = json.loads(processo.stdout.strip().splitlines()[-1])
+    resultado["processo_ms"] = processo_ms
+    return resultado
+
+
+def resumir(valores):
+    ordenados = sorted(valores)
+    return {
+        "p50_ms": round(statistics.median(ordenados), 2),
+        "p95_ms": round(_percentil(ordenados, 95), 2),
+        "min_ms": round(ordenados[0], 2)
+    }
+
+
+def importtime(env, topo):
+    """Modules with the largest cumulative import time (python -X importtime)"""
+    processo = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import index"],
+        env=env, cwd=ROOT_DIR / "api", capture_output=True, text=True
+    )
+    modulos = []
+    for linha in processo.stderr.splitlines():
+        if not linha.startswith("import time:") or "cumulative" in linha:
+            continue
+        _, proprio, cumulativo, nome = (parte.strip() for parte in linha.replace("import time:", "|").split("|"))
+        modulos.append((int(cumulativo), int(proprio), nome))
+    return sorted(modulos, reverse=True)[:topo]
+
+
+def comparar(atual, anterior):
+    print(f"\nComparação com {anterior.get('commit')} ({anterior.get('timestamp')}):")
+    for nome, res in atual["resultados"].items():
+        base = anterior.get("resultados", {}).get(nome)
+        if base and base["p50_ms"]:
+            print(f"   {nome:<42} p50 {(res['p50_ms'] - base['p50_ms']) / base['p50_ms'] * 100:+.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start de api/index.py (Vercel)")
+    parser.add_argument("--rodadas", type=int, default=10, help="interpretadores novos por medição")
+    parser.add_argument("--rotas", default=ROTAS, help="rotas GET separadas por vírgulas")
+    parser.add_argument("--sem-bytecode", action="store_true", help="cada rodada compila os .py do zero")
+    parser.add_argument("--importtime", action="store_true", help="lista os módulos mais lentos de importar")
+    parser.add_argument("--saida", help="arquivo JSON de saída (padrão: test_reports/bench/...)")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior para comparar")
+    args = parser.parse_args()
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), _PostgrestFalso)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    env = {
+        **os.environ,
+        "SUPABASE_URL": f"http://127.0.0.1:{servidor.server_port}",
+        "SUPABASE_KEY": "bench.bench.bench",
+        "RELATORIO_CACHE_MAX": "0"
+    }
+    config = {"api": str(ROOT_DIR / "api"), "rotas": args.rotas.split(",")}
+
+    # Uma rodada descartada grava os .pyc (e aquece o cache de disco do SO)
+    rodar(config, env)
+    rodadas = []
+    for _ in range(args.rodadas):
+        if args.sem_bytecode:
+            with tempfile.TemporaryDirectory() as cache:
+                rodadas.append(rodar(config, {**env, "PYTHONPYCACHEPREFIX": cache}))
+        else:
+            rodadas.append(rodar(config, env))
+    servidor.shutdown()
+
+    medidas = {"import": [r["import_ms"] for r in rodadas], "processo": [r["processo_ms"] for r in rodadas]}
+    for rota in config["rotas"]:
+        medidas[f"{rota} primeira"] = [r["rotas"][rota]["primeira_ms"] for r in rodadas]
+        medidas[f"{rota} segunda"] = [r["rotas"][rota]["segunda_ms"] for r in rodadas]
+    resultado = {
+        "commit": _commit_atual(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("saida", "comparar")},
+        "status": {rota: rodadas[-1]["rotas"][rota]["status"] for rota in config["rotas"]},
+        "resultados": {nome: resumir(valores) for nome, valores in medidas.items()}
+    }
+
+    print(f"🧊 {args.rodadas} cold starts{' sem bytecode' if args.sem_bytecode else ''}")
+    for nome, res in resultado["resultados"].items():
+        print(f"   {nome:<42} p50={res['p50_ms']:>9.2f}ms  p95={res['p95_ms']:>9.2f}ms  min={res['min_ms']:>9.2f}ms")
+    for rota, status in resultado["status"].items():
+        if status >= 400:
+            print(f"⚠️  {rota} respondeu {status}")
+
+    if args.importtime:
+        print("\nMódulos mais lentos de importar (cumulativo / próprio):")
+        for cumulativo, proprio, nome in importtime(env, 15):
+            print(f"   {cumulativo / 1000:>8.1f}ms {proprio / 1000:>8.1f}ms  {nome}")
+
+    saida = Path(args.saida) if args.saida else (
+        ROOT_DIR / "test_reports" / "bench" / f"cold_start_{datetime.now():%Y%m%d_%H%M%S}_{resultado['commit'] or 'local'}.json"
+    )
+    saida.parent.mkdir(parents=True, exist_ok=True)
+    saida.write_text(json.dumps(resultado, indent=2, ensure_ascii=False))
+    print(f"\n💾 Resultado salvo em {saida}")
+
+    if args.comparar:
+        comparar(resultado, json.loads(Path(args.comparar).read_text()))
+
+
+if __name__ == "__main__":
+    main()
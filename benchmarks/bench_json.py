@@ -0,0 +1,120 @@
+"""
+Mede a serialização JSON e a compressão da listagem completa de lançamentos
+(GET /api/lancamentos sem limit) nos dois backends.
+
+- codificação: FastAPI antes (jsonable_encoder + JSONResponse) e agora
+  (ORJSONResponse direto); Flask antes (provider JSON padrão) e agora (orjson)
+- bytes na rede: corpo sem compressão, gzip e brotli, com o tempo de compressão
+  nos níveis configurados no servidor
+
+Uso:
+    python benchmarks/bench_json.py
+    python benchmarks/bench_json.py --volumes 1000,20000 --itens 1-20 --saida json.json
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+from time import perf_counter
+
+from bench_api import ROOT_DIR, _gerar_lancamento
+
+
+def carregar():
+    os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+    os.environ.setdefault("SUPABASE_KEY", "bench.bench.bench")
+    sys.path.insert(0, str(ROOT_DIR / "backend"))
+    sys.path.insert(0, str(ROOT_DIR / "api"))
+    import server
+    import index
+    return server, index
+
+
+def medir(funcao, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = perf_counter()
+        resultado = funcao()
+        tempos.append(perf_counter() - inicio)
+    return statistics.median(tempos) * 1000, resultado
+
+
+def codificadores(server, index):
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from flask.json.provider import DefaultJSONProvider
+
+    padrao_flask = DefaultJSONProvider(index.app)
+    candidatos = {
+        "fastapi_antes": lambda dados: JSONResponse(jsonable_encoder(dados)).body,
+        "flask_antes": lambda dados: padrao_flask.dumps(dados, separators=(",", ":")).encode(),
+    }
+    if server.RespostaJSON is not JSONResponse:
+        candidatos["fastapi_agora"] = lambda dados: server.RespostaJSON(dados).body
+    if index.orjson is not None:
+        candidatos["flask_agora"] = lambda dados: index.app.json.dumps(dados, separators=(",", ":")).encode()
+    return candidatos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serialização JSON e compressão da listagem de lançamentos")
+    parser.add_argument("--volumes", default="1000,10000,50000", help="lançamentos na listagem")
+    parser.add_argument("--itens", default="1-8", help="faixa de itens por lançamento, ex.: 1-8")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--saida", help="grava os resultados em JSON")
+    args = parser.parse_args()
+
+    server, index = carregar()
+    itens_min, itens_max = (int(n) for n in args.itens.split("-"))
+    rng = random.Random(args.seed)
+    hoje = date.today()
+    candidatos = codificadores(server, index)
+    codificacoes = ["gzip"] + (["br"] if server.brotli is not None else [])
+    if server.brotli is None:
+        print("⚠️  brotli não instalado, medindo só gzip")
+
+    resultados = []
+    for volume in (int(v) for v in args.volumes.split(",")):
+        dados = [
+            server._com_percentual_perdas(_gerar_lancamento(rng, hoje - timedelta(days=rng.randrange(730)), itens_min, itens_max))
+            for _ in range(volume)
+        ]
+        resultado = {"lancamentos": volume, "codificacao_ms": {}, "bytes": {}, "compressao_ms": {}}
+        corpo = None
+        for nome, codificar in candidatos.items():
+            ms, saida = medir(lambda: codificar(dados), args.repeticoes)
+            if json.loads(saida) != dados:
+                print(f"❌ {nome}: JSON diferente dos dados com {volume} lançamentos")
+                return 1
+            resultado["codificacao_ms"][nome] = round(ms, 2)
+            corpo = corpo or saida
+        resultado["bytes"]["sem_compressao"] = len(corpo)
+        for codificacao in codificacoes:
+            ms, comprimido = medir(lambda: server._compressor(codificacao)(corpo, True), args.repeticoes)
+            resultado["bytes"][codificacao] = len(comprimido)
+            resultado["compressao_ms"][codificacao] = round(ms, 2)
+        resultados.append(resultado)
+
+        print(f"\n📦 {volume} lançamentos")
+        for nome, ms in resultado["codificacao_ms"].items():
+            print(f"   {nome:<14} {ms:>9.2f} ms")
+        print(f"   {'sem compressão':<14} {len(corpo) / 1024:>9.1f} KiB")
+        for codificacao in codificacoes:
+            tamanho = resultado["bytes"][codificacao]
+            print(
+                f"   {codificacao:<14} {tamanho / 1024:>9.1f} KiB  ({tamanho / len(corpo):.1%} do corpo, "
+                f"{resultado['compressao_ms'][codificacao]:.2f} ms)"
+            )
+
+    if args.saida:
+        Path(args.saida).write_text(json.dumps({"config": vars(args), "resultados": resultados}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
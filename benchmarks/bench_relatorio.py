@@ -0,0 +1,234 @@
+"""
+Mede a agregação dos relatórios em Python (_agregar_lancamentos de
+backend/server.py) para vários volumes de lançamentos, comparando com:
+
+- referencia: o laço original, antes de montar a chave "formato - cor" só uma
+  vez por par; a saída do servidor tem de ser idêntica a dele (valores, floats
+  bit a bit e ordem das chaves)
+- colunar: as mesmas linhas carregadas em colunas (itens achatados) e
+  agrupadas com numpy (np.bincount soma cada grupo na ordem das linhas, então
+  a saída também é idêntica)
+
+O resultado mostra a partir de quantas linhas a versão colunar venceria o
+laço. Com as linhas chegando como dicts (JSON do PostgREST ou registros do
+asyncpg), montar as colunas já custa tanto quanto o laço inteiro.
+
+Uso:
+    python benchmarks/bench_relatorio.py
+    python benchmarks/bench_relatorio.py --volumes 1000,10000,100000 --itens 1-20 --saida relatorio.json
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+from time import perf_counter
+
+from bench_api import ROOT_DIR, _gerar_lancamento
+
+
+def carregar_servidor():
+    os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+    os.environ.setdefault("SUPABASE_KEY", "bench.bench.bench")
+    sys.path.insert(0, str(ROOT_DIR / "backend"))
+    import server
+    return server
+
+
+def agregar_referencia(lancamentos):
+    producao_total = 0
+    perdas_total = 0
+    dias_unicos = set()
+    stats_ref = {}
+    stats_itens = {}
+
+    for lanc in lancamentos:
+        prod_lanc = float(lanc.get('producao_total') or 0)
+        perd_lanc = float(lanc.get('perdas_total') or 0)
+        ref = lanc.get('referencia_producao') or 'Sem Referência'
+
+        producao_total += prod_lanc
+        perdas_total += perd_lanc
+        dias_unicos.add(lanc['data'])
+
+        if ref not in stats_ref:
+            stats_ref[ref] = {"prod": 0, "perd": 0, "dias": set()}
+        stats_ref[ref]["prod"] += prod_lanc
+        stats_ref[ref]["perd"] += perd_lanc
+        stats_ref[ref]["dias"].add(lanc['data'])
+
+        itens_lanc = lanc.get('itens', [])
+        if isinstance(itens_lanc, list):
+            for item in itens_lanc:
+                formato = item.get('formato', 'N/A')
+                cor = item.get('cor', 'N/A')
+                chave_item = f"{formato} - {cor}"
+                prod_item = float(item.get('producao_kg') or 0)
+
+                if chave_item not in stats_itens:
+                    stats_itens[chave_item] = {"formato": formato, "cor": cor, "producao": 0}
+                stats_itens[chave_item]["producao"] += prod_item
+
+    return {
+        "lancamentos": len(lancamentos),
+        "producao": producao_total,
+        "perdas": perdas_total,
+        "dias": len(dias_unicos),
+        "por_referencia": {
+            ref: {"prod": s["prod"], "perd": s["perd"], "dias": len(s["dias"])}
+            for ref, s in stats_ref.items()
+        },
+        "por_item": stats_itens
+    }
+
+
+def _fatorar(valores, np):
+    """Códigos por ordem de primeira ocorrência e os valores distintos"""
+    distintos = list(dict.fromkeys(valores))
+    indice = {valor: codigo for codigo, valor in enumerate(distintos)}
+    return np.fromiter(map(indice.__getitem__, valores), dtype=np.intp, count=len(valores)), distintos
+
+
+def agregar_colunar(lancamentos):
+    import numpy as np
+
+    # Colunas: uma passada pelas linhas, itens achatados
+    datas, refs, prods, perds = [], [], [], []
+    formatos, cores, prods_itens = [], [], []
+    for lanc in lancamentos:
+        datas.append(lanc['data'])
+        refs.append(lanc.get('referencia_producao') or 'Sem Referência')
+        prods.append(float(lanc.get('producao_total') or 0))
+        perds.append(float(lanc.get('perdas_total') or 0))
+        itens_lanc = lanc.get('itens', [])
+        if isinstance(itens_lanc, list):
+            for item in itens_lanc:
+                formatos.append(item.get('formato', 'N/A'))
+                cores.append(item.get('cor', 'N/A'))
+                prods_itens.append(float(item.get('producao_kg') or 0))
+
+    total = len(lancamentos)
+    prod = np.array(prods, dtype=np.float64)
+    perd = np.array(perds, dtype=np.float64)
+    cod_datas, distintas_datas = _fatorar(datas, np)
+    cod_refs, distintas_refs = _fatorar(refs, np)
+    n_refs, n_datas = len(distintas_refs), len(distintas_datas)
+    prod_ref = np.bincount(cod_refs, weights=prod, minlength=n_refs).tolist()
+    perd_ref = np.bincount(cod_refs, weights=perd, minlength=n_refs).tolist()
+    pares_ref_dia = np.unique(cod_refs * n_datas + cod_datas)
+    dias_ref = np.bincount(pares_ref_dia // max(n_datas, 1), minlength=n_refs).tolist()
+
+    por_item = {}
+    if formatos:
+        # Pares (formato, cor) por primeira ocorrência; a chave só é montada por par distinto
+        cod_formatos, _ = _fatorar(formatos, np)
+        cod_cores, distintas_cores = _fatorar(cores, np)
+        _, primeiros, inversos = np.unique(
+            cod_formatos * len(distintas_cores) + cod_cores, return_index=True, return_inverse=True
+        )
+        ordem = np.argsort(primeiros, kind="stable")
+        posicao = np.empty_like(ordem)
+        posicao[ordem] = np.arange(len(ordem))
+        primeiros = primeiros[ordem].tolist()
+        chaves = [f"{formatos[i]} - {cores[i]}" for i in primeiros]
+        cod_chave_do_par, distintas_chaves = _fatorar(chaves, np)
+        soma = np.bincount(
+            cod_chave_do_par[posicao[inversos.ravel()]],
+            weights=np.array(prods_itens, dtype=np.float64),
+            minlength=len(distintas_chaves)
+        ).tolist()
+        primeira_linha = {}
+        for chave, i in zip(chaves, primeiros):
+            primeira_linha.setdefault(chave, i)
+        for codigo, chave in enumerate(distintas_chaves):
+            i = primeira_linha[chave]
+            por_item[chave] = {"formato": formatos[i], "cor": cores[i], "producao": soma[codigo]}
+
+    zeros = np.zeros(total, dtype=np.intp)
+    return {
+        "lancamentos": total,
+        "producao": np.bincount(zeros, weights=prod, minlength=1)[0].item() if total else 0,
+        "perdas": np.bincount(zeros, weights=perd, minlength=1)[0].item() if total else 0,
+        "dias": n_datas,
+        "por_referencia": {
+            ref: {"prod": prod_ref[codigo], "perd": perd_ref[codigo], "dias": dias_ref[codigo]}
+            for codigo, ref in enumerate(distintas_refs)
+        },
+        "por_item": por_item
+    }
+
+
+def medir(funcao, linhas, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = perf_counter()
+        resultado = funcao(linhas)
+        tempos.append(perf_counter() - inicio)
+    return statistics.median(tempos), resultado
+
+
+def _identico(a, b):
+    # repr de float é exato (ida e volta) e o de dict segue a ordem das chaves
+    return repr(a) == repr(b)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Agregação dos relatórios: laço Python x colunar (numpy)")
+    parser.add_argument("--volumes", default="500,2000,10000,50000,200000")
+    parser.add_argument("--itens", default="1-20", help="faixa de itens por lançamento, ex.: 1-20")
+    parser.add_argument("--dias", type=int, default=730, help="dias distintos no período")
+    parser.add_argument("--repeticoes", type=int, default=7)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--saida", help="grava os resultados em JSON")
+    args = parser.parse_args()
+
+    server = carregar_servidor()
+    itens_min, itens_max = (int(n) for n in args.itens.split("-"))
+    rng = random.Random(args.seed)
+    hoje = date.today()
+    try:
+        import numpy  # noqa: F401
+        candidatos = {"servidor": server._agregar_lancamentos, "colunar": agregar_colunar}
+    except ImportError:
+        print("⚠️  numpy não instalado, medindo só o laço do servidor")
+        candidatos = {"servidor": server._agregar_lancamentos}
+
+    resultados, virada = [], None
+    print(f"{'linhas':>8}  {'referência':>11}  " + "  ".join(f"{nome + ' (ms)':>14}" for nome in candidatos))
+    for volume in (int(v) for v in args.volumes.split(",")):
+        linhas = [
+            _gerar_lancamento(rng, hoje - timedelta(days=rng.randrange(args.dias)), itens_min, itens_max)
+            for _ in range(volume)
+        ]
+        t_ref, esperado = medir(agregar_referencia, linhas, args.repeticoes)
+        relatorio_esperado = json.dumps(server._montar_relatorio(esperado, None, None))
+        tempos = {"referencia": round(t_ref * 1000, 3)}
+        for nome, funcao in candidatos.items():
+            t, agregado = medir(funcao, linhas, args.repeticoes)
+            relatorio = json.dumps(server._montar_relatorio(agregado, None, None))
+            if not _identico(agregado, esperado) or relatorio != relatorio_esperado:
+                print(f"❌ {nome}: saída diferente do laço original com {volume} linhas")
+                return 1
+            tempos[nome] = round(t * 1000, 3)
+
+        if virada is None and "colunar" in tempos and tempos["colunar"] < tempos["servidor"]:
+            virada = volume
+        resultados.append({"linhas": volume, "ms": tempos})
+        print(f"{volume:>8}  {tempos['referencia']:>11.2f}  " + "  ".join(f"{tempos[nome]:>14.2f}" for nome in candidatos))
+
+    print("\n✅ Saídas idênticas ao laço original em todos os volumes")
+    if "colunar" in candidatos:
+        if virada is None:
+            print("📉 A versão colunar não venceu o laço do servidor em nenhum volume")
+        else:
+            print(f"📈 A versão colunar vence o laço do servidor a partir de ~{virada} linhas")
+    if args.saida:
+        Path(args.saida).write_text(json.dumps({"config": vars(args), "resultados": resultados, "virada": virada}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
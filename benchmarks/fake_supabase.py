@@ -0,0 +1,310 @@
+"""
+Substituto em memória do cliente supabase-py, para benchmarks locais.
+
+Implementa o subconjunto do query builder do PostgREST que as APIs usam
+(select/insert/update/upsert/delete, filtros, or_, order, limit, range,
+count) sobre tabelas em memória. Funções RPC só existem se forem
+registradas em FakeSupabase.rpcs; as demais respondem como "não
+instaladas" (PGRST202), assim como tabelas que não existem (PGRST205), e as
+APIs caem nos seus caminhos em Python.
+"""
+import copy
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+from postgrest.exceptions import APIError
+
+
+class FakeResponse:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+def _dividir_nivel_superior(texto):
+    """Split a PostgREST logic tree on top-level commas"""
+    partes, atual, nivel, aspas = [], [], 0, False
+    for c in texto:
+        if c == '"':
+            aspas = not aspas
+        elif not aspas and c == '(':
+            nivel += 1
+        elif not aspas and c == ')':
+            nivel -= 1
+        elif not aspas and nivel == 0 and c == ',':
+            partes.append(''.join(atual))
+            atual = []
+            continue
+        atual.append(c)
+    if atual:
+        partes.append(''.join(atual))
+    return partes
+
+
+def _comparar(valor, op, alvo):
+    if op == 'is':
+        return valor is None if alvo in (None, 'null') else valor == alvo
+    if valor is None:
+        return False
+    if isinstance(valor, (int, float)) and not isinstance(alvo, (int, float)):
+        try:
+            alvo = float(alvo)
+        except (TypeError, ValueError):
+            valor = str(valor)
+    elif not isinstance(valor, (int, float)):
+        valor, alvo = str(valor), alvo if isinstance(alvo, (list, tuple)) else str(alvo)
+    if op == 'eq':
+        return valor == alvo
+    if op == 'neq':
+        return valor != alvo
+    if op == 'lt':
+        return valor < alvo
+    if op == 'lte':
+        return valor <= alvo
+    if op == 'gt':
+        return valor > alvo
+    if op == 'gte':
+        return valor >= alvo
+    if op == 'in':
+        return valor in alvo
+    if op in ('like', 'ilike'):
+        padrao = '^' + re.escape(alvo).replace('%', '.*').replace('_', '.') + '$'
+        return re.match(padrao, valor, (re.IGNORECASE if op == 'ilike' else 0) | re.DOTALL) is not None
+    raise ValueError(f"Operador não suportado: {op}")
+
+
+def _termo(coluna, op, valor, negar=False):
+    def predicado(linha):
+        atual = linha.get(coluna)
+        if negar and op != 'is' and atual is None:
+            return False  # NOT (NULL op x) continua NULL
+        return _comparar(atual, op, valor) != negar
+    return predicado
+
+
+def _compilar_logica(texto, conjuncao='or'):
+    """Compile a PostgREST or=(...) expression into a row predicate"""
+    termos = []
+    for parte in _dividir_nivel_superior(texto):
+        parte = parte.strip()
+        m = re.match(r'^(and|or)\((.*)\)$', parte, re.DOTALL)
+        if m:
+            termos.append(_compilar_logica(m.group(2), m.group(1)))
+            continue
+        coluna, op, valor = parte.split('.', 2)
+        negar = op == 'not'
+        if negar:
+            op, valor = valor.split('.', 1)
+        if valor.startswith('"') and valor.endswith('"'):
+            valor = valor[1:-1]
+        termos.append(_termo(coluna, op, valor, negar))
+    if conjuncao == 'and':
+        return lambda linha: all(t(linha) for t in termos)
+    return lambda linha: any(t(linha) for t in termos)
+
+
+class FakeQuery:
+    def __init__(self, banco, tabela):
+        self._banco = banco
+        self._tabela = tabela
+        self._operacao = 'select'
+        self._colunas = '*'
+        self._count = None
+        self._filtros = []
+        self._ordem = []
+        self._offset = 0
+        self._limite = None
+        self._payload = None
+        self._on_conflict = 'id'
+        self._ignorar_duplicados = False
+
+    # Operações
+    def select(self, colunas='*', count=None):
+        self._operacao, self._colunas, self._count = 'select', colunas, count
+        return self
+
+    def insert(self, payload, **kwargs):
+        self._operacao, self._payload = 'insert', payload
+        return self
+
+    def upsert(self, payload, on_conflict='id', ignore_duplicates=False, **kwargs):
+        self._operacao, self._payload = 'upsert', payload
+        self._on_conflict, self._ignorar_duplicados = on_conflict, ignore_duplicates
+        return self
+
+    def update(self, payload, **kwargs):
+        self._operacao, self._payload = 'update', payload
+        return self
+
+    def delete(self, **kwargs):
+        self._operacao = 'delete'
+        return self
+
+    # Filtros
+    def _filtro(self, coluna, op, valor):
+        self._filtros.append(lambda linha: _comparar(linha.get(coluna), op, valor))
+        return self
+
+    def eq(self, coluna, valor):
+        return self._filtro(coluna, 'eq', valor)
+
+    def neq(self, coluna, valor):
+        return self._filtro(coluna, 'neq', valor)
+
+    def lt(self, coluna, valor):
+        return self._filtro(coluna, 'lt', valor)
+
+    def lte(self, coluna, valor):
+        return self._filtro(coluna, 'lte', valor)
+
+    def gt(self, coluna, valor):
+        return self._filtro(coluna, 'gt', valor)
+
+    def gte(self, coluna, valor):
+        return self._filtro(coluna, 'gte', valor)
+
+    def ilike(self, coluna, padrao):
+        return self._filtro(coluna, 'ilike', padrao)
+
+    def like(self, coluna, padrao):
+        return self._filtro(coluna, 'like', padrao)
+
+    def in_(self, coluna, valores):
+        return self._filtro(coluna, 'in', list(valores))
+
+    def is_(self, coluna, valor):
+        return self._filtro(coluna, 'is', valor)
+
+    def or_(self, expressao):
+        self._filtros.append(_compilar_logica(expressao))
+        return self
+
+    # Ordenação e paginação
+    def order(self, coluna, desc=False, nullsfirst=None):
+        self._ordem.append((coluna, desc, desc if nullsfirst is None else nullsfirst))
+        return self
+
+    def limit(self, n):
+        self._limite = n
+        return self
+
+    def range(self, inicio, fim):
+        self._offset, self._limite = inicio, fim - inicio + 1
+        return self
+
+    def _ordenar(self, linhas):
+        for coluna, desc, nulos_primeiro in reversed(self._ordem):
+            com_valor = [l for l in linhas if l.get(coluna) is not None]
+            nulos = [l for l in linhas if l.get(coluna) is None]
+            com_valor.sort(key=lambda l: l[coluna], reverse=desc)
+            linhas = nulos + com_valor if nulos_primeiro else com_valor + nulos
+        return linhas
+
+    def _projetar(self, linha):
+        if self._colunas.strip() == '*':
+            return copy.deepcopy(linha)
+        return {c.strip(): copy.deepcopy(linha.get(c.strip())) for c in self._colunas.split(',')}
+
+    @property
+    def request(self):
+        # Caminho, método e Prefer como no RequestConfig do postgrest (rótulos das métricas)
+        metodo = {'select': 'GET', 'update': 'PATCH', 'delete': 'DELETE'}.get(self._operacao, 'POST')
+        prefer = 'resolution=merge-duplicates' if self._operacao == 'upsert' else ''
+        return SimpleNamespace(path=f"/rest/v1/{self._tabela}", http_method=metodo, headers={'prefer': prefer})
+
+    def execute(self):
+        self._banco._latencia()
+        linhas = self._banco._tabela(self._tabela)
+        with self._banco.lock:
+            if self._operacao in ('insert', 'upsert'):
+                return FakeResponse(self._gravar(linhas))
+
+            alvo = [l for l in linhas if all(f(l) for f in self._filtros)]
+            if self._operacao == 'update':
+                for linha in alvo:
+                    linha.update(copy.deepcopy(self._payload))
+                return FakeResponse(copy.deepcopy(alvo))
+            if self._operacao == 'delete':
+                ids = {id(l) for l in alvo}
+                linhas[:] = [l for l in linhas if id(l) not in ids]
+                return FakeResponse(alvo)
+
+            total = len(alvo) if self._count else None
+            alvo = self._ordenar(alvo)
+            limite = min(self._limite or self._banco.max_rows, self._banco.max_rows)
+            alvo = alvo[self._offset:self._offset + limite]
+            return FakeResponse([self._projetar(l) for l in alvo], total)
+
+    def _gravar(self, linhas):
+        novos = self._payload if isinstance(self._payload, list) else [self._payload]
+        chaves = [c.strip() for c in self._on_conflict.split(',')]
+        existentes = {tuple(l.get(c) for c in chaves): l for l in linhas}
+        gravados = []
+        for novo in novos:
+            chave = tuple(novo.get(c) for c in chaves)
+            atual = existentes.get(chave)
+            if atual is not None:
+                if self._operacao == 'insert':
+                    raise APIError({"code": "23505", "message": "duplicate key value violates unique constraint"})
+                if self._ignorar_duplicados:
+                    continue
+                atual.update(copy.deepcopy(novo))
+                gravados.append(copy.deepcopy(atual))
+                continue
+            linha = copy.deepcopy(novo)
+            linhas.append(linha)
+            existentes[chave] = linha
+            gravados.append(copy.deepcopy(linha))
+        return gravados
+
+
+class FakeRPC:
+    def __init__(self, banco, nome, params):
+        self._banco, self._nome, self._params = banco, nome, params
+
+    @property
+    def request(self):
+        return SimpleNamespace(path=f"/rest/v1/rpc/{self._nome}", http_method='POST', headers={})
+
+    def execute(self):
+        self._banco._latencia()
+        funcao = self._banco.rpcs.get(self._nome)
+        if funcao is None:
+            raise APIError({"code": "PGRST202", "message": f"Could not find the function public.{self._nome}"})
+        with self._banco.lock:
+            return FakeResponse(funcao(self._banco, **self._params))
+
+
+class FakeSupabase:
+    """In-memory stand-in for supabase.Client"""
+
+    def __init__(self, latencia_ms=0.0, max_rows=1000):
+        self.tabelas = {}
+        self.rpcs = {}
+        self.latencia_ms = latencia_ms
+        self.max_rows = max_rows
+        self.lock = threading.RLock()
+
+    def _latencia(self):
+        if self.latencia_ms:
+            time.sleep(self.latencia_ms / 1000)
+
+    def _tabela(self, nome):
+        if nome not in self.tabelas:
+            raise APIError({"code": "PGRST205", "message": f"Could not find the table 'public.{nome}'"})
+        return self.tabelas[nome]
+
+    def criar_tabela(self, nome, linhas=()):
+        self.tabelas[nome] = list(linhas)
+        return self.tabelas[nome]
+
+    def table(self, nome):
+        return FakeQuery(self, nome)
+
+    def from_(self, nome):
+        return FakeQuery(self, nome)
+
+    def rpc(self, nome, params=None):
+        return FakeRPC(self, nome, params or {})
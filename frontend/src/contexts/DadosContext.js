@@ -3,6 +3,31 @@ import axios from 'axios';
 
 const API_URL = (process.env.REACT_APP_BACKEND_URL || '') + '/api';
 const CACHE_DURATION = 2 * 60 * 1000; // 2 minutos de cache
+const TOTAIS_MES = ['producao_total', 'perdas_total', 'percentual_perdas', 'dias_produzidos', 'media_diaria'];
+
+// Mesma ordem da listagem: data, hora e id decrescentes
+const ordenarLancamentos = (lista) => lista.sort((a, b) =>
+  (b.data || '').localeCompare(a.data || '') ||
+  (b.hora || '').localeCompare(a.hora || '') ||
+  String(b.id).localeCompare(String(a.id))
+);
+
+// Buscado com o stream aberto (as mudanças chegam por ele) ou há menos de CACHE_DURATION
+const cacheValido = (lastFetch, streamAbertoDesde) => Boolean(lastFetch) && (
+  (streamAbertoDesde !== null && lastFetch >= streamAbertoDesde) ||
+  (Date.now() - lastFetch) < CACHE_DURATION
+);
+
+// Início da janela de lançamentos recentes do dashboard (últimos 7 dias)
+const inicioRecentes = () => {
+  const seteDiasAtras = new Date();
+  seteDiasAtras.setDate(seteDiasAtras.getDate() - 6);
+  return [
+    seteDiasAtras.getFullYear(),
+    String(seteDiasAtras.getMonth() + 1).padStart(2, '0'),
+    String(seteDiasAtras.getDate()).padStart(2, '0')
+  ].join('-');
+};
 
 const DadosContext = createContext();
 
@@ -20,11 +45,65 @@ export const DadosProvider = ({ children }) => {
   const [loadingLancamentos, setLoadingLancamentos] = useState(false);
   const lastFetchLancamentosRef = useRef(null);
   
+  // Réplica local sincronizada por /lancamentos/changes: depois da primeira
+  // carga só trafega o que mudou desde o último cursor. Sem o endpoint
+  // instalado no backend (501) volta a buscar a lista inteira.
+  const replicaRef = useRef(new Map());
+  const cursorSyncRef = useRef(null);
+  const syncDisponivelRef = useRef(true);
+  
   // Cache de estatísticas do dashboard
   const [statsMensal, setStatsMensal] = useState(null);
   const [loadingStats, setLoadingStats] = useState(false);
   const lastFetchStatsRef = useRef(null);
 
+  // Atualizações empurradas pelo backend (/stream/lancamentos, SSE): cada
+  // evento traz o lançamento alterado e os totais do mês, aplicados direto
+  // na lista e no dashboard. Dados buscados com o stream aberto não expiram;
+  // sem stream (a Vercel responde 404) vale o polling de CACHE_DURATION.
+  const streamAbertoDesdeRef = useRef(null);
+  const carregarStatsRef = useRef(null);
+
+  // Aplica as páginas de alterações desde o último cursor (ou tudo, sem cursor)
+  const sincronizarLancamentos = useCallback(async () => {
+    let cursor = cursorSyncRef.current;
+    const replica = cursor ? replicaRef.current : new Map();
+    let mais = true;
+    while (mais) {
+      const response = await axios.get(`${API_URL}/lancamentos/changes`, {
+        params: cursor ? { since: cursor } : {}
+      });
+      response.data.lancamentos.forEach((lanc) => replica.set(lanc.id, lanc));
+      response.data.removidos.forEach((id) => replica.delete(id));
+      cursor = response.data.cursor;
+      mais = response.data.mais;
+    }
+    replicaRef.current = replica;
+    cursorSyncRef.current = cursor;
+    return ordenarLancamentos(Array.from(replica.values()));
+  }, []);
+
+  const buscarTodosLancamentos = useCallback(async () => {
+    if (syncDisponivelRef.current) {
+      try {
+        return await sincronizarLancamentos();
+      } catch (error) {
+        const status = error.response?.status;
+        if (status === 410) {
+          // Cursor expirado: recomeça da carga completa
+          cursorSyncRef.current = null;
+          return sincronizarLancamentos();
+        }
+        if (status !== 501 && status !== 404) {
+          throw error;
+        }
+        syncDisponivelRef.current = false;
+      }
+    }
+    const response = await axios.get(`${API_URL}/lancamentos?t=${Date.now()}`);
+    return response.data;
+  }, [sincronizarLancamentos]);
+
   // Carregar lançamentos com cache
   const carregarLancamentos = useCallback(async (forceRefresh = false, filtros = {}) => {
     const temFiltros = filtros.dataInicio || filtros.dataFim || filtros.referencia;
@@ -50,98 +129,43 @@ export const DadosProvider = ({ children }) => {
     }
     
     // Sem filtros - usa cache
-    if (!forceRefresh && lastFetchLancamentosRef.current && 
-        (Date.now() - lastFetchLancamentosRef.current) < CACHE_DURATION && 
-        lancamentos.length > 0) {
+    if (!forceRefresh && cacheValido(lastFetchLancamentosRef.current, streamAbertoDesdeRef.current) && lancamentos.length > 0) {
       return lancamentos;
     }
 
     setLoadingLancamentos(true);
     try {
-      const response = await axios.get(`${API_URL}/lancamentos?t=${Date.now()}`);
-      setLancamentos(response.data);
-      lastFetchLancamentosRef.current = Date.now();
-      return response.data;
+      const inicio = Date.now();
+      const dados = await buscarTodosLancamentos();
+      setLancamentos(dados);
+      lastFetchLancamentosRef.current = inicio;
+      return dados;
     } catch (error) {
       console.error('Erro ao carregar lançamentos:', error);
       return lancamentos;
     } finally {
       setLoadingLancamentos(false);
     }
-  }, [lancamentos]);
-
-  // Função para encontrar o último mês com lançamentos
-  const encontrarUltimoPeriodoComDados = useCallback(async () => {
-    try {
-      // Buscar todos os lançamentos (sem filtro)
-      const response = await axios.get(`${API_URL}/lancamentos?t=${Date.now()}`);
-      const todosLancamentos = response.data;
-      
-      if (!todosLancamentos || todosLancamentos.length === 0) {
-        // Se não há lançamentos, retorna mês atual mesmo
-        const hoje = new Date();
-        return {
-          ano: hoje.getFullYear(),
-          mes: hoje.getMonth() + 1,
-          data_inicio: new Date(hoje.getFullYear(), hoje.getMonth(), 1).toISOString().split('T')[0],
-          data_fim: new Date(hoje.getFullYear(), hoje.getMonth() + 1, 0).toISOString().split('T')[0]
-        };
-      }
-      
-      // Ordenar lançamentos por data (mais recente primeiro)
-      const lancamentosOrdenados = todosLancamentos.sort((a, b) => {
-        return new Date(b.data) - new Date(a.data);
-      });
-      
-      // Pegar a data do lançamento mais recente
-      const dataUltimoLancamento = new Date(lancamentosOrdenados[0].data + 'T00:00:00');
-      const ano = dataUltimoLancamento.getFullYear();
-      const mes = dataUltimoLancamento.getMonth() + 1;
-      
-      // Calcular primeiro e último dia do mês
-      const primeiroDia = new Date(ano, mes - 1, 1);
-      const ultimoDia = new Date(ano, mes, 0);
-      
-      return {
-        ano,
-        mes,
-        data_inicio: primeiroDia.toISOString().split('T')[0],
-        data_fim: ultimoDia.toISOString().split('T')[0]
-      };
-    } catch (error) {
-      console.error('Erro ao encontrar último período:', error);
-      // Em caso de erro, retorna mês atual
-      const hoje = new Date();
-      return {
-        ano: hoje.getFullYear(),
-        mes: hoje.getMonth() + 1,
-        data_inicio: new Date(hoje.getFullYear(), hoje.getMonth(), 1).toISOString().split('T')[0],
-        data_fim: new Date(hoje.getFullYear(), hoje.getMonth() + 1, 0).toISOString().split('T')[0]
-      };
-    }
-  }, []);
+  }, [lancamentos, buscarTodosLancamentos]);
 
   // Carregar stats mensais com cache (para Dashboard)
+  // Uma chamada só: o backend acha o último mês com lançamentos, gera o
+  // relatório dele e devolve os lançamentos recentes (últimos 7 dias)
   const carregarStatsMensal = useCallback(async (forceRefresh = false) => {
-    if (!forceRefresh && lastFetchStatsRef.current && 
-        (Date.now() - lastFetchStatsRef.current) < CACHE_DURATION && 
-        statsMensal) {
+    if (!forceRefresh && cacheValido(lastFetchStatsRef.current, streamAbertoDesdeRef.current) && statsMensal) {
       return statsMensal;
     }
 
     setLoadingStats(true);
     try {
-      // Encontrar o último período com dados
-      const periodo = await encontrarUltimoPeriodoComDados();
-      
-      // Buscar relatório para esse período específico
-      const response = await axios.get(
-        `${API_URL}/relatorios?periodo=customizado&data_inicio=${periodo.data_inicio}&data_fim=${periodo.data_fim}&t=${Date.now()}`
-      );
+      const inicio = Date.now();
+      const response = await axios.get(`${API_URL}/dashboard?desde=${inicioRecentes()}&limite=500`);
+      const { periodo_referencia: periodo, relatorio, lancamentos_recentes } = response.data;
       
       // Adicionar informação do período aos dados
       const statsComPeriodo = {
-        ...response.data,
+        ...relatorio,
+        lancamentos_recentes,
         periodo_referencia: {
           ano: periodo.ano,
           mes: periodo.mes,
@@ -150,7 +174,7 @@ export const DadosProvider = ({ children }) => {
       };
       
       setStatsMensal(statsComPeriodo);
-      lastFetchStatsRef.current = Date.now();
+      lastFetchStatsRef.current = inicio;
       return statsComPeriodo;
     } catch (error) {
       console.error('Erro ao carregar stats:', error);
@@ -158,7 +182,8 @@ export const DadosProvider = ({ children }) => {
     } finally {
       setLoadingStats(false);
     }
-  }, [statsMensal, encontrarUltimoPeriodoComDados]);
+  }, [statsMensal]);
+  carregarStatsRef.current = carregarStatsMensal;
 
   // Invalidar cache após criar/editar/deletar lançamento
   const invalidarCache = useCallback(() => {
@@ -166,15 +191,72 @@ export const DadosProvider = ({ children }) => {
     lastFetchStatsRef.current = null;
   }, []);
 
-  // Pré-carregar dados ao iniciar a aplicação
+  const aplicarEvento = useCallback((evento) => {
+    if (evento.tipo === 'recarregar') {
+      // Eventos perdidos ou escrita em lote: relê o que já estava carregado
+      invalidarCache();
+      if (statsMensal) carregarStatsRef.current(true);
+      return;
+    }
+
+    const lanc = evento.lancamento;
+    const removido = evento.tipo === 'removido';
+
+    if (syncDisponivelRef.current && cursorSyncRef.current) {
+      // O cursor não avança: a próxima sincronização reaplica a mudança sem efeito
+      if (removido) replicaRef.current.delete(lanc.id);
+      else replicaRef.current.set(lanc.id, lanc);
+    }
+    if (lastFetchLancamentosRef.current !== null) {
+      setLancamentos((atual) => {
+        const sem = atual.filter((l) => l.id !== lanc.id);
+        return removido ? sem : ordenarLancamentos([...sem, lanc]);
+      });
+    }
+
+    if (!statsMensal) return;
+    const { ano, mes } = statsMensal.periodo_referencia;
+    const mesDashboard = `${ano}-${String(mes).padStart(2, '0')}`;
+    if (!evento.totais_mes || (lanc.data || '').slice(0, 7) > mesDashboard) {
+      // Sem os totais ou lançamento num mês mais novo que o do dashboard
+      carregarStatsRef.current(true);
+      return;
+    }
+    const totais = evento.totais_mes.find((t) => t.mes === mesDashboard);
+    setStatsMensal((atual) => {
+      const novo = { ...atual };
+      if (totais) TOTAIS_MES.forEach((campo) => { novo[campo] = totais[campo]; });
+      const recentes = (atual.lancamentos_recentes || []).filter((l) => l.id !== lanc.id);
+      novo.lancamentos_recentes = removido || lanc.data < inicioRecentes()
+        ? recentes
+        : ordenarLancamentos([...recentes, lanc]);
+      return novo;
+    });
+    // Os detalhes do relatório (por referência e item) vêm na próxima leitura,
+    // que encontra o relatório do mês já calculado no backend
+    lastFetchStatsRef.current = null;
+  }, [invalidarCache, statsMensal]);
+  const aplicarEventoRef = useRef(aplicarEvento);
+  aplicarEventoRef.current = aplicarEvento;
+
   useEffect(() => {
-    const preCarregar = async () => {
-      await Promise.all([
-        carregarLancamentos(),
-        carregarStatsMensal()
-      ]);
+    if (typeof EventSource === 'undefined') return undefined;
+    const fonte = new EventSource(`${API_URL}/stream/lancamentos`);
+    fonte.onopen = () => {
+      streamAbertoDesdeRef.current = Date.now();
+    };
+    fonte.onerror = () => {
+      // O navegador reconecta sozinho (com Last-Event-ID); um 404 ou 503 fecha
+      // o stream de vez e o polling continua
+      streamAbertoDesdeRef.current = null;
     };
-    preCarregar();
+    fonte.addEventListener('lancamento', (e) => aplicarEventoRef.current(JSON.parse(e.data)));
+    return () => fonte.close();
+  }, []);
+
+  // Pré-carregar dados ao iniciar a aplicação
+  useEffect(() => {
+    carregarStatsMensal();
     // eslint-disable-next-line react-hooks/exhaustive-deps
   }, []);
 
@@ -0,0 +1,35 @@
+import axios from "axios";
+
+// Variáveis, um lançamento e relatórios de períodos fechados podem vir da CDN
+// com alguns segundos de atraso. Depois de uma escrita feita nesta aba, as
+// leituras do mesmo recurso levam ?t=<hora da escrita> e caem numa entrada
+// nova da CDN: quem escreveu vê a mudança na hora.
+const ultimaEscrita = {};
+
+function recursoDaUrl(url) {
+  const caminho = new URL(url, window.location.origin).pathname;
+  if (caminho.includes("/api/variaveis")) return "variaveis";
+  if (caminho.includes("/api/lancamentos") || caminho.includes("/api/relatorios")) return "lancamentos";
+  return null;
+}
+
+export function instalarCacheEscritas() {
+  axios.interceptors.response.use((response) => {
+    const { method = "get", url = "" } = response.config;
+    const recurso = recursoDaUrl(url);
+    if (method.toLowerCase() !== "get" && recurso) {
+      ultimaEscrita[recurso] = Date.now();
+    }
+    return response;
+  });
+
+  axios.interceptors.request.use((config) => {
+    const { method = "get", url = "" } = config;
+    const recurso = recursoDaUrl(url);
+    // Listagens já passam o próprio ?t=
+    if (method.toLowerCase() === "get" && recurso && ultimaEscrita[recurso] && !/[?&]t=/.test(url)) {
+      config.params = { t: ultimaEscrita[recurso], ...config.params };
+    }
+    return config;
+  });
+}
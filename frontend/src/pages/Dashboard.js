@@ -9,7 +9,7 @@ const formatarKg = (valor) => {
 };
 
 function Dashboard() {
-  const { statsMensal, carregarStatsMensal, carregarLancamentos, loadingStats, loadingLancamentos } = useDados();
+  const { statsMensal, carregarStatsMensal, loadingStats } = useDados();
   const [lancamentos7Dias, setLancamentos7Dias] = useState([]);
   const [loading, setLoading] = useState(true);
 
@@ -18,24 +18,26 @@ function Dashboard() {
     // eslint-disable-next-line react-hooks/exhaustive-deps
   }, []);
 
+  // Recalcula a cada atualização de statsMensal, inclusive as vindas do stream
+  useEffect(() => {
+    const lancamentosData = statsMensal?.lancamentos_recentes || [];
+    
+    // Últimos 7 dias (incluindo hoje)
+    const hoje = new Date();
+    const seteDiasAtras = new Date();
+    seteDiasAtras.setDate(hoje.getDate() - 6);
+    
+    const ultimos7Dias = lancamentosData.filter(lanc => {
+      const dataLanc = new Date(lanc.data + 'T00:00:00');
+      return dataLanc >= seteDiasAtras && dataLanc <= hoje;
+    });
+    
+    setLancamentos7Dias(ultimos7Dias);
+  }, [statsMensal]);
+
   const carregarDashboard = async () => {
     try {
-      const [stats, lancamentosData] = await Promise.all([
-        carregarStatsMensal(),
-        carregarLancamentos()
-      ]);
-      
-      // Últimos 7 dias (incluindo hoje)
-      const hoje = new Date();
-      const seteDiasAtras = new Date();
-      seteDiasAtras.setDate(hoje.getDate() - 6);
-      
-      const ultimos7Dias = lancamentosData.filter(lanc => {
-        const dataLanc = new Date(lanc.data + 'T00:00:00');
-        return dataLanc >= seteDiasAtras && dataLanc <= hoje;
-      });
-      
-      setLancamentos7Dias(ultimos7Dias);
+      await carregarStatsMensal();
     } catch (error) {
       console.error('Erro ao carregar dashboard:', error);
     } finally {
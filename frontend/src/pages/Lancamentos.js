@@ -17,12 +17,31 @@ function Lancamentos() {
   const [filtroDataInicio, setFiltroDataInicio] = useState('');
   const [filtroDataFim, setFiltroDataFim] = useState('');
   const [filtroReferencia, setFiltroReferencia] = useState('');
+  const [sugestoesReferencia, setSugestoesReferencia] = useState([]);
 
   useEffect(() => {
     carregarDados();
     // eslint-disable-next-line react-hooks/exhaustive-deps
   }, []);
 
+  // Autocomplete da referência, com espera de 250ms entre as teclas
+  useEffect(() => {
+    const texto = filtroReferencia.trim();
+    if (texto.length < 2) {
+      setSugestoesReferencia([]);
+      return;
+    }
+    const timer = setTimeout(async () => {
+      try {
+        const response = await axios.get(`${API_URL}/referencias/suggest`, { params: { q: texto, limite: 10 } });
+        setSugestoesReferencia(response.data);
+      } catch (error) {
+        setSugestoesReferencia([]);
+      }
+    }, 250);
+    return () => clearTimeout(timer);
+  }, [filtroReferencia]);
+
   const carregarDados = async (filtros = {}) => {
     setLoading(true);
     try {
@@ -139,15 +158,13 @@ function Lancamentos() {
   };
 
   const exportarHistoricoExcel = () => {
-    let csv = `Data;Hora;Referência de Produção;Turno;Produção (kg);Perdas (kg);% Perdas\n`;
-    lancamentos.forEach(lanc => {
-      csv += `${formatarData(lanc.data)};${formatarHora(lanc.hora)};${lanc.referencia_producao || ''};${lanc.turno};${formatarKg(lanc.producao_total)};${formatarKg(lanc.perdas_total)};${lanc.percentual_perdas}%\n`;
-    });
-    const blob = new Blob(["\ufeff" + csv], { type: 'text/csv;charset=utf-8;' });
-    const url = window.URL.createObjectURL(blob);
+    // Exportação gerada e transmitida pelo servidor, uma linha por item
+    const params = new URLSearchParams({ formato: 'xlsx' });
+    if (filtroDataInicio) params.append('data_inicio', filtroDataInicio);
+    if (filtroDataFim) params.append('data_fim', filtroDataFim);
+    if (filtroReferencia.trim()) params.append('referencia_producao', filtroReferencia.trim());
     const a = document.createElement('a');
-    a.href = url;
-    a.download = `historico_producao_${new Date().getTime()}.csv`;
+    a.href = `${API_URL}/lancamentos/export?${params.toString()}`;
     document.body.appendChild(a);
     a.click();
     document.body.removeChild(a);
@@ -207,7 +224,13 @@ function Lancamentos() {
                 onChange={(e) => setFiltroReferencia(e.target.value)} 
                 placeholder="Ex: Roberto, Forte, Rosemar..."
                 style={{border: '1px solid #15803d'}}
+                list="sugestoes-referencia"
               />
+              <datalist id="sugestoes-referencia">
+                {sugestoesReferencia.map((s) => (
+                  <option key={s.referencia} value={s.referencia}>{s.lancamentos} lançamentos</option>
+                ))}
+              </datalist>
             </div>
           </div>
           <div style={{display: 'flex', gap: '10px'}}>
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import axios from 'axios';
 import { useVariaveis } from '../contexts/VariaveisContext';
@@ -20,11 +20,18 @@ const formatarKg = (valor) => {
   return new Intl.NumberFormat('pt-BR', { minimumFractionDigits: 2, maximumFractionDigits: 2 }).format(parseFloat(valor) || 0);
 };
 
+// Chave única por formulário: reenviar após falha de rede não duplica o lançamento
+const novaChaveIdempotencia = () =>
+  (window.crypto && window.crypto.randomUUID)
+    ? window.crypto.randomUUID()
+    : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+
 function NovoLancamento() {
   const navigate = useNavigate();
   const [loading, setLoading] = useState(false);
   const { variaveis } = useVariaveis();
   const { invalidarCache } = useDados();
+  const chaveIdempotencia = useRef(novaChaveIdempotencia());
   
   const [lancamento, setLancamento] = useState({
     data: new Date().toISOString().split('T')[0],
@@ -72,7 +79,9 @@ function NovoLancamento() {
     setLoading(true);
     
     try {
-      await axios.post(`${API_URL}/lancamentos`, lancamento);
+      await axios.post(`${API_URL}/lancamentos`, lancamento, {
+        headers: { 'Idempotency-Key': chaveIdempotencia.current }
+      });
       invalidarCache(); // Invalida o cache após criar
       alert('Lançamento criado com sucesso!');
       navigate('/lancamentos');
@@ -16,6 +16,7 @@ function Relatorios() {
   const [dataFim, setDataFim] = useState('');
   const [referenciaProducao, setReferenciaProducao] = useState('');
   const [relatorio, setRelatorio] = useState(null);
+  const [desatualizado, setDesatualizado] = useState(false);
   const [loading, setLoading] = useState(false);
   const [itensExpandido, setItensExpandido] = useState(false);
 
@@ -32,6 +33,7 @@ function Relatorios() {
       const cached = await carregarStatsMensal();
       if (cached) {
         setRelatorio(cached);
+        setDesatualizado(false);
         return;
       }
     }
@@ -55,14 +57,21 @@ function Relatorios() {
         url += `&referencia_producao=${encodeURIComponent(refTrimmed)}`;
       }
       
-      // Adiciona timestamp para evitar cache
-      url += `&t=${new Date().getTime()}`;
-      
+      // Sem ?t= fixo: relatórios de períodos fechados vêm da CDN; depois de
+      // uma escrita nesta aba o interceptor (lib/cacheEscritas) já acrescenta o ?t=
       const response = await axios.get(url);
       setRelatorio(response.data);
+      // Banco indisponível: o servidor devolveu a última cópia que tinha
+      setDesatualizado(response.headers['x-stale'] === 'true');
     } catch (error) {
       console.error('Erro ao gerar relatório:', error);
-      alert('Erro ao carregar relatório. Verifique a conexão.');
+      if (error.response?.status === 429) {
+        // Períodos longos entram numa fila no servidor; 429 = fila cheia
+        const segundos = error.response.headers['retry-after'] || 'alguns';
+        alert(`Muitos relatórios longos sendo gerados agora. Tente novamente em ${segundos} segundos.`);
+      } else {
+        alert('Erro ao carregar relatório. Verifique a conexão.');
+      }
     } finally {
       setLoading(false);
     }
@@ -281,6 +290,11 @@ function Relatorios() {
 
       {relatorio && !loading && (
         <>
+          {desatualizado && (
+            <div className="card" style={{borderLeft: '4px solid #f59e0b'}}>
+              Banco de dados indisponível no momento: exibindo a última versão salva deste relatório.
+            </div>
+          )}
           <div className="card">
             <h2 style={{marginBottom: '20px'}}>Informações Consolidadas</h2>
             <div className="stats-grid">
@@ -89,8 +89,13 @@ function Variaveis() {
     }));
     
     try {
-      await axios.put(`${API_URL}/variaveis/ordem`, { variaveis: ordemAtualizada });
-      await carregarVariaveis();
+      const response = await axios.put(`${API_URL}/variaveis/ordem`, { variaveis: ordemAtualizada });
+      // O backend devolve a lista já reordenada
+      if (Array.isArray(response.data.variaveis)) {
+        setVariaveis(response.data.variaveis);
+      } else {
+        await carregarVariaveis();
+      }
       refreshVariaveis(); // Atualiza o cache global
     } catch (error) {
       console.error('Erro ao mover:', error);
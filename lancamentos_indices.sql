@@ -0,0 +1,6 @@
+-- Índices da tabela lancamentos
+-- Execute este SQL no Supabase SQL Editor.
+
+-- Paginação por cursor de GET /api/lancamentos (ORDER BY data, hora, id DESC)
+CREATE INDEX IF NOT EXISTS idx_lancamentos_data_hora_id
+    ON lancamentos(data DESC, hora DESC, id DESC);
@@ -0,0 +1,221 @@
+-- SQL para os rollups diários de lançamentos (usados por GET /api/relatorios)
+-- Execute este SQL no Supabase SQL Editor.
+-- Um trigger em lancamentos atualiza os rollups na mesma transação de cada
+-- inserção, edição ou exclusão, inclusive as feitas fora da API.
+-- Para conferir ou refazer os totais: python rollup_lancamentos.py --verificar | --reconstruir
+
+-- Totais por dia, turno e referência
+CREATE TABLE IF NOT EXISTS lancamentos_diario (
+    data DATE NOT NULL,
+    turno TEXT NOT NULL DEFAULT '',
+    referencia_producao TEXT NOT NULL DEFAULT '',
+    producao DOUBLE PRECISION NOT NULL DEFAULT 0,
+    perdas DOUBLE PRECISION NOT NULL DEFAULT 0,
+    lancamentos INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (data, turno, referencia_producao)
+);
+
+-- Produção por dia, referência, formato e cor (itens JSONB)
+CREATE TABLE IF NOT EXISTS lancamentos_diario_itens (
+    data DATE NOT NULL,
+    referencia_producao TEXT NOT NULL DEFAULT '',
+    formato TEXT NOT NULL,
+    cor TEXT NOT NULL,
+    producao DOUBLE PRECISION NOT NULL DEFAULT 0,
+    itens INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (data, referencia_producao, formato, cor)
+);
+
+ALTER TABLE lancamentos_diario ENABLE ROW LEVEL SECURITY;
+ALTER TABLE lancamentos_diario_itens ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Enable all access for lancamentos_diario" ON lancamentos_diario;
+CREATE POLICY "Enable all access for lancamentos_diario" ON lancamentos_diario
+    FOR ALL USING (true) WITH CHECK (true);
+
+DROP POLICY IF EXISTS "Enable all access for lancamentos_diario_itens" ON lancamentos_diario_itens;
+CREATE POLICY "Enable all access for lancamentos_diario_itens" ON lancamentos_diario_itens
+    FOR ALL USING (true) WITH CHECK (true);
+
+-- Soma (p_sinal = 1) ou subtrai (p_sinal = -1) um lançamento dos rollups
+CREATE OR REPLACE FUNCTION rollup_aplicar_lancamento(p_lancamento JSONB, p_sinal INTEGER)
+RETURNS VOID
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_data DATE;
+    v_referencia TEXT;
+BEGIN
+    IF p_lancamento IS NULL OR jsonb_typeof(p_lancamento) <> 'object' THEN
+        RETURN;
+    END IF;
+
+    v_data := (p_lancamento->>'data')::DATE;
+    v_referencia := COALESCE(p_lancamento->>'referencia_producao', '');
+
+    INSERT INTO lancamentos_diario AS d (data, turno, referencia_producao, producao, perdas, lancamentos)
+    VALUES (
+        v_data,
+        COALESCE(p_lancamento->>'turno', ''),
+        v_referencia,
+        p_sinal * COALESCE(NULLIF(p_lancamento->>'producao_total', '')::DOUBLE PRECISION, 0),
+        p_sinal * COALESCE(NULLIF(p_lancamento->>'perdas_total', '')::DOUBLE PRECISION, 0),
+        p_sinal
+    )
+    ON CONFLICT (data, turno, referencia_producao) DO UPDATE
+        SET producao = d.producao + EXCLUDED.producao,
+            perdas = d.perdas + EXCLUDED.perdas,
+            lancamentos = d.lancamentos + EXCLUDED.lancamentos;
+
+    IF jsonb_typeof(p_lancamento->'itens') = 'array' THEN
+        INSERT INTO lancamentos_diario_itens AS d (data, referencia_producao, formato, cor, producao, itens)
+        SELECT v_data, v_referencia, formato, cor, p_sinal * SUM(producao), p_sinal * COUNT(*)
+        FROM (
+            SELECT
+                COALESCE(i->>'formato', 'N/A') AS formato,
+                COALESCE(i->>'cor', 'N/A') AS cor,
+                COALESCE(NULLIF(i->>'producao_kg', '')::DOUBLE PRECISION, 0) AS producao
+            FROM jsonb_array_elements(p_lancamento->'itens') AS i
+        ) itens
+        GROUP BY formato, cor
+        ON CONFLICT (data, referencia_producao, formato, cor) DO UPDATE
+            SET producao = d.producao + EXCLUDED.producao,
+                itens = d.itens + EXCLUDED.itens;
+    END IF;
+
+    DELETE FROM lancamentos_diario WHERE data = v_data AND lancamentos <= 0;
+    DELETE FROM lancamentos_diario_itens WHERE data = v_data AND itens <= 0;
+END;
+$$;
+
+-- Por linha, com OLD e NEW da própria escrita: duas edições concorrentes do
+-- mesmo lançamento são serializadas pelo lock da linha e cada uma desfaz a
+-- versão que de fato substituiu
+CREATE OR REPLACE FUNCTION lancamentos_rollup_trigger()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM rollup_aplicar_lancamento(to_jsonb(OLD), -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM rollup_aplicar_lancamento(to_jsonb(NEW), 1);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_lancamentos_rollup ON lancamentos;
+CREATE TRIGGER trg_lancamentos_rollup
+    AFTER INSERT OR UPDATE OR DELETE ON lancamentos
+    FOR EACH ROW EXECUTE FUNCTION lancamentos_rollup_trigger();
+
+-- A API só lê os rollups quando o trigger está instalado e ativo
+CREATE OR REPLACE FUNCTION rollup_mantido_por_trigger()
+RETURNS BOOLEAN
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT EXISTS (
+        SELECT 1 FROM pg_trigger
+        WHERE tgrelid = 'lancamentos'::regclass
+          AND tgname = 'trg_lancamentos_rollup'
+          AND tgenabled <> 'D'
+    );
+$$;
+
+-- Versões anteriores da API aplicavam os rollups por estas RPCs depois de
+-- cada escrita. Sem elas, uma API antiga ainda no ar deixa de atualizar os
+-- rollups (que agora são do trigger) em vez de contar as escritas em dobro.
+DROP FUNCTION IF EXISTS rollup_aplicar_diferenca(JSONB, JSONB);
+DROP FUNCTION IF EXISTS rollup_aplicar_lote(JSONB);
+
+-- Totais esperados, recalculados a partir da tabela lancamentos
+CREATE OR REPLACE VIEW lancamentos_diario_esperado AS
+    SELECT
+        data,
+        COALESCE(turno, '') AS turno,
+        COALESCE(referencia_producao, '') AS referencia_producao,
+        SUM(COALESCE(producao_total, 0))::DOUBLE PRECISION AS producao,
+        SUM(COALESCE(perdas_total, 0))::DOUBLE PRECISION AS perdas,
+        COUNT(*)::INTEGER AS lancamentos
+    FROM lancamentos
+    GROUP BY 1, 2, 3;
+
+CREATE OR REPLACE VIEW lancamentos_diario_itens_esperado AS
+    SELECT
+        l.data,
+        COALESCE(l.referencia_producao, '') AS referencia_producao,
+        COALESCE(i->>'formato', 'N/A') AS formato,
+        COALESCE(i->>'cor', 'N/A') AS cor,
+        SUM(COALESCE(NULLIF(i->>'producao_kg', '')::DOUBLE PRECISION, 0)) AS producao,
+        COUNT(*)::INTEGER AS itens
+    FROM lancamentos l,
+         jsonb_array_elements(CASE WHEN jsonb_typeof(l.itens) = 'array' THEN l.itens ELSE '[]'::jsonb END) AS i
+    GROUP BY 1, 2, 3, 4;
+
+-- Recalcula os rollups do zero
+CREATE OR REPLACE FUNCTION rollup_reconstruir()
+RETURNS TABLE (tabela TEXT, linhas BIGINT)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    LOCK TABLE lancamentos IN SHARE MODE;
+    DELETE FROM lancamentos_diario;
+    DELETE FROM lancamentos_diario_itens;
+    INSERT INTO lancamentos_diario SELECT * FROM lancamentos_diario_esperado;
+    INSERT INTO lancamentos_diario_itens SELECT * FROM lancamentos_diario_itens_esperado;
+
+    RETURN QUERY
+        SELECT 'lancamentos_diario', COUNT(*) FROM lancamentos_diario
+        UNION ALL
+        SELECT 'lancamentos_diario_itens', COUNT(*) FROM lancamentos_diario_itens;
+END;
+$$;
+
+-- Lista as diferenças entre os rollups gravados e os totais esperados
+CREATE OR REPLACE FUNCTION rollup_verificar(p_tolerancia DOUBLE PRECISION DEFAULT 0.005)
+RETURNS TABLE (
+    tabela TEXT,
+    data DATE,
+    chave TEXT,
+    producao_esperada DOUBLE PRECISION,
+    producao_atual DOUBLE PRECISION,
+    contagem_esperada INTEGER,
+    contagem_atual INTEGER
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT
+        'lancamentos_diario',
+        COALESCE(e.data, d.data),
+        COALESCE(e.turno, d.turno) || ' | ' || COALESCE(e.referencia_producao, d.referencia_producao),
+        e.producao, d.producao, e.lancamentos, d.lancamentos
+    FROM lancamentos_diario_esperado e
+    FULL OUTER JOIN lancamentos_diario d
+        ON d.data = e.data AND d.turno = e.turno AND d.referencia_producao = e.referencia_producao
+    WHERE e.data IS NULL OR d.data IS NULL
+       OR e.lancamentos <> d.lancamentos
+       OR ABS(e.producao - d.producao) > p_tolerancia
+       OR ABS(e.perdas - d.perdas) > p_tolerancia
+    UNION ALL
+    SELECT
+        'lancamentos_diario_itens',
+        COALESCE(e.data, d.data),
+        COALESCE(e.referencia_producao, d.referencia_producao) || ' | '
+            || COALESCE(e.formato, d.formato) || ' - ' || COALESCE(e.cor, d.cor),
+        e.producao, d.producao, e.itens, d.itens
+    FROM lancamentos_diario_itens_esperado e
+    FULL OUTER JOIN lancamentos_diario_itens d
+        ON d.data = e.data AND d.referencia_producao = e.referencia_producao
+       AND d.formato = e.formato AND d.cor = e.cor
+    WHERE e.data IS NULL OR d.data IS NULL
+       OR e.itens <> d.itens
+       OR ABS(e.producao - d.producao) > p_tolerancia
+    ORDER BY 2, 1, 3;
+$$;
+
+-- Carga inicial dos rollups
+SELECT * FROM rollup_reconstruir();
@@ -0,0 +1,82 @@
+-- SQL para a sincronização incremental de lançamentos
+-- (GET /api/lancamentos/changes?since=<cursor>)
+-- Execute este SQL no Supabase SQL Editor.
+-- updated_at passa a ser mantido por trigger em toda escrita e cada exclusão
+-- deixa uma marca em lancamentos_removidos. Sem este SQL o endpoint responde 501.
+
+-- Linhas já existentes ficam com o horário da migração
+ALTER TABLE lancamentos ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+
+-- Cursor de GET /api/lancamentos/changes (ORDER BY updated_at, id)
+CREATE INDEX IF NOT EXISTS idx_lancamentos_updated_at_id
+    ON lancamentos(updated_at, id);
+
+-- clock_timestamp() e não now(): now() é o início da transação, e uma
+-- transação longa gravaria um horário que o cursor dos clientes já passou
+CREATE OR REPLACE FUNCTION lancamentos_tocar_updated_at()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.updated_at := clock_timestamp();
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_lancamentos_updated_at ON lancamentos;
+CREATE TRIGGER trg_lancamentos_updated_at
+    BEFORE INSERT OR UPDATE ON lancamentos
+    FOR EACH ROW EXECUTE FUNCTION lancamentos_tocar_updated_at();
+
+-- Marcas de exclusão (tombstones): uma por id excluído
+CREATE TABLE IF NOT EXISTS lancamentos_removidos (
+    id TEXT PRIMARY KEY,
+    deleted_at TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp()
+);
+
+CREATE INDEX IF NOT EXISTS idx_lancamentos_removidos_deleted_at_id
+    ON lancamentos_removidos(deleted_at, id);
+
+ALTER TABLE lancamentos_removidos ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Enable all access for lancamentos_removidos" ON lancamentos_removidos;
+CREATE POLICY "Enable all access for lancamentos_removidos" ON lancamentos_removidos
+    FOR ALL USING (true) WITH CHECK (true);
+
+-- Exclusão grava a marca; um id que volta a ser inserido (ex.: lançamento
+-- reenviado por um tablet que estava offline) deixa de estar removido
+CREATE OR REPLACE FUNCTION lancamentos_removidos_trigger()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO lancamentos_removidos (id, deleted_at)
+        VALUES (OLD.id::TEXT, clock_timestamp())
+        ON CONFLICT (id) DO UPDATE SET deleted_at = EXCLUDED.deleted_at;
+    ELSE
+        DELETE FROM lancamentos_removidos WHERE id = NEW.id::TEXT;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_lancamentos_removidos ON lancamentos;
+CREATE TRIGGER trg_lancamentos_removidos
+    AFTER INSERT OR DELETE ON lancamentos
+    FOR EACH ROW EXECUTE FUNCTION lancamentos_removidos_trigger();
+
+-- Apaga as marcas mais antigas que a retenção; clientes com cursor anterior
+-- recebem 410 e sincronizam do zero. Mantenha p_dias igual a
+-- SYNC_RETENCAO_DIAS da API (ex.: agendado com pg_cron)
+CREATE OR REPLACE FUNCTION lancamentos_removidos_limpar(p_dias INTEGER DEFAULT 90)
+RETURNS BIGINT
+LANGUAGE sql
+AS $$
+    WITH apagadas AS (
+        DELETE FROM lancamentos_removidos
+        WHERE deleted_at < now() - make_interval(days => p_dias)
+        RETURNING 1
+    )
+    SELECT COUNT(*) FROM apagadas;
+$$;
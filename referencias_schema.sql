@@ -0,0 +1,103 @@
+-- SQL para a busca por referência (filtro referencia_producao de /api/lancamentos
+-- e /api/relatorios) e o autocomplete (GET /api/referencias/suggest)
+-- Execute este SQL no Supabase SQL Editor.
+-- Enquanto a função sugerir_referencias não existir, a API monta as sugestões
+-- a partir dos lançamentos mais recentes.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Índices trigram: ILIKE '%texto%' usa o índice em vez de varrer a tabela
+CREATE INDEX IF NOT EXISTS idx_lancamentos_referencia_producao_trgm
+    ON lancamentos USING gin (referencia_producao gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_lancamentos_referencia_lote_trgm
+    ON lancamentos USING gin (referencia_lote gin_trgm_ops);
+
+-- Referências distintas e quantos lançamentos usam cada uma, mantidas por
+-- trigger; o autocomplete consulta só esta tabela
+CREATE TABLE IF NOT EXISTS referencias_contagem (
+    campo TEXT NOT NULL,  -- 'producao' (referencia_producao) ou 'lote' (referencia_lote)
+    referencia TEXT NOT NULL,
+    lancamentos INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (campo, referencia)
+);
+
+CREATE INDEX IF NOT EXISTS idx_referencias_contagem_trgm
+    ON referencias_contagem USING gin (referencia gin_trgm_ops);
+
+ALTER TABLE referencias_contagem ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Enable all access for referencias_contagem" ON referencias_contagem;
+CREATE POLICY "Enable all access for referencias_contagem" ON referencias_contagem
+    FOR ALL USING (true) WITH CHECK (true);
+
+CREATE OR REPLACE FUNCTION referencias_contar(p_campo TEXT, p_referencia TEXT, p_sinal INTEGER)
+RETURNS VOID
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF COALESCE(btrim(p_referencia), '') = '' THEN
+        RETURN;
+    END IF;
+
+    INSERT INTO referencias_contagem AS r (campo, referencia, lancamentos)
+    VALUES (p_campo, p_referencia, p_sinal)
+    ON CONFLICT (campo, referencia) DO UPDATE
+        SET lancamentos = r.lancamentos + EXCLUDED.lancamentos;
+
+    DELETE FROM referencias_contagem
+    WHERE campo = p_campo AND referencia = p_referencia AND lancamentos <= 0;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION referencias_contagem_trigger()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM referencias_contar('producao', OLD.referencia_producao, -1);
+        PERFORM referencias_contar('lote', OLD.referencia_lote, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM referencias_contar('producao', NEW.referencia_producao, 1);
+        PERFORM referencias_contar('lote', NEW.referencia_lote, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_referencias_contagem ON lancamentos;
+CREATE TRIGGER trg_referencias_contagem
+    AFTER INSERT OR DELETE OR UPDATE OF referencia_producao, referencia_lote ON lancamentos
+    FOR EACH ROW EXECUTE FUNCTION referencias_contagem_trigger();
+
+-- Sugestões para o texto digitado: começa-com primeiro, depois as mais usadas
+CREATE OR REPLACE FUNCTION sugerir_referencias(
+    p_q TEXT,
+    p_campo TEXT DEFAULT 'producao',
+    p_limite INTEGER DEFAULT 10
+)
+RETURNS TABLE (referencia TEXT, lancamentos INTEGER)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT r.referencia, r.lancamentos
+    FROM referencias_contagem r
+    WHERE r.campo = p_campo
+      AND r.referencia ILIKE '%' || p_q || '%'
+    ORDER BY (r.referencia ILIKE p_q || '%') DESC, r.lancamentos DESC, r.referencia
+    LIMIT p_limite;
+$$;
+
+-- Carga inicial das contagens
+INSERT INTO referencias_contagem (campo, referencia, lancamentos)
+    SELECT 'producao', referencia_producao, COUNT(*)
+    FROM lancamentos
+    WHERE COALESCE(btrim(referencia_producao), '') <> ''
+    GROUP BY referencia_producao
+    UNION ALL
+    SELECT 'lote', referencia_lote, COUNT(*)
+    FROM lancamentos
+    WHERE COALESCE(btrim(referencia_lote), '') <> ''
+    GROUP BY referencia_lote
+ON CONFLICT (campo, referencia) DO UPDATE SET lancamentos = EXCLUDED.lancamentos;
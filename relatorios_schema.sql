@@ -0,0 +1,59 @@
+-- SQL para a agregação de relatórios no banco (GET /api/relatorios)
+-- Execute este SQL no Supabase SQL Editor.
+-- Enquanto a função não existir, a API agrega os lançamentos em Python.
+
+-- Índice para o filtro por período
+CREATE INDEX IF NOT EXISTS idx_lancamentos_data ON lancamentos(data);
+
+-- Retorna apenas as linhas agregadas do período:
+--   tipo = 'total'      -> totais gerais (uma linha)
+--   tipo = 'referencia' -> uma linha por referência de produção
+--   tipo = 'item'       -> uma linha por formato + cor (itens JSONB)
+CREATE OR REPLACE FUNCTION relatorio_agregado(
+    p_data_inicio DATE DEFAULT NULL,
+    p_data_fim DATE DEFAULT NULL,
+    p_referencia TEXT DEFAULT NULL
+)
+RETURNS TABLE (
+    tipo TEXT,
+    chave TEXT,
+    formato TEXT,
+    cor TEXT,
+    producao DOUBLE PRECISION,
+    perdas DOUBLE PRECISION,
+    dias BIGINT,
+    lancamentos BIGINT
+)
+LANGUAGE sql
+STABLE
+AS $$
+    WITH filtrados AS (
+        SELECT
+            l.data,
+            COALESCE(NULLIF(l.referencia_producao, ''), 'Sem Referência') AS referencia,
+            COALESCE(l.producao_total, 0)::DOUBLE PRECISION AS producao,
+            COALESCE(l.perdas_total, 0)::DOUBLE PRECISION AS perdas,
+            CASE WHEN jsonb_typeof(l.itens) = 'array' THEN l.itens ELSE '[]'::jsonb END AS itens
+        FROM lancamentos l
+        WHERE (p_data_inicio IS NULL OR l.data >= p_data_inicio)
+          AND (p_data_fim IS NULL OR l.data <= p_data_fim)
+          AND (p_referencia IS NULL OR l.referencia_producao ILIKE '%' || p_referencia || '%')
+    ),
+    itens AS (
+        SELECT
+            COALESCE(i->>'formato', 'N/A') AS formato,
+            COALESCE(i->>'cor', 'N/A') AS cor,
+            COALESCE(NULLIF(i->>'producao_kg', '')::DOUBLE PRECISION, 0) AS producao
+        FROM filtrados f, jsonb_array_elements(f.itens) AS i
+    )
+    SELECT 'total', NULL, NULL, NULL, SUM(producao), SUM(perdas), COUNT(DISTINCT data), COUNT(*)
+    FROM filtrados
+    UNION ALL
+    SELECT 'referencia', referencia, NULL, NULL, SUM(producao), SUM(perdas), COUNT(DISTINCT data), COUNT(*)
+    FROM filtrados
+    GROUP BY referencia
+    UNION ALL
+    SELECT 'item', formato || ' - ' || cor, formato, cor, SUM(producao), NULL, NULL, COUNT(*)
+    FROM itens
+    GROUP BY formato, cor;
+$$;
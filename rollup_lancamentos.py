@@ -0,0 +1,59 @@
+"""
+Confere ou reconstrói os rollups diários de lançamentos no Supabase.
+
+Uso:
+    python rollup_lancamentos.py --verificar     # lista divergências (padrão)
+    python rollup_lancamentos.py --reconstruir   # recalcula tudo do zero
+
+Requer as funções de lancamentos_rollup_schema.sql instaladas no banco e as
+variáveis de ambiente SUPABASE_URL e SUPABASE_KEY.
+"""
+import argparse
+import os
+import sys
+
+from supabase import create_client
+
+
+def verificar(supabase):
+    response = supabase.rpc("rollup_verificar", {}).execute()
+    divergencias = response.data or []
+
+    if not divergencias:
+        print("✅ Rollups conferem com a tabela lancamentos")
+        return 0
+
+    print(f"⚠️ {len(divergencias)} divergência(s) encontrada(s):\n")
+    for d in divergencias:
+        print(
+            f"   {d['tabela']} {d['data']} [{d['chave']}] "
+            f"produção esperada={d['producao_esperada']} atual={d['producao_atual']} "
+            f"contagem esperada={d['contagem_esperada']} atual={d['contagem_atual']}"
+        )
+    print("\n📝 Execute com --reconstruir para corrigir")
+    return 1
+
+
+def reconstruir(supabase):
+    response = supabase.rpc("rollup_reconstruir", {}).execute()
+    for linha in response.data or []:
+        print(f"✅ {linha['tabela']}: {linha['linhas']} linhas")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rollups diários de lançamentos")
+    grupo = parser.add_mutually_exclusive_group()
+    grupo.add_argument("--verificar", action="store_true", help="lista divergências entre rollups e lançamentos")
+    grupo.add_argument("--reconstruir", action="store_true", help="recalcula os rollups a partir dos lançamentos")
+    args = parser.parse_args()
+
+    supabase = create_client(os.environ['SUPABASE_URL'], os.environ['SUPABASE_KEY'])
+
+    if args.reconstruir:
+        return reconstruir(supabase)
+    return verificar(supabase)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
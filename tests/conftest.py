@@ -0,0 +1,153 @@
+"""
+Fixtures dos testes das duas APIs (backend/server.py e api/index.py).
+
+As APIs rodam sobre o FakeSupabase de benchmarks/fake_supabase.py, um
+PostgREST em memória, com o estado do módulo (caches, single-flight,
+disjuntor) zerado a cada teste. Os testes que precisam do Postgres de
+verdade (relatorio_agregado, trigger dos rollups, driver asyncpg) usam o
+banco de TEST_DATABASE_URL, que é APAGADO e recriado a cada teste; sem a
+variável eles são pulados:
+
+    TEST_DATABASE_URL=postgresql://postgres@localhost:5432/testes python -m pytest -q
+"""
+import asyncio
+import json
+import os
+import sys
+from collections import OrderedDict
+from pathlib import Path
+
+import pytest
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+for pasta in ("backend", "api", "benchmarks"):
+    if str(ROOT_DIR / pasta) not in sys.path:
+        sys.path.insert(0, str(ROOT_DIR / pasta))
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "teste.teste.teste")
+# Sem espera entre as tentativas das leituras
+os.environ.setdefault("SUPABASE_BACKOFF_MS", "0")
+
+from fake_supabase import FakeSupabase  # noqa: E402
+
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+
+# Tabela lancamentos como no Supabase, mais os schemas que as APIs usam
+LANCAMENTOS_DDL = """
+DROP TABLE IF EXISTS lancamentos, lancamentos_diario, lancamentos_diario_itens CASCADE;
+CREATE TABLE lancamentos (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    data DATE NOT NULL,
+    turno TEXT,
+    hora TEXT,
+    orelha_kg NUMERIC DEFAULT 0,
+    aparas_kg NUMERIC DEFAULT 0,
+    referencia_producao TEXT DEFAULT '',
+    referencia_lote TEXT DEFAULT '',
+    itens JSONB DEFAULT '[]'::jsonb,
+    producao_total NUMERIC DEFAULT 0,
+    perdas_total NUMERIC DEFAULT 0,
+    created_at TIMESTAMPTZ DEFAULT now()
+);
+"""
+SCHEMAS = ("relatorios_schema.sql", "lancamentos_rollup_schema.sql")
+
+
+def _zerar_estado(modulo, monkeypatch):
+    monkeypatch.setattr(modulo, "_disjuntor", modulo._Disjuntor(modulo.DISJUNTOR_FALHAS, modulo.DISJUNTOR_PAUSA))
+    monkeypatch.setattr(modulo, "_cache_relatorios",
+                        modulo._RelatorioCacheMemoria(modulo.RELATORIO_CACHE_MAX, modulo.RELATORIO_CACHE_TTL))
+    monkeypatch.setattr(modulo, "_relatorios_bons", OrderedDict())
+    monkeypatch.setattr(modulo, "_relatorios_em_andamento", {})
+    monkeypatch.setattr(modulo, "_cache_variaveis",
+                        {**modulo._cache_variaveis, "dados": None, "expira_em": 0.0, "boa": None})
+    monkeypatch.setattr(modulo, "_rpc_relatorio_disponivel", True)
+    monkeypatch.setattr(modulo, "_rollup_disponivel", None)
+    monkeypatch.setattr(modulo, "_admissao_relatorios", modulo._Admissao(
+        modulo.RELATORIO_PESADO_VAGAS, modulo.RELATORIO_PESADO_FILA, modulo.RELATORIO_PESADO_ESPERA
+    ))
+
+
+@pytest.fixture
+def banco():
+    banco = FakeSupabase()
+    banco.criar_tabela("lancamentos")
+    return banco
+
+
+@pytest.fixture
+def server(banco, monkeypatch):
+    """backend/server.py sobre o FakeSupabase"""
+    import server as modulo
+    monkeypatch.setattr(modulo, "supabase", banco)
+    _zerar_estado(modulo, monkeypatch)
+    monkeypatch.setattr(modulo, "_lancamentos", modulo._LancamentosSupabase())
+    monkeypatch.setattr(modulo, "_broker_lancamentos", modulo._criar_broker_lancamentos())
+    monkeypatch.setattr(modulo, "_publicacoes", set())
+    monkeypatch.setattr(modulo, "_publicacoes_lock", asyncio.Lock())
+    return modulo
+
+
+@pytest.fixture
+def index(banco, monkeypatch):
+    """api/index.py sobre o FakeSupabase"""
+    import index as modulo
+    monkeypatch.setattr(modulo, "supabase", banco)
+    _zerar_estado(modulo, monkeypatch)
+    return modulo
+
+
+@pytest.fixture
+def cliente_server(server):
+    from fastapi.testclient import TestClient
+    with TestClient(server.app) as cliente:
+        yield cliente
+
+
+@pytest.fixture
+def cliente_index(index):
+    return index.app.test_client()
+
+
+def corpo_json(resposta):
+    """JSON body of a TestClient (httpx) or Flask test client response"""
+    return resposta.get_json() if hasattr(resposta, "get_json") else resposta.json()
+
+
+async def executar_sql(dsn: str, sql: str, *args) -> list:
+    import asyncpg
+    conn = await asyncpg.connect(dsn)
+    try:
+        await conn.set_type_codec('jsonb', encoder=json.dumps, decoder=json.loads, schema='pg_catalog')
+        if args:
+            return await conn.fetch(sql, *args)
+        await conn.execute(sql)
+        return []
+    finally:
+        await conn.close()
+
+
+@pytest.fixture
+def postgres():
+    """DSN de um banco com lancamentos, relatorio_agregado e os rollups, vazio"""
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL não definida")
+    pytest.importorskip("asyncpg")
+    sql = LANCAMENTOS_DDL + "".join((ROOT_DIR / arquivo).read_text() for arquivo in SCHEMAS)
+    asyncio.run(executar_sql(TEST_DATABASE_URL, sql))
+    return TEST_DATABASE_URL
+
+
+@pytest.fixture
+def inserir_postgres(postgres):
+    """Insert lancamentos rows (dicts in the API's JSON shape) straight into Postgres"""
+    def inserir(linhas: list):
+        colunas = ", ".join(linhas[0])
+        asyncio.run(executar_sql(
+            postgres,
+            f"INSERT INTO lancamentos ({colunas}) "
+            f"SELECT {colunas} FROM jsonb_populate_recordset(NULL::lancamentos, $1::jsonb) RETURNING id",
+            linhas
+        ))
+    return inserir
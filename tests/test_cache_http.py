@@ -0,0 +1,106 @@
+"""
+Cache HTTP: no api/index.py as leituras públicas vão para a CDN com o ETag
+das versões de versoes_dados (304 quando o If-None-Match confere, s-maxage e
+stale-while-revalidate só para períodos encerrados, ETag novo a cada versão);
+nas duas APIs o ETag é fraco e o mesmo para o corpo em gzip, brotli ou sem
+compressão.
+"""
+from datetime import date
+
+import bench_api
+import pytest
+
+from .conftest import corpo_json
+
+FECHADO = "/api/relatorios?periodo=customizado&data_inicio=2025-03-01&data_fim=2025-03-31"
+
+
+@pytest.fixture
+def cdn(index, banco, cliente_index):
+    """Flask test client with versoes_dados installed and a closed month of data"""
+    banco.criar_tabela("versoes_dados", [{"recurso": "lancamentos:2025-03", "versao": 1},
+                                         {"recurso": "variaveis", "versao": 1}])
+    banco.tabelas["lancamentos"].append({
+        "id": "lanc-1", "data": "2025-03-10", "turno": "Manhã", "hora": "08:00", "referencia_producao": "REF-A",
+        "itens": [{"formato": "20x30", "cor": "Azul", "producao_kg": 40.5}], "producao_total": 40.5,
+        "perdas_total": 1.5,
+    })
+    return cliente_index
+
+
+def _versao(banco, recurso: str):
+    linha = next(l for l in banco.tabelas["versoes_dados"] if l["recurso"] == recurso)
+    linha["versao"] += 1
+
+
+def test_periodo_encerrado_vai_para_a_cdn_e_revalida_com_304(cdn):
+    primeira = cdn.get(FECHADO)
+    etag = primeira.headers["ETag"]
+    assert primeira.status_code == 200
+    assert etag.startswith('W/"')
+    assert "s-maxage=" in primeira.headers["Cache-Control"]
+    assert "stale-while-revalidate=" in primeira.headers["Cache-Control"]
+
+    revalidada = cdn.get(FECHADO, headers={"If-None-Match": etag})
+    assert revalidada.status_code == 304
+    assert revalidada.get_data() == b""
+    assert revalidada.headers["ETag"] == etag
+    assert revalidada.headers["Cache-Control"] == primeira.headers["Cache-Control"]
+    # A forma forte do mesmo ETag também confere
+    assert cdn.get(FECHADO, headers={"If-None-Match": etag.removeprefix("W/")}).status_code == 304
+
+
+def test_periodo_aberto_fica_fora_da_cdn(cdn):
+    hoje = date.today().isoformat()
+    resposta = cdn.get(f"/api/relatorios?periodo=customizado&data_inicio=2025-03-01&data_fim={hoje}")
+
+    assert resposta.status_code == 200
+    assert "s-maxage" not in resposta.headers["Cache-Control"]
+    assert "stale-while-revalidate" not in resposta.headers["Cache-Control"]
+    assert "no-store" in resposta.headers["Cache-Control"]
+    assert "ETag" not in resposta.headers
+
+
+def test_versao_nova_muda_o_etag_e_recalcula(cdn, banco):
+    primeira = cdn.get(FECHADO)
+    assert corpo_json(primeira)["producao_total"] == 40.5
+
+    # Escrita vista por outra instância: só a versão do mês mudou aqui
+    banco.tabelas["lancamentos"][0]["producao_total"] = 50
+    _versao(banco, "lancamentos:2025-03")
+    segunda = cdn.get(FECHADO, headers={"If-None-Match": primeira.headers["ETag"]})
+    assert segunda.status_code == 200
+    assert segunda.headers["ETag"] != primeira.headers["ETag"]
+    assert corpo_json(segunda)["producao_total"] == 50
+
+    # Versão de outro recurso não muda o ETag do relatório
+    _versao(banco, "variaveis")
+    assert cdn.get(FECHADO, headers={"If-None-Match": segunda.headers["ETag"]}).status_code == 304
+
+
+def test_etag_de_variaveis_acompanha_a_versao(cdn, banco):
+    bench_api.popular(banco, 3, 1, 1, 1)
+    etag = cdn.get("/api/variaveis").headers["ETag"]
+    assert cdn.get("/api/variaveis", headers={"If-None-Match": etag}).status_code == 304
+
+    _versao(banco, "variaveis")
+    assert cdn.get("/api/variaveis", headers={"If-None-Match": etag}).status_code == 200
+
+
+@pytest.mark.parametrize("nome", ["server", "index"])
+def test_mesmo_etag_fraco_para_cada_codificacao(request, banco, nome):
+    # Variáveis suficientes para passar de COMPRESSAO_MIN_BYTES
+    bench_api.popular(banco, 3, 1, 1, 1)
+    cliente = request.getfixturevalue(f"cliente_{nome}")
+
+    respostas = {codificacao: cliente.get("/api/variaveis", headers={"Accept-Encoding": codificacao})
+                 for codificacao in ("gzip", "br", "identity")}
+    assert {c: r.headers.get("Content-Encoding") for c, r in respostas.items()} == \
+        {"gzip": "gzip", "br": "br", "identity": None}
+    etags = {r.headers["ETag"] for r in respostas.values()}
+    assert len(etags) == 1
+    etag = etags.pop()
+    assert etag.startswith('W/"')
+    for codificacao in ("gzip", "br", "identity"):
+        revalidada = cliente.get("/api/variaveis", headers={"If-None-Match": etag, "Accept-Encoding": codificacao})
+        assert revalidada.status_code == 304
@@ -0,0 +1,107 @@
+"""
+Paginação por cursor de GET /api/lancamentos nas duas APIs: a ordem é
+(data, hora, id) decrescente, com as horas nulas primeiro em cada dia, como
+no ORDER BY ... DESC do Postgres.
+"""
+import asyncio
+import base64
+import json
+
+import pytest
+
+from .conftest import corpo_json
+
+
+def _id(n: int) -> str:
+    return f"00000000-0000-0000-0000-{n:012d}"
+
+
+LINHAS = (
+    # três lançamentos na mesma data e hora: só o id desempata
+    [{"id": _id(n), "data": "2026-03-02", "turno": "Manhã", "hora": "08:00", "producao_total": n} for n in (3, 1, 2)]
+    # lançamentos sem hora, antes e depois dos demais do dia
+    + [{"id": _id(n), "data": "2026-03-02", "turno": "Tarde", "hora": None, "producao_total": n} for n in (5, 4, 6)]
+    + [{"id": _id(7), "data": "2026-03-02", "turno": "Noite", "hora": "22:00", "producao_total": 7},
+       {"id": _id(8), "data": "2026-03-01", "turno": "Noite", "hora": None, "producao_total": 8},
+       {"id": _id(9), "data": "2026-03-03", "turno": "Manhã", "hora": "06:00", "producao_total": 9},
+       {"id": _id(10), "data": "2026-03-01", "turno": "Manhã", "hora": "08:00", "producao_total": 10}]
+)
+ORDEM = [l["id"] for l in sorted(
+    LINHAS, key=lambda l: (l["data"], l["hora"] is None, l["hora"] or "", l["id"]), reverse=True
+)]
+
+
+def _cursor(valores) -> str:
+    return base64.urlsafe_b64encode(json.dumps(valores).encode()).decode().rstrip('=')
+
+
+@pytest.fixture(params=["server", "index"])
+def cliente(request, banco):
+    banco.criar_tabela("lancamentos", LINHAS)
+    if request.param == "server":
+        return request.getfixturevalue("cliente_server")
+    return request.getfixturevalue("cliente_index")
+
+
+def _get(cliente, url: str):
+    resposta = cliente.get(url)
+    return resposta.status_code, corpo_json(resposta), resposta.headers
+
+
+def _paginar(cliente, limite: int) -> list:
+    vistos, cursor = [], None
+    while True:
+        url = f"/api/lancamentos?limit={limite}&fields=id" + (f"&cursor={cursor}" if cursor else "")
+        status, corpo, headers = _get(cliente, url)
+        assert status == 200, corpo
+        vistos += [l["id"] for l in corpo]
+        cursor = headers.get("X-Next-Cursor")
+        if not cursor:
+            return vistos
+
+
+@pytest.mark.parametrize("limite", [1, 2, 4])
+def test_paginas_seguem_a_ordem_sem_pular_nem_repetir(cliente, limite):
+    assert _paginar(cliente, limite) == ORDEM
+
+
+def test_continua_depois_de_hora_nula(cliente):
+    # Cursor parado no segundo lançamento sem hora de 2026-03-02
+    status, corpo, _ = _get(cliente, f"/api/lancamentos?limit=100&fields=id&cursor={_cursor(['2026-03-02', None, _id(5)])}")
+    assert status == 200
+    assert [l["id"] for l in corpo] == ORDEM[ORDEM.index(_id(5)) + 1:]
+
+
+@pytest.mark.parametrize("cursor", [
+    "nao-e-um-cursor!",
+    _cursor(["2026-03-02", "08:00"]),
+    _cursor(["ontem", "08:00", _id(1)]),
+    _cursor(["2026-03-02", 8, _id(1)]),
+    _cursor(["2026-03-02", "08:00", None]),
+    # aspas fechariam o valor no filtro or= do PostgREST
+    _cursor(["2026-03-02", '08:00",id.gt."0', _id(1)]),
+    _cursor(["2026-03-02", "08:00", _id(1) + '\\"']),
+    _cursor(['2026-03-02"', "08:00", _id(1)]),
+])
+def test_cursor_adulterado_responde_400(cliente, cursor):
+    status, _, _ = _get(cliente, f"/api/lancamentos?limit=2&cursor={cursor}")
+    assert status == 400
+
+
+def test_driver_postgres_pagina_na_mesma_ordem(server, inserir_postgres, postgres):
+    inserir_postgres([{**l, "itens": []} for l in LINHAS])
+
+    async def paginar():
+        repositorio = server._LancamentosPostgres(postgres)
+        vistos, cursor = [], None
+        try:
+            while True:
+                linhas, _ = await repositorio.listar("id,data,hora", None, None, None, cursor, limite=2)
+                vistos += [l["id"] for l in linhas]
+                if len(linhas) < 2:
+                    return vistos
+                cursor = server._codificar_cursor(linhas[-1])
+        finally:
+            await repositorio.fechar()
+
+    assert asyncio.run(paginar()) == ORDEM
@@ -0,0 +1,109 @@
+"""
+Idempotency-Key em POST /api/lancamentos e resultados por índice em
+POST /api/lancamentos/bulk, nas duas APIs.
+"""
+import fake_supabase
+import pytest
+from postgrest.exceptions import APIError
+
+from .conftest import corpo_json
+
+
+def _lancamento(**campos):
+    return {
+        "data": "2026-03-02", "turno": "Manhã", "hora": "08:00", "orelha_kg": 1, "aparas_kg": 0.5,
+        "referencia_producao": "REF-A", "referencia_lote": "L001",
+        "itens": [{"formato": "20x30", "cor": "Azul", "pacote_kg": 10, "producao_kg": 40.5}],
+        **campos
+    }
+
+
+@pytest.fixture(params=["server", "index"])
+def cliente(request):
+    return request.getfixturevalue(f"cliente_{request.param}")
+
+
+@pytest.fixture
+def recusar_turno(monkeypatch):
+    """Make the fake database reject (check violation) writes of rows with this turno"""
+    execute = fake_supabase.FakeQuery.execute
+
+    def execute_com_restricao(query):
+        if query._operacao in ("insert", "upsert") and any(l.get("turno") == "Recusado" for l in query._payload):
+            raise APIError({"code": "23514", "message": "new row violates check constraint"})
+        return execute(query)
+
+    monkeypatch.setattr(fake_supabase.FakeQuery, "execute", execute_com_restricao)
+
+
+def test_mesma_chave_cria_uma_linha_so(cliente, banco):
+    chave = {"Idempotency-Key": "pedido-123"}
+    primeira = cliente.post("/api/lancamentos", json=_lancamento(), headers=chave)
+    repeticoes = [cliente.post("/api/lancamentos", json=_lancamento(), headers=chave) for _ in range(2)]
+
+    assert primeira.status_code in (200, 201)
+    assert "Idempotent-Replayed" not in primeira.headers
+    lancamento_id = corpo_json(primeira)["id"]
+    for resposta in repeticoes:
+        assert resposta.status_code == 200
+        assert resposta.headers["Idempotent-Replayed"] == "true"
+        assert corpo_json(resposta) == {"success": True, "id": lancamento_id}
+    assert [l["id"] for l in banco.tabelas["lancamentos"]] == [lancamento_id]
+
+
+def test_mesma_chave_com_outro_corpo_responde_422(cliente, banco):
+    chave = {"Idempotency-Key": "pedido-123"}
+    lancamento_id = corpo_json(cliente.post("/api/lancamentos", json=_lancamento(), headers=chave))["id"]
+    divergente = cliente.post("/api/lancamentos", json=_lancamento(turno="Tarde"), headers=chave)
+
+    assert divergente.status_code == 422
+    assert "Idempotent-Replayed" not in divergente.headers
+    assert [l["id"] for l in banco.tabelas["lancamentos"]] == [lancamento_id]
+    gravado = corpo_json(cliente.get(f"/api/lancamentos/{lancamento_id}"))
+    assert (gravado["turno"], gravado["producao_total"]) == ("Manhã", 40.5)
+
+
+def test_sem_chave_cada_requisicao_cria_uma_linha(cliente, banco):
+    ids = {corpo_json(cliente.post("/api/lancamentos", json=_lancamento()))["id"] for _ in range(2)}
+    assert len(ids) == 2
+    assert len(banco.tabelas["lancamentos"]) == 2
+
+
+def test_lote_misto_responde_um_resultado_por_indice(server, index, cliente, banco, recusar_turno, monkeypatch):
+    # Lotes de duas linhas: a recusada pelo banco faz o seu lote ser refeito linha a linha
+    monkeypatch.setattr(server, "LANCAMENTOS_BULK_LOTE", 2)
+    monkeypatch.setattr(index, "LANCAMENTOS_BULK_LOTE", 2)
+    entradas = [
+        _lancamento(hora="06:00"),
+        {"turno": "Manhã"},
+        _lancamento(hora="07:00"),
+        _lancamento(data="2026-13-40"),
+        _lancamento(turno="Recusado"),
+        _lancamento(hora="09:00"),
+    ]
+    chave = {"Idempotency-Key": "planilha-marco"}
+
+    primeira = corpo_json(cliente.post("/api/lancamentos/bulk", json={"lancamentos": entradas}, headers=chave))
+    assert [r["indice"] for r in primeira["resultados"]] == list(range(len(entradas)))
+    assert [r["status"] for r in primeira["resultados"]] == ["criado", "erro", "criado", "erro", "erro", "criado"]
+    assert (primeira["total"], primeira["criados"], primeira["duplicados"], primeira["erros"]) == (6, 3, 0, 3)
+    assert "check constraint" in primeira["resultados"][4]["erro"]
+
+    # Reenvio do mesmo lote: as linhas gravadas voltam como duplicadas, com os mesmos ids
+    segunda = corpo_json(cliente.post("/api/lancamentos/bulk", json={"lancamentos": entradas}, headers=chave))
+    assert [r["status"] for r in segunda["resultados"]] == ["duplicado", "erro", "duplicado", "erro", "erro", "duplicado"]
+    assert [r.get("id") for r in segunda["resultados"]] == [r.get("id") for r in primeira["resultados"]]
+    assert sorted(l["hora"] for l in banco.tabelas["lancamentos"]) == ["06:00", "07:00", "09:00"]
+
+
+def test_reenvio_do_lote_com_linha_alterada_marca_so_ela_como_erro(cliente, banco):
+    entradas = [_lancamento(hora="06:00"), _lancamento(hora="07:00")]
+    chave = {"Idempotency-Key": "planilha-abril"}
+    cliente.post("/api/lancamentos/bulk", json={"lancamentos": entradas}, headers=chave)
+
+    entradas[1]["orelha_kg"] = 3
+    reenvio = corpo_json(cliente.post("/api/lancamentos/bulk", json={"lancamentos": entradas}, headers=chave))
+    assert [r["status"] for r in reenvio["resultados"]] == ["duplicado", "erro"]
+    assert "outro conteúdo" in reenvio["resultados"][1]["erro"]
+    assert (reenvio["criados"], reenvio["duplicados"], reenvio["erros"]) == (0, 1, 1)
+    assert sorted(l["orelha_kg"] for l in banco.tabelas["lancamentos"]) == [1, 1]
@@ -0,0 +1,99 @@
+"""
+Importação de histórico (POST /api/lancamentos/import) nas duas APIs: CSV e
+XLSX no layout do export, erro por linha, gravação em lotes de IMPORT_LOTE
+com um evento de progresso por lote e a Idempotency-Key.
+"""
+import io
+import json
+
+import pytest
+
+REPETIDO = "00000000-0000-0000-0000-000000000042"
+CABECALHO = ["id", "data", "turno", "hora", "orelha_kg", "aparas_kg", "referencia_producao", "referencia_lote",
+             "formato", "cor", "pacote_kg", "producao_kg"]
+# Seis lançamentos: o primeiro com dois itens, dois inválidos e um id repetido fora de sequência
+# com outro conteúdo
+LINHAS = [
+    ["", "02/03/2026", "Manhã", "08:00", "1,5", "0,5", "REF-A", "L001", "20x30", "Azul", "10", "40,5"],
+    ["", "02/03/2026", "Manhã", "08:00", "1,5", "0,5", "REF-A", "L001", "25x40", "Verde", "10", "12"],
+    ["", "2026-03-02", "Tarde", "14:00", "0", "0", "REF-B", "L002", "20x30", "Azul", "10", "abc"],
+    ["", "2026-03-02", "Madrugada", "22:00", "0", "0", "REF-C", "L003", "20x30", "Azul", "10", "5"],
+    [REPETIDO, "2026-03-03", "Noite", "22:00", "0", "0", "REF-C", "L004", "20x30", "Azul", "5", "8"],
+    ["", "2026-03-04", "Tarde", "15:00", "0", "0", "REF-D", "L005", "25x40", "Verde", "5", "3"],
+    [REPETIDO, "2026-03-05", "Manhã", "09:00", "0", "0", "REF-C", "L006", "20x30", "Azul", "5", "9"],
+]
+VARIAVEIS = [("turno", "Manhã"), ("turno", "Tarde"), ("turno", "Noite"), ("formato", "20x30"), ("formato", "25x40"),
+             ("cor", "Azul"), ("cor", "Verde")]
+
+
+def _csv() -> bytes:
+    return "\n".join(";".join(linha) for linha in [CABECALHO, *LINHAS]).encode("utf-8")
+
+
+def _xlsx() -> bytes:
+    openpyxl = pytest.importorskip("openpyxl")
+    workbook = openpyxl.Workbook()
+    for linha in [CABECALHO, *LINHAS]:
+        workbook.active.append(linha)
+    arquivo = io.BytesIO()
+    workbook.save(arquivo)
+    return arquivo.getvalue()
+
+
+@pytest.fixture(params=["server", "index"])
+def importar(request, banco, monkeypatch):
+    """POST a file to /api/lancamentos/import and return its NDJSON events"""
+    banco.criar_tabela("variaveis", [
+        {"id": str(i), "tipo": tipo, "nome": nome, "ordem": i} for i, (tipo, nome) in enumerate(VARIAVEIS)
+    ])
+    # Lotes de dois lançamentos: três lotes para o arquivo inteiro
+    monkeypatch.setattr(request.getfixturevalue(request.param), "IMPORT_LOTE", 2)
+    cliente = request.getfixturevalue(f"cliente_{request.param}")
+
+    def enviar(corpo: bytes, **headers) -> list:
+        if request.param == "server":
+            resposta = cliente.post("/api/lancamentos/import", content=corpo, headers=headers)
+            texto = resposta.text
+        else:
+            resposta = cliente.post("/api/lancamentos/import", data=corpo, headers=headers)
+            texto = resposta.get_data(as_text=True)
+        assert resposta.status_code == 200, texto
+        return [json.loads(linha) for linha in texto.splitlines()]
+    return enviar
+
+
+@pytest.mark.parametrize("arquivo", [_csv, _xlsx], ids=["csv", "xlsx"])
+def test_importa_com_erros_por_linha_e_progresso_por_lote(importar, banco, arquivo):
+    eventos = importar(arquivo(), **{"Idempotency-Key": "planilha-marco"})
+
+    erros = [e for e in eventos if e["tipo"] == "erro"]
+    assert [e["linha"] for e in erros] == [4, 5, 8]
+    assert "abc" in erros[0]["erro"] and "Madrugada" in erros[1]["erro"]
+    assert "outro conteúdo" in erros[2]["erro"]
+    progresso = [(e["ultima_linha"], e["lancamentos"], e["gravados"], e["duplicados"])
+                 for e in eventos if e["tipo"] == "progresso"]
+    # O id repetido chega num lote seguinte com outro conteúdo: é erro, não duplicado
+    assert progresso == [(4, 1, 1, 0), (6, 2, 2, 0), (8, 4, 3, 0)]
+    resumo = eventos[-1]
+    assert resumo["tipo"] == "resumo"
+    assert (resumo["lancamentos"], resumo["gravados"], resumo["duplicados"], resumo["erros"]) == (4, 3, 0, 3)
+
+    por_lote = {l["referencia_lote"]: l for l in banco.tabelas["lancamentos"]}
+    assert sorted(por_lote) == ["L001", "L004", "L005"]
+    assert por_lote["L004"]["id"] == REPETIDO
+    primeiro = por_lote["L001"]
+    assert (primeiro["data"], primeiro["orelha_kg"], primeiro["producao_total"]) == ("2026-03-02", 1.5, 52.5)
+    assert [(i["formato"], i["cor"]) for i in primeiro["itens"]] == [("20x30", "Azul"), ("25x40", "Verde")]
+
+
+def test_reenvio_com_a_mesma_chave_nao_duplica(importar, banco):
+    chave = {"Idempotency-Key": "planilha-marco"}
+    primeira = importar(_csv(), **chave)[-1]
+    segunda = importar(_csv(), **chave)[-1]
+    sem_chave = importar(_csv())[-1]
+
+    assert (primeira["gravados"], primeira["duplicados"], primeira["erros"]) == (3, 0, 3)
+    assert (segunda["gravados"], segunda["duplicados"], segunda["erros"]) == (0, 3, 3)
+    # Sem a chave só o id que veio no arquivo se repete
+    assert (sem_chave["gravados"], sem_chave["duplicados"], sem_chave["erros"]) == (2, 1, 3)
+    assert len(banco.tabelas["lancamentos"]) == 5
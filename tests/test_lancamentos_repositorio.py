@@ -0,0 +1,188 @@
+"""
+Contrato dos drivers de lancamentos (DB_DRIVER): _LancamentosSupabase, sobre
+o FakeSupabase, e _LancamentosPostgres, sobre o banco de TEST_DATABASE_URL,
+respondem igual a cada caso. Sem TEST_DATABASE_URL só o driver supabase roda.
+"""
+import asyncio
+import copy
+
+import pytest
+
+from .conftest import corpo_json
+
+
+def _id(n: int) -> str:
+    return f"00000000-0000-0000-0000-{n:012d}"
+
+
+def _linha(n, data, hora, referencia, producao, itens):
+    return {
+        "id": _id(n), "data": data, "turno": "Manhã", "hora": hora, "orelha_kg": 0.5, "aparas_kg": 0.25,
+        "referencia_producao": referencia, "referencia_lote": f"L{n:03d}", "itens": itens,
+        "producao_total": producao, "perdas_total": 0.75,
+    }
+
+
+LINHAS = [
+    _linha(1, "2026-03-02", "08:00", "REF-A", 30.5, [{"formato": "20x30", "cor": "Azul", "producao_kg": 30.5}]),
+    _linha(2, "2026-03-02", "08:00", "ref-a 2", 12, [{"formato": "20x30", "cor": "Verde", "producao_kg": 12}]),
+    _linha(3, "2026-03-02", None, "REF-B", 4.25, [{"formato": None, "cor": "Azul", "producao_kg": 4.25}]),
+    _linha(4, "2026-03-02", None, "", 8, []),
+    _linha(5, "2026-03-03", "14:00", "REF-B", 16.5, [{"formato": "30x40", "cor": "Azul", "producao_kg": 16.5}]),
+    _linha(6, "2026-02-27", "22:00", "REF-A", 2, [{"formato": "20x30", "cor": "Azul", "producao_kg": 2}]),
+    _linha(7, "2026-03-03", "06:00", None, 1.5, [{"formato": "20x30", "cor": "Azul", "producao_kg": 1.5}]),
+]
+ORDEM = [l["id"] for l in sorted(
+    LINHAS, key=lambda l: (l["data"], l["hora"] is None, l["hora"] or "", l["id"]), reverse=True
+)]
+
+
+class _Driver:
+    """One lancamentos driver under test and a way to seed its database"""
+
+    def __init__(self, nome, criar, semear):
+        self.nome, self.criar, self.semear = nome, criar, semear
+
+    def rodar(self, corpo):
+        """Run ``corpo(repositorio)`` in a fresh event loop, closing the driver after"""
+        async def principal():
+            repositorio = self.criar()
+            try:
+                return await corpo(repositorio)
+            finally:
+                await repositorio.fechar()
+        return asyncio.run(principal())
+
+
+@pytest.fixture(params=["supabase", "postgres"])
+def driver(request, server, banco):
+    if request.param == "supabase":
+        return _Driver("supabase", server._LancamentosSupabase,
+                       lambda linhas: banco.criar_tabela("lancamentos", copy.deepcopy(linhas)))
+    dsn = request.getfixturevalue("postgres")
+    return _Driver("postgres", lambda: server._LancamentosPostgres(dsn), request.getfixturevalue("inserir_postgres"))
+
+
+def test_lista_em_ordem_e_continua_pelo_cursor(server, driver):
+    driver.semear(LINHAS)
+
+    async def paginar(repositorio):
+        paginas, cursor = [], None
+        while True:
+            linhas, total = await repositorio.listar("id,data,hora", None, None, None, cursor,
+                                                     limite=3, contar=cursor is None)
+            paginas.append(([l["id"] for l in linhas], total))
+            if len(linhas) < 3:
+                return paginas
+            cursor = server._codificar_cursor(linhas[-1])
+
+    paginas = driver.rodar(paginar)
+    assert [i for ids, _ in paginas for i in ids] == ORDEM
+    # O total só vem na primeira página
+    assert [total for _, total in paginas] == [len(LINHAS)] + [None] * (len(paginas) - 1)
+
+
+def test_filtra_por_periodo_e_referencia(driver):
+    driver.semear(LINHAS)
+
+    async def listar(repositorio):
+        return await repositorio.listar("id", "2026-03-01", "2026-03-31", "  ref-A ", contar=True)
+
+    linhas, total = driver.rodar(listar)
+    assert [l["id"] for l in linhas] == [_id(2), _id(1)]
+    assert total == 2
+
+
+def test_projecao_devolve_so_as_colunas_pedidas(driver):
+    driver.semear(LINHAS)
+
+    async def listar(repositorio):
+        linhas, _ = await repositorio.listar("id,data,hora,producao_total,itens", None, None, None, limite=2)
+        return linhas
+
+    por_id = {l["id"]: l for l in LINHAS}
+    for linha in driver.rodar(listar):
+        assert linha == {c: por_id[linha["id"]][c] for c in ("id", "data", "hora", "producao_total", "itens")}
+
+
+def test_obter_por_id(driver):
+    driver.semear(LINHAS)
+
+    async def obter(repositorio):
+        return [await repositorio.obter(i) for i in (_id(3), _id(99), "nao-e-um-uuid")]
+
+    encontrado, ausente, invalido = driver.rodar(obter)
+    assert {c: encontrado[c] for c in LINHAS[2]} == LINHAS[2]
+    assert ausente is None
+    assert invalido is None
+
+
+def test_obter_varios_por_id(driver):
+    driver.semear(LINHAS)
+
+    async def obter_varios(repositorio):
+        return await repositorio.obter_varios([_id(2), _id(4), _id(99)]), await repositorio.obter_varios([])
+
+    encontrados, vazio = driver.rodar(obter_varios)
+    assert sorted(encontrados) == [_id(2), _id(4)]
+    assert {c: encontrados[_id(4)][c] for c in LINHAS[3]} == LINHAS[3]
+    assert vazio == {}
+
+
+def test_get_por_id_inexistente_responde_404(server, driver, monkeypatch):
+    from fastapi.testclient import TestClient
+    driver.semear(LINHAS)
+    monkeypatch.setattr(server, "_lancamentos", driver.criar())
+
+    # O shutdown do TestClient fecha o driver, no mesmo loop que o abriu
+    with TestClient(server.app) as cliente:
+        assert corpo_json(cliente.get(f"/api/lancamentos/{_id(5)}"))["producao_total"] == 16.5
+        assert cliente.get(f"/api/lancamentos/{_id(99)}").status_code == 404
+        assert cliente.get("/api/lancamentos/nao-e-um-uuid").status_code == 404
+
+
+def test_inserir_e_repetir_com_o_mesmo_id(server, driver):
+    lancamento = server.LancamentoCreate(
+        data="2026-03-04", turno="Tarde", hora="15:00", orelha_kg=1, aparas_kg=0.5, referencia_producao="REF-C",
+        itens=[{"formato": "20x30", "cor": "Azul", "pacote_kg": 10, "producao_kg": 40.5}]
+    )
+    documento = server._documento_lancamento(lancamento, server._id_lancamento("chave-1"))
+    outro = server._documento_lancamento(lancamento, server._id_lancamento("chave-2"))
+
+    async def inserir(repositorio):
+        primeiro = await repositorio.inserir([documento])
+        repetido = await repositorio.inserir([documento])
+        misturado = await repositorio.inserir([documento, outro])
+        linhas, total = await repositorio.listar("id", None, None, None, contar=True)
+        return primeiro, repetido, misturado, total, await repositorio.obter(documento["id"])
+
+    primeiro, repetido, misturado, total, gravado = driver.rodar(inserir)
+    assert primeiro == {documento["id"]}
+    # Ids que já existem não voltam: a API responde Idempotent-Replayed
+    assert repetido == set()
+    assert misturado == {outro["id"]}
+    assert total == 2
+    assert {c: gravado[c] for c in documento} == documento
+
+
+@pytest.mark.parametrize("backend", ["rpc", "python"])
+@pytest.mark.parametrize("periodo", [("2026-03-01", "2026-03-31", None), ("2026-03-01", "2026-03-31", "ref-b"),
+                                     (None, None, None)])
+def test_relatorio_igual_ao_agregado_das_linhas(server, driver, monkeypatch, backend, periodo):
+    monkeypatch.setattr(server, "RELATORIO_BACKEND", backend)
+    driver.semear(LINHAS)
+    data_inicio, data_fim, referencia = periodo
+    filtradas = [
+        l for l in LINHAS
+        if (not data_inicio or data_inicio <= l["data"] <= data_fim)
+        and (not referencia or referencia.lower() in (l["referencia_producao"] or "").lower())
+    ]
+
+    async def agregar(repositorio):
+        return await repositorio.agregar_relatorio(data_inicio, data_fim, referencia)
+
+    def montar(agregado):
+        relatorio = server._montar_relatorio(agregado, data_inicio, data_fim)
+        return {**relatorio, "por_item": sorted(relatorio["por_item"], key=lambda item: item["item"])}
+
+    assert montar(driver.rodar(agregar)) == montar(server._agregar_lancamentos(filtradas))
@@ -0,0 +1,109 @@
+"""
+Sincronização incremental (GET /api/lancamentos/changes) nas duas APIs,
+sobre o FakeSupabase com as colunas de lancamentos_sync_schema.sql:
+updated_at em lancamentos e as marcas de exclusão em lancamentos_removidos,
+semeadas direto nas tabelas (o fake não tem os triggers).
+"""
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlencode
+
+import pytest
+
+from .conftest import corpo_json
+
+
+def _momento(segundos_atras: float) -> str:
+    return (datetime.now(timezone.utc) - timedelta(seconds=segundos_atras)).isoformat()
+
+
+def _linha(n: int, updated_at: str) -> dict:
+    return {"id": f"lanc-{n}", "data": "2026-03-02", "turno": "Manhã", "hora": "08:00",
+            "producao_total": 10, "perdas_total": 1, "updated_at": updated_at}
+
+
+@pytest.fixture(params=["server", "index"])
+def app(request, banco, monkeypatch):
+    """(API module, test client) with the sync tables and no settle delay"""
+    banco.criar_tabela("lancamentos_removidos")
+    api = request.getfixturevalue(request.param)
+    monkeypatch.setattr(api, "SYNC_ATRASO_MS", 0)
+    return api, request.getfixturevalue(f"cliente_{request.param}")
+
+
+def _alteracoes(cliente, since=None, limit=None) -> dict:
+    parametros = urlencode({k: v for k, v in (("since", since), ("limit", limit)) if v is not None})
+    resposta = cliente.get(f"/api/lancamentos/changes?{parametros}")
+    assert resposta.status_code == 200, corpo_json(resposta)
+    return corpo_json(resposta)
+
+
+def test_pagina_pelo_cursor_e_traz_alteracoes_e_exclusoes_seguintes(app, banco):
+    _, cliente = app
+    banco.tabelas["lancamentos"].extend(_linha(n, _momento(60 - n)) for n in range(5))
+    # Exclusão anterior à primeira carga: o cliente nunca viu a linha
+    banco.tabelas["lancamentos_removidos"].append({"id": "lanc-antigo", "deleted_at": _momento(120)})
+
+    paginas, cursor = [], None
+    while True:
+        pagina = _alteracoes(cliente, cursor, limit=2)
+        paginas.append(pagina)
+        cursor = pagina["cursor"]
+        if not pagina["mais"]:
+            break
+    assert [[l["id"] for l in p["lancamentos"]] for p in paginas] == [["lanc-0", "lanc-1"], ["lanc-2", "lanc-3"], ["lanc-4"]]
+    assert all(p["removidos"] == [] for p in paginas)
+    assert "percentual_perdas" in paginas[0]["lancamentos"][0]
+
+    # Nada novo: o mesmo cursor continua valendo
+    vazia = _alteracoes(cliente, cursor)
+    assert (vazia["lancamentos"], vazia["removidos"], vazia["mais"]) == ([], [], False)
+
+    # Uma edição e uma exclusão depois do cursor
+    banco.tabelas["lancamentos"][1]["updated_at"] = _momento(0)
+    banco.tabelas["lancamentos"].pop(3)
+    banco.tabelas["lancamentos_removidos"].append({"id": "lanc-3", "deleted_at": _momento(0)})
+    seguinte = _alteracoes(cliente, vazia["cursor"])
+    assert [l["id"] for l in seguinte["lancamentos"]] == ["lanc-1"]
+    assert seguinte["removidos"] == ["lanc-3"]
+    assert _alteracoes(cliente, seguinte["cursor"])["removidos"] == []
+
+
+def test_exclusoes_paginam_pelo_proprio_cursor(app, banco):
+    _, cliente = app
+    cursor = _alteracoes(cliente)["cursor"]
+    banco.tabelas["lancamentos_removidos"].extend(
+        {"id": f"lanc-{n}", "deleted_at": _momento(0)} for n in range(3)
+    )
+
+    primeira = _alteracoes(cliente, cursor, limit=2)
+    segunda = _alteracoes(cliente, primeira["cursor"], limit=2)
+    assert (primeira["removidos"], primeira["mais"]) == (["lanc-0", "lanc-1"], True)
+    assert (segunda["removidos"], segunda["mais"]) == (["lanc-2"], False)
+
+
+def test_alteracoes_recentes_esperam_o_atraso(app, banco, monkeypatch):
+    api, cliente = app
+    monkeypatch.setattr(api, "SYNC_ATRASO_MS", 30000)
+    banco.tabelas["lancamentos"].extend([_linha(1, _momento(60)), _linha(2, _momento(5))])
+
+    # lanc-2 foi gravado há menos de SYNC_ATRASO_MS: fica para depois, e o cursor não passa dele
+    primeira = _alteracoes(cliente)
+    assert [l["id"] for l in primeira["lancamentos"]] == ["lanc-1"]
+    monkeypatch.setattr(api, "SYNC_ATRASO_MS", 0)
+    assert [l["id"] for l in _alteracoes(cliente, primeira["cursor"])["lancamentos"]] == ["lanc-2"]
+
+
+def test_cursor_mais_velho_que_a_retencao_responde_410(app):
+    api, cliente = app
+    velho = (datetime.now(timezone.utc) - timedelta(days=api.SYNC_RETENCAO_DIAS + 1)).isoformat()
+    cursor = api._codificar_cursor_sync([velho, ""], [velho, ""])
+
+    assert cliente.get(f"/api/lancamentos/changes?since={cursor}").status_code == 410
+    assert cliente.get("/api/lancamentos/changes?since=nao-e-um-cursor").status_code == 400
+
+
+def test_sem_o_schema_de_sincronizacao_responde_501(app, banco):
+    _, cliente = app
+    del banco.tabelas["lancamentos_removidos"]
+
+    assert cliente.get("/api/lancamentos/changes").status_code == 501
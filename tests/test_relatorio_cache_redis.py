@@ -0,0 +1,92 @@
+"""
+Cache de relatórios no Redis (RELATORIO_CACHE_URL), sobre o fakeredis: o
+índice das chaves é um conjunto por mês, com TTL, e a invalidação também
+tira do índice as chaves que já expiraram. No server.py as chamadas são
+aguardadas (redis.asyncio) em vez de bloquear o event loop.
+"""
+import asyncio
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+MARCO = "2026-03-01|2026-03-31|"
+TRIMESTRE = "2026-02-01|2026-04-30|ref-a"
+ABERTO = "|2026-03-31|"
+ABRIL = "2026-04-01|2026-04-30|"
+RELATORIO = {"producao_total": 10.5}
+
+
+def _conjunto(redis, nome) -> set:
+    return {c.decode() for c in redis.smembers(f"forte:relatorio:{nome}")}
+
+
+def test_meses_da_chave(server, index):
+    for api in (server, index):
+        assert api._meses_chave(TRIMESTRE) == ["2026-02", "2026-03", "2026-04"]
+        assert api._meses_chave("2025-11-15|2026-01-02|") == ["2025-11", "2025-12", "2026-01"]
+        assert api._meses_chave(ABERTO) is None
+        assert api._meses_chave("abc|2026-01-02|") is None
+
+
+def test_index_indexa_por_mes_e_limpa_chaves_expiradas(index):
+    cache = index._RelatorioCacheRedis("redis://localhost:6379/0", 300)
+    redis = cache._redis = fakeredis.FakeRedis()
+    for chave in (MARCO, TRIMESTRE, ABERTO, ABRIL):
+        cache.guardar(chave, RELATORIO)
+
+    assert _conjunto(redis, "mes:2026-03") == {MARCO, TRIMESTRE}
+    assert _conjunto(redis, "mes:2026-04") == {TRIMESTRE, ABRIL}
+    assert _conjunto(redis, "aberto") == {ABERTO}
+    assert 0 < redis.ttl("forte:relatorio:mes:2026-03") <= 300
+    assert not redis.exists("forte:relatorio:chaves")
+
+    # ABRIL expira pelo TTL; a próxima invalidação de abril o tira do índice
+    redis.delete("forte:relatorio:" + ABRIL)
+    assert cache.invalidar_data("2026-03-10") == 3
+    assert cache.obter(MARCO) is None and cache.obter(TRIMESTRE) is None and cache.obter(ABERTO) is None
+    assert _conjunto(redis, "mes:2026-03") == set()
+    assert _conjunto(redis, "aberto") == set()
+
+    assert cache.invalidar_data("2026-04-10") == 0
+    assert _conjunto(redis, "mes:2026-04") == set()
+
+
+def test_server_cache_redis_e_assincrono(server):
+    async def cenario():
+        cache = server._RelatorioCacheRedis("redis://localhost:6379/0", 300)
+        redis = cache._redis = fakeredis.FakeAsyncRedis()
+        for chave in (MARCO, TRIMESTRE, ABERTO, ABRIL):
+            await cache.guardar(chave, RELATORIO)
+        guardado = await cache.obter(MARCO)
+        await redis.delete("forte:relatorio:" + ABRIL)
+        invalidadas = await cache.invalidar_data("2026-04-10")
+        restantes = {c.decode() for c in await redis.smembers("forte:relatorio:mes:2026-04")}
+        await cache.remover(MARCO)
+        return guardado, invalidadas, restantes, await cache.obter(MARCO), await redis.smembers(
+            "forte:relatorio:mes:2026-03")
+
+    guardado, invalidadas, restantes, removido, marco = asyncio.run(cenario())
+    assert guardado == RELATORIO
+    assert invalidadas == 1  # TRIMESTRE; ABRIL já tinha expirado
+    assert restantes == set()
+    assert removido is None
+    assert marco == set()
+
+
+def test_server_escrita_invalida_o_relatorio_no_redis(server, cliente_server, monkeypatch):
+    cache = server._RelatorioCacheRedis("redis://localhost:6379/0", 300)
+    cache._redis = fakeredis.FakeAsyncRedis()
+    monkeypatch.setattr(server, "_cache_relatorios", cache)
+    url = "/api/relatorios?periodo=customizado&data_inicio=2026-03-01&data_fim=2026-03-31"
+    lancamento = {
+        "data": "2026-03-02", "turno": "Manhã", "hora": "08:00", "orelha_kg": 1, "aparas_kg": 0.5,
+        "referencia_producao": "REF-A", "referencia_lote": "L001",
+        "itens": [{"formato": "20x30", "cor": "Azul", "pacote_kg": 10, "producao_kg": 40.5}],
+    }
+
+    assert cliente_server.get(url).json()["producao_total"] == 0
+    assert cliente_server.get(url).json()["producao_total"] == 0
+    assert server._cache_stats["relatorios"]["hits"] >= 1
+    assert cliente_server.post("/api/lancamentos", json=lancamento).status_code == 200
+    assert cliente_server.get(url).json()["producao_total"] == 40.5
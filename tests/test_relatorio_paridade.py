@@ -0,0 +1,108 @@
+"""
+Os três backends de relatório (python, rpc e rollup) montam o mesmo JSON
+para as mesmas linhas, nas duas APIs. Os valores são somas exatas em
+binário, então a ordem em que cada backend soma não muda o resultado.
+"""
+import asyncio
+from datetime import date
+
+import pytest
+
+from .conftest import executar_sql
+
+LINHAS = [
+    # referência e itens comuns, em dois dias
+    {"id": "00000000-0000-0000-0000-000000000001", "data": "2026-03-02", "turno": "Manhã", "hora": "08:00",
+     "referencia_producao": "REF-A", "producao_total": 30.5, "perdas_total": 1.25,
+     "itens": [{"formato": "20x30", "cor": "Azul", "producao_kg": 20.5},
+               {"formato": "20x30", "cor": "Verde", "producao_kg": 10}]},
+    {"id": "00000000-0000-0000-0000-000000000002", "data": "2026-03-03", "turno": "Tarde", "hora": "14:00",
+     "referencia_producao": "REF-A", "producao_total": 12, "perdas_total": 0.5,
+     "itens": [{"formato": "20x30", "cor": "Azul", "producao_kg": "12"}]},
+    # referência vazia e nula contam como "Sem Referência"
+    {"id": "00000000-0000-0000-0000-000000000003", "data": "2026-03-02", "turno": "Noite", "hora": "22:00",
+     "referencia_producao": "", "producao_total": 8, "perdas_total": 2,
+     "itens": [{"formato": None, "cor": "Azul", "producao_kg": 4},
+               {"formato": "", "cor": None, "producao_kg": 2.5},
+               {"cor": "Azul", "producao_kg": 1.5}]},
+    {"id": "00000000-0000-0000-0000-000000000004", "data": "2026-03-04", "turno": "Manhã", "hora": "09:00",
+     "referencia_producao": None, "producao_total": None, "perdas_total": 0.75,
+     "itens": [{"formato": "N/A", "cor": "N/A", "producao_kg": None},
+               {"formato": "30x40", "producao_kg": ""}]},
+    # itens ausentes ou fora de uma lista não entram em por_item
+    {"id": "00000000-0000-0000-0000-000000000005", "data": "2026-03-04", "turno": "Tarde", "hora": "15:00",
+     "referencia_producao": "REF-B", "producao_total": 5, "perdas_total": 0, "itens": None},
+    {"id": "00000000-0000-0000-0000-000000000006", "data": "2026-03-05", "turno": "Tarde", "hora": "16:00",
+     "referencia_producao": "REF-B", "producao_total": 2.25, "perdas_total": 0.25, "itens": {"formato": "x"}},
+]
+
+
+def _normalizado(relatorio: dict) -> dict:
+    # por_item sai em ordem de produção; empates dependem do backend
+    return {**relatorio, "por_item": sorted(relatorio["por_item"], key=lambda item: item["item"])}
+
+
+@pytest.fixture(params=["server", "index"])
+def api(request):
+    return request.getfixturevalue(request.param)
+
+
+def test_referencia_e_formato_nulos_ou_vazios(api):
+    agregado = api._agregar_lancamentos(LINHAS)
+
+    assert agregado["lancamentos"] == 6
+    assert agregado["por_referencia"]["Sem Referência"] == {"prod": 8, "perd": 2.75, "dias": 2}
+    assert set(agregado["por_referencia"]) == {"REF-A", "REF-B", "Sem Referência"}
+    por_item = {chave: dados["producao"] for chave, dados in agregado["por_item"].items()}
+    assert por_item == {
+        "20x30 - Azul": 32.5,
+        "20x30 - Verde": 10,
+        # formato nulo ou ausente vira N/A, vazio continua vazio
+        "N/A - Azul": 5.5,
+        " - N/A": 2.5,
+        "N/A - N/A": 0,
+        "30x40 - N/A": 0,
+    }
+    assert agregado["por_item"][" - N/A"] == {"formato": "", "cor": "N/A", "producao": 2.5}
+
+
+def test_as_duas_apis_agregam_igual(server, index):
+    assert server._agregar_lancamentos(LINHAS) == index._agregar_lancamentos(LINHAS)
+
+
+async def _relatorios_postgres(api, dsn: str, data_inicio: str, data_fim: str) -> dict:
+    # Registros do asyncpg no JSON que o PostgREST devolveria
+    from server import _LancamentosPostgres
+
+    def linhas(registros):
+        return [_LancamentosPostgres._linha_json(r) for r in registros]
+
+    periodo = date.fromisoformat(data_inicio), date.fromisoformat(data_fim)
+
+    brutas = await executar_sql(
+        dsn,
+        "SELECT data, referencia_producao, producao_total, perdas_total, itens FROM lancamentos "
+        "WHERE data BETWEEN $1::date AND $2::date ORDER BY id",
+        *periodo
+    )
+    rpc = await executar_sql(dsn, "SELECT * FROM relatorio_agregado($1::date, $2::date, NULL)", *periodo)
+    dia = await executar_sql(dsn, "SELECT * FROM lancamentos_diario WHERE data BETWEEN $1::date AND $2::date",
+                             *periodo)
+    itens = await executar_sql(dsn, "SELECT * FROM lancamentos_diario_itens WHERE data BETWEEN $1::date AND $2::date",
+                               *periodo)
+    return {
+        "python": api._agregar_lancamentos(linhas(brutas)),
+        "rpc": api._agregado_de_linhas_rpc(linhas(rpc)),
+        "rollup": api._agregar_rollup(linhas(dia), linhas(itens)),
+    }
+
+
+def test_backends_montam_o_mesmo_relatorio(api, inserir_postgres, postgres):
+    inserir_postgres(LINHAS)
+    agregados = asyncio.run(_relatorios_postgres(api, postgres, "2026-03-01", "2026-03-31"))
+
+    esperado = _normalizado(api._montar_relatorio(api._agregar_lancamentos(LINHAS), "2026-03-01", "2026-03-31"))
+    for backend, agregado in agregados.items():
+        assert _normalizado(api._montar_relatorio(agregado, "2026-03-01", "2026-03-31")) == esperado, backend
+    assert esperado["producao_total"] == 57.75
+    assert esperado["dias_produzidos"] == 4
@@ -0,0 +1,230 @@
+"""
+Single-flight dos relatórios: pedidos simultâneos do mesmo relatório sem
+cache disparam um cálculo só. No server.py os pedidos aguardam a mesma
+tarefa asyncio; no index.py as threads aguardam o threading.Event do líder.
+
+Admissão dos relatórios pesados: acima de RELATORIO_PESADO_DIAS, com as
+vagas e a fila ocupadas, o pedido recebe 429 com Retry-After; intervalos
+curtos não passam pela admissão.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+PEDIDOS = 20
+PERIODO = ("2026-03-01", "2026-03-31", "")
+# Intervalos acima de RELATORIO_PESADO_DIAS, com chaves distintas
+PESADOS = [("2025-01-01", "2026-03-31", referencia) for referencia in ("a", "b", "c")]
+AGREGADO = {
+    "lancamentos": 1, "producao": 10.5, "perdas": 0.5, "dias": 1,
+    "por_referencia": {"REF-A": {"prod": 10.5, "perd": 0.5, "dias": 1}},
+    "por_item": {"20x30 - Azul": {"formato": "20x30", "cor": "Azul", "producao": 10.5}},
+}
+
+
+def _coalescidas(api) -> int:
+    return api._cache_stats["relatorios"]["coalescidas"]
+
+
+class _CalculoRepositorio:
+    """Lancamentos driver stub whose report blocks until released"""
+
+    def __init__(self, erro=None):
+        self.chamadas = 0
+        self.erro = erro
+        self.liberar = asyncio.Event()
+
+    async def agregar_relatorio(self, data_inicio, data_fim, referencia):
+        self.chamadas += 1
+        await self.liberar.wait()
+        if self.erro is not None:
+            raise self.erro
+        return AGREGADO
+
+
+async def _pedidos_simultaneos(server, repositorio):
+    antes = _coalescidas(server)
+    pedidos = [asyncio.ensure_future(server._relatorio_cacheado(*PERIODO)) for _ in range(PEDIDOS)]
+    while _coalescidas(server) - antes < PEDIDOS - 1:
+        await asyncio.sleep(0)
+    repositorio.liberar.set()
+    return await asyncio.gather(*pedidos, return_exceptions=True)
+
+
+def test_server_calcula_uma_vez_para_pedidos_simultaneos(server, monkeypatch):
+    async def cenario():
+        repositorio = _CalculoRepositorio()
+        monkeypatch.setattr(server, "_lancamentos", repositorio)
+        resultados = await _pedidos_simultaneos(server, repositorio)
+        # O próximo pedido sai do cache
+        return repositorio, resultados, await server._relatorio_cacheado(*PERIODO)
+
+    repositorio, resultados, seguinte = asyncio.run(cenario())
+    assert repositorio.chamadas == 1
+    assert all(r == resultados[0] for r in resultados)
+    assert resultados[0]["producao_total"] == 10.5
+    assert seguinte == resultados[0]
+    assert server._relatorios_em_andamento == {}
+
+
+def test_server_erro_do_calculo_chega_a_todos_e_nao_trava_a_chave(server, monkeypatch):
+    erro = RuntimeError("falha no cálculo")
+
+    async def cenario():
+        repositorio = _CalculoRepositorio(erro)
+        monkeypatch.setattr(server, "_lancamentos", repositorio)
+        resultados = await _pedidos_simultaneos(server, repositorio)
+        pendentes = dict(server._relatorios_em_andamento)
+        # Com a chave livre, o pedido seguinte calcula de novo
+        repositorio.erro = None
+        return repositorio, resultados, pendentes, await server._relatorio_cacheado(*PERIODO)
+
+    repositorio, resultados, pendentes, seguinte = asyncio.run(cenario())
+    assert all(r is erro for r in resultados)
+    assert pendentes == {}
+    assert repositorio.chamadas == 2
+    assert seguinte["producao_total"] == 10.5
+
+
+def test_server_pedido_cancelado_nao_cancela_o_calculo(server, monkeypatch):
+    async def cenario():
+        repositorio = _CalculoRepositorio()
+        monkeypatch.setattr(server, "_lancamentos", repositorio)
+        primeiro = asyncio.ensure_future(server._relatorio_cacheado(*PERIODO))
+        segundo = asyncio.ensure_future(server._relatorio_cacheado(*PERIODO))
+        while repositorio.chamadas == 0:
+            await asyncio.sleep(0)
+        primeiro.cancel()
+        repositorio.liberar.set()
+        return repositorio, await segundo, primeiro.cancelled()
+
+    repositorio, relatorio, cancelado = asyncio.run(cenario())
+    assert cancelado
+    assert repositorio.chamadas == 1
+    assert relatorio["producao_total"] == 10.5
+
+
+class _CalculoBackend:
+    """Report backend stub for index.py that blocks until released"""
+
+    def __init__(self, erro=None):
+        self.chamadas = 0
+        self.erro = erro
+        self.liberar = threading.Event()
+        self._lock = threading.Lock()
+
+    def __call__(self, data_inicio, data_fim, referencia):
+        with self._lock:
+            self.chamadas += 1
+        assert self.liberar.wait(5)
+        if self.erro is not None:
+            raise self.erro
+        return AGREGADO
+
+
+def _threads_simultaneas(index, backend) -> list:
+    def pedir():
+        try:
+            return index._relatorio_cacheado(*PERIODO)
+        except Exception as e:
+            return e
+
+    antes = _coalescidas(index)
+    with ThreadPoolExecutor(max_workers=PEDIDOS) as executor:
+        pedidos = [executor.submit(pedir) for _ in range(PEDIDOS)]
+        limite = time.monotonic() + 5
+        while _coalescidas(index) - antes < PEDIDOS - 1 and time.monotonic() < limite:
+            time.sleep(0.001)
+        backend.liberar.set()
+        return [p.result(timeout=5) for p in pedidos]
+
+
+@pytest.fixture
+def backend_index(index, monkeypatch):
+    def instalar(backend):
+        monkeypatch.setitem(index.RELATORIO_BACKENDS, index.RELATORIO_BACKEND, backend)
+        return backend
+    return instalar
+
+
+def test_index_calcula_uma_vez_para_threads_simultaneas(index, backend_index):
+    backend = backend_index(_CalculoBackend())
+
+    resultados = _threads_simultaneas(index, backend)
+
+    assert backend.chamadas == 1
+    assert all(r == resultados[0] for r in resultados)
+    assert resultados[0]["producao_total"] == 10.5
+    assert index._relatorio_cacheado(*PERIODO) == resultados[0]
+    assert index._relatorios_em_andamento == {}
+
+
+def test_index_erro_do_lider_chega_as_threads_e_nao_trava_a_chave(index, backend_index):
+    erro = RuntimeError("falha no cálculo")
+    backend = backend_index(_CalculoBackend(erro))
+
+    resultados = _threads_simultaneas(index, backend)
+
+    assert all(r is erro for r in resultados)
+    assert index._relatorios_em_andamento == {}
+    backend.erro = None
+    assert index._relatorio_cacheado(*PERIODO)["producao_total"] == 10.5
+    assert backend.chamadas == 2
+
+
+def test_server_admissao_recusa_pesado_com_vagas_e_fila_cheias(server, monkeypatch):
+    monkeypatch.setattr(server, "_admissao_relatorios", server._Admissao(1, 1, 5))
+
+    async def cenario():
+        repositorio = _CalculoRepositorio()
+        monkeypatch.setattr(server, "_lancamentos", repositorio)
+        admissao = server._admissao_relatorios
+        # Um calcula, o outro espera na fila
+        pesados = [asyncio.ensure_future(server._relatorio_cacheado(*p)) for p in PESADOS[:2]]
+        while not (repositorio.chamadas == 1 and admissao.na_fila == 1):
+            await asyncio.sleep(0)
+        with pytest.raises(server.HTTPException) as recusa:
+            await server._relatorio_cacheado(*PESADOS[2])
+        # O intervalo curto calcula na hora, com a vaga ocupada
+        curto = asyncio.ensure_future(server._relatorio_cacheado(*PERIODO))
+        while repositorio.chamadas < 2:
+            await asyncio.sleep(0)
+        repositorio.liberar.set()
+        return recusa.value, await asyncio.gather(*pesados, curto), repositorio.chamadas
+
+    recusa, resultados, chamadas = asyncio.run(cenario())
+    assert recusa.status_code == 429
+    assert int(recusa.headers["Retry-After"]) >= 1
+    assert all(r["producao_total"] == 10.5 for r in resultados)
+    assert chamadas == 3
+
+
+def _esperar(condicao):
+    limite = time.monotonic() + 5
+    while not condicao():
+        assert time.monotonic() < limite
+        time.sleep(0.001)
+
+
+def test_index_admissao_recusa_pesado_com_vagas_e_fila_cheias(index, backend_index, cliente_index, monkeypatch):
+    monkeypatch.setattr(index, "_admissao_relatorios", index._Admissao(1, 1, 5))
+    backend = backend_index(_CalculoBackend())
+    data_inicio, data_fim, referencia = PESADOS[2]
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        pesados = [executor.submit(index._relatorio_cacheado, *p) for p in PESADOS[:2]]
+        _esperar(lambda: backend.chamadas == 1 and index._admissao_relatorios.na_fila == 1)
+        recusa = cliente_index.get(f"/api/relatorios?periodo=customizado&data_inicio={data_inicio}"
+                                   f"&data_fim={data_fim}&referencia_producao={referencia}")
+        curto = executor.submit(index._relatorio_cacheado, *PERIODO)
+        _esperar(lambda: backend.chamadas == 2)
+        backend.liberar.set()
+        resultados = [f.result(timeout=5) for f in pesados + [curto]]
+
+    assert recusa.status_code == 429
+    assert int(recusa.headers["Retry-After"]) >= 1
+    assert all(r["producao_total"] == 10.5 for r in resultados)
+    assert backend.chamadas == 3
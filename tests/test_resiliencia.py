@@ -0,0 +1,244 @@
+"""
+Resiliência das chamadas ao Supabase nas duas APIs: estados do disjuntor,
+repetição só das leituras idempotentes e a última cópia boa (X-Stale)
+enquanto o Supabase falha.
+"""
+import asyncio
+from datetime import date, timedelta
+
+import bench_api
+import fake_supabase
+import pytest
+from postgrest.exceptions import APIError
+
+from .conftest import corpo_json
+
+
+class _Falhas:
+    """Switch that makes every FakeSupabase call fail, counting the calls"""
+
+    def __init__(self):
+        self.ativas = False
+        self.erro = APIError({"code": "PGRST001", "message": "Database client error"})
+        self.chamadas = 0
+
+    def envolver(self, execute):
+        def executar(query):
+            self.chamadas += 1
+            if self.ativas:
+                raise self.erro
+            return execute(query)
+        return executar
+
+
+@pytest.fixture
+def falhas(monkeypatch):
+    controle = _Falhas()
+    for classe in (fake_supabase.FakeQuery, fake_supabase.FakeRPC):
+        monkeypatch.setattr(classe, "execute", controle.envolver(classe.execute))
+    return controle
+
+
+@pytest.fixture(params=["server", "index"])
+def api(request):
+    return request.getfixturevalue(request.param)
+
+
+def _executar(api, query):
+    # A chamada síncrona que passa pelo disjuntor em cada API
+    return api._executar_medido(query) if hasattr(api, "_executar_medido") else api._executar(query)
+
+
+def test_disjuntor_abre_meio_abre_e_fecha(api):
+    agora = [1000.0]
+    disjuntor = api._Disjuntor(3, 10, relogio=lambda: agora[0])
+
+    for _ in range(2):
+        disjuntor.liberar()
+        disjuntor.falha()
+    assert not disjuntor.aberto
+    disjuntor.liberar()
+    disjuntor.falha()
+    assert disjuntor.aberto
+
+    with pytest.raises(api._SupabaseIndisponivel) as recusa:
+        disjuntor.liberar()
+    assert recusa.value.retry_after == 10
+    agora[0] += 9.5
+    with pytest.raises(api._SupabaseIndisponivel) as recusa:
+        disjuntor.liberar()
+    assert recusa.value.retry_after == 1
+
+    # Passada a pausa só uma chamada de teste passa; se ela falha, abre de novo
+    agora[0] += 0.5
+    disjuntor.liberar()
+    with pytest.raises(api._SupabaseIndisponivel):
+        disjuntor.liberar()
+    disjuntor.falha()
+    with pytest.raises(api._SupabaseIndisponivel) as recusa:
+        disjuntor.liberar()
+    assert recusa.value.retry_after == 10
+
+    # Se a chamada de teste dá certo, fecha
+    agora[0] += 10
+    disjuntor.liberar()
+    disjuntor.sucesso()
+    assert not disjuntor.aberto
+    for _ in range(5):
+        disjuntor.liberar()
+
+
+def test_disjuntor_aberto_nao_chama_o_supabase(api, banco, falhas, monkeypatch):
+    agora = [1000.0]
+    monkeypatch.setattr(api, "_disjuntor", api._Disjuntor(2, 10, relogio=lambda: agora[0]))
+    monkeypatch.setattr(api, "SUPABASE_TENTATIVAS", 3)
+    falhas.ativas = True
+
+    # A segunda tentativa abre o disjuntor e a leitura desiste antes da terceira
+    with pytest.raises(APIError):
+        _executar(api, banco.table("lancamentos").select("*"))
+    assert falhas.chamadas == 2
+    with pytest.raises(api._SupabaseIndisponivel):
+        _executar(api, banco.table("lancamentos").select("*"))
+    assert falhas.chamadas == 2
+
+    agora[0] += 10
+    falhas.ativas = False
+    assert _executar(api, banco.table("lancamentos").select("*")).data == []
+    assert falhas.chamadas == 3
+    assert not api._disjuntor.aberto
+
+
+@pytest.mark.parametrize("montar, tentativas", [
+    (lambda banco: banco.table("lancamentos").select("*"), 3),
+    (lambda banco: banco.rpc("relatorio_agregado", {}), 3),
+    (lambda banco: banco.table("lancamentos").insert({"id": "1"}), 1),
+    (lambda banco: banco.table("lancamentos").upsert({"id": "1"}, on_conflict="id", ignore_duplicates=True), 1),
+    (lambda banco: banco.table("lancamentos").update({"turno": "B"}).eq("id", "1"), 1),
+    (lambda banco: banco.table("lancamentos").delete().eq("id", "1"), 1),
+    (lambda banco: banco.rpc("rollup_reconstruir", {}), 1),
+], ids=["select", "rpc-leitura", "insert", "upsert", "update", "delete", "rpc-escrita"])
+def test_so_leituras_idempotentes_sao_repetidas(api, banco, falhas, monkeypatch, montar, tentativas):
+    monkeypatch.setattr(api, "_disjuntor", api._Disjuntor(100, 10))
+    monkeypatch.setattr(api, "SUPABASE_TENTATIVAS", 3)
+    falhas.ativas = True
+
+    with pytest.raises(APIError):
+        _executar(api, montar(banco))
+    assert falhas.chamadas == tentativas
+
+
+def test_erro_da_requisicao_nao_e_repetido(api, banco, falhas, monkeypatch):
+    monkeypatch.setattr(api, "SUPABASE_TENTATIVAS", 3)
+    falhas.ativas = True
+    falhas.erro = APIError({"code": "42703", "message": "column lancamentos.x does not exist"})
+
+    with pytest.raises(APIError):
+        _executar(api, banco.table("lancamentos").select("x"))
+    assert falhas.chamadas == 1
+    assert not api._disjuntor.aberto
+
+
+@pytest.mark.parametrize("sqlstate, transitoria", [
+    ("08003", True), ("08006", True), ("57P01", True), ("57P03", True), ("53300", True),
+    ("22P02", False), ("23505", False), ("42883", False),
+])
+def test_sqlstate_transitorio_do_asyncpg(server, sqlstate, transitoria):
+    asyncpg = pytest.importorskip("asyncpg")
+    erro = asyncpg.PostgresError.get_message_class_for_sqlstate(sqlstate)("erro")
+    assert server._falha_transitoria(erro) is transitoria
+
+
+def test_driver_postgres_passa_pelo_disjuntor(server, postgres, monkeypatch):
+    asyncpg = pytest.importorskip("asyncpg")
+    agora = [1000.0]
+    monkeypatch.setattr(server, "_disjuntor", server._Disjuntor(3, 10, relogio=lambda: agora[0]))
+    monkeypatch.setattr(server, "SUPABASE_TENTATIVAS", 2)
+    falhas = _Falhas()
+    falhas.erro = asyncpg.exceptions.ConnectionDoesNotExistError("connection was closed in the middle of operation")
+    chamadas = []
+
+    async def cenario():
+        repositorio = server._LancamentosPostgres(postgres)
+        pool = await repositorio._conexoes()
+
+        class PoolComFalhas:
+            async def fetch(self, *args):
+                falhas.chamadas += 1
+                if falhas.ativas:
+                    raise falhas.erro
+                return await pool.fetch(*args)
+
+        async def conexoes():
+            return PoolComFalhas()
+
+        repositorio._conexoes = conexoes
+        try:
+            falhas.ativas = True
+            # A leitura é repetida; a escrita não, e a terceira falha abre o disjuntor
+            with pytest.raises(asyncpg.exceptions.ConnectionDoesNotExistError):
+                await repositorio.listar("id", None, None, None)
+            chamadas.append(falhas.chamadas)
+            with pytest.raises(asyncpg.exceptions.ConnectionDoesNotExistError):
+                await repositorio.inserir([{"id": "00000000-0000-0000-0000-000000000001", "data": "2026-03-02"}])
+            chamadas.append(falhas.chamadas)
+            with pytest.raises(server._SupabaseIndisponivel):
+                await repositorio.listar("id", None, None, None)
+            chamadas.append(falhas.chamadas)
+
+            agora[0] += 10
+            falhas.ativas = False
+            linhas, _ = await repositorio.listar("id", None, None, None)
+            # Um id inválido é erro da requisição: não conta como falha
+            return linhas, await repositorio.obter("nao-e-um-uuid")
+        finally:
+            await repositorio.fechar()
+
+    linhas, invalido = asyncio.run(cenario())
+    assert chamadas == [2, 3, 3]
+    assert linhas == [] and invalido is None
+    assert not server._disjuntor.aberto
+
+
+@pytest.fixture(params=["server", "index"])
+def app(request, banco):
+    """(API module, test client) over a seeded FakeSupabase"""
+    bench_api.popular(banco, 60, 1, 3, 1)
+    return request.getfixturevalue(request.param), request.getfixturevalue(f"cliente_{request.param}")
+
+
+def test_relatorio_desatualizado_enquanto_o_supabase_falha(app, falhas, monkeypatch):
+    api, cliente = app
+    hoje = date.today()
+    url = f"/api/relatorios?periodo=customizado&data_inicio={hoje - timedelta(days=30)}&data_fim={hoje}"
+    bom = cliente.get(url)
+    assert bom.status_code == 200
+    assert "X-Stale" not in bom.headers
+
+    # Sem a cópia no cache, o relatório teria de ser recalculado
+    monkeypatch.setattr(api, "_cache_relatorios",
+                        api._RelatorioCacheMemoria(api.RELATORIO_CACHE_MAX, api.RELATORIO_CACHE_TTL))
+    falhas.ativas = True
+    velho = cliente.get(url)
+    assert velho.status_code == 200
+    assert velho.headers["X-Stale"] == "true"
+    assert corpo_json(velho) == corpo_json(bom)
+
+    # Um período que nunca foi calculado não tem cópia: 503 com Retry-After
+    outro = cliente.get(f"/api/relatorios?periodo=customizado&data_inicio={hoje - timedelta(days=7)}&data_fim={hoje}")
+    assert outro.status_code == 503
+    assert int(outro.headers["Retry-After"]) >= 1
+
+
+def test_variaveis_desatualizadas_enquanto_o_supabase_falha(app, falhas):
+    api, cliente = app
+    bom = cliente.get("/api/variaveis")
+    assert bom.status_code == 200
+    assert "X-Stale" not in bom.headers
+
+    api._cache_variaveis["dados"] = None
+    falhas.ativas = True
+    velho = cliente.get("/api/variaveis")
+    assert velho.status_code == 200
+    assert velho.headers["X-Stale"] == "true"
+    assert corpo_json(velho) == corpo_json(bom)
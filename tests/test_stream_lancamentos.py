@@ -0,0 +1,161 @@
+"""
+Eventos de lançamentos por SSE (GET /api/stream/lancamentos, só no
+server.py): o broker em memória com o histórico para Last-Event-ID e o
+"recarregar" quando há lacuna, e o formato dos eventos que as escritas
+publicam. O corpo da resposta não termina, então o app ASGI é chamado direto
+e o corpo é lido pedaço a pedaço.
+"""
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from .conftest import corpo_json
+
+LANCAMENTO = {
+    "data": "2026-03-02", "turno": "Manhã", "hora": "08:00", "orelha_kg": 1, "aparas_kg": 0.5,
+    "referencia_producao": "REF-A", "referencia_lote": "L001",
+    "itens": [{"formato": "20x30", "cor": "Azul", "pacote_kg": 10, "producao_kg": 40.5}],
+}
+
+
+def _evento(mensagem: bytes) -> tuple:
+    """(id, event name, data) of one SSE message"""
+    campos = {}
+    for linha in mensagem.decode("utf-8").strip().split("\n"):
+        nome, _, valor = linha.partition(": ")
+        campos[nome] = valor
+    return campos.get("id"), campos["event"], json.loads(campos["data"])
+
+
+def test_broker_repete_o_que_faltou_desde_o_last_event_id(server):
+    async def cenario():
+        broker = server._BrokerLancamentos(8, 16)
+        fila = broker.assinar()
+        for n in range(3):
+            await broker.publicar({"tipo": "criado", "n": n})
+        recebidos = [_evento(fila.get_nowait()) for _ in range(3)]
+        broker.cancelar(fila)
+
+        # Reconecta tendo visto só o primeiro evento
+        await broker.publicar({"tipo": "criado", "n": 3})
+        nova = broker.assinar(recebidos[0][0])
+        return recebidos, [_evento(nova.get_nowait()) for _ in range(nova.qsize())], len(broker)
+
+    recebidos, repetidos, assinantes = asyncio.run(cenario())
+    assert [dados["n"] for _, _, dados in recebidos] == [0, 1, 2]
+    assert len({evento_id for evento_id, _, _ in recebidos}) == 3
+    assert [dados["n"] for _, _, dados in repetidos] == [1, 2, 3]
+    assert [evento_id for evento_id, _, _ in repetidos[:2]] == [evento_id for evento_id, _, _ in recebidos[1:]]
+    assert assinantes == 1
+
+
+@pytest.mark.parametrize("ultimo_id", ["visto", "outro-worker-1"])
+def test_broker_sem_como_repetir_manda_recarregar(server, ultimo_id):
+    async def cenario():
+        broker = server._BrokerLancamentos(8, 16)
+        fila = broker.assinar()
+        await broker.publicar({"tipo": "criado"})
+        visto = _evento(fila.get_nowait())[0]
+        # Um evento não publicado (sem assinantes) apaga o histórico
+        broker.lacuna()
+        await broker.publicar({"tipo": "criado"})
+        nova = broker.assinar(visto if ultimo_id == "visto" else ultimo_id)
+        return [_evento(nova.get_nowait()) for _ in range(nova.qsize())]
+
+    assert asyncio.run(cenario()) == [(None, "lancamento", {"tipo": "recarregar"})]
+
+
+def test_broker_assinante_lento_recebe_recarregar(server):
+    async def cenario():
+        broker = server._BrokerLancamentos(2, 16)
+        fila = broker.assinar()
+        for n in range(3):
+            await broker.publicar({"tipo": "criado", "n": n})
+        return [_evento(fila.get_nowait()) for _ in range(fila.qsize())]
+
+    assert asyncio.run(cenario()) == [(None, "lancamento", {"tipo": "recarregar"})]
+
+
+async def _assinar(server, *cabecalhos) -> tuple:
+    """Open /api/stream/lancamentos; returns (queue of ASGI messages, task)"""
+    mensagens = asyncio.Queue()
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": "/api/stream/lancamentos", "raw_path": b"/api/stream/lancamentos", "query_string": b"",
+        "root_path": "", "server": ("teste", 80), "client": ("teste", 1),
+        "headers": [(b"host", b"teste")] + [(k.encode(), v.encode()) for k, v in cabecalhos],
+    }
+
+    async def receive():
+        await asyncio.Event().wait()
+
+    tarefa = asyncio.ensure_future(server.app(scope, receive, mensagens.put))
+    inicio = await asyncio.wait_for(mensagens.get(), 5)
+    assert (inicio["type"], inicio["status"]) == ("http.response.start", 200)
+    assert dict(inicio["headers"])[b"content-type"].startswith(b"text/event-stream")
+    assert (await asyncio.wait_for(mensagens.get(), 5))["body"].startswith(b"retry: ")
+    return mensagens, tarefa
+
+
+async def _proximos(mensagens, n: int) -> list:
+    return [_evento((await asyncio.wait_for(mensagens.get(), 5))["body"]) for _ in range(n)]
+
+
+async def _fechar(tarefa):
+    tarefa.cancel()
+    await asyncio.gather(tarefa, return_exceptions=True)
+
+
+def test_stream_publica_lancamento_e_totais_do_mes(server):
+    async def cenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://teste") as cliente:
+            mensagens, tarefa = await _assinar(server)
+            lancamento_id = corpo_json(await cliente.post("/api/lancamentos", json=LANCAMENTO))["id"]
+            criado = await _proximos(mensagens, 1)
+            await cliente.delete(f"/api/lancamentos/{lancamento_id}")
+            removido = await _proximos(mensagens, 1)
+            await _fechar(tarefa)
+            return lancamento_id, criado + removido, len(server._broker_lancamentos)
+
+    lancamento_id, eventos, assinantes = asyncio.run(cenario())
+    (id_criado, nome, criado), (id_removido, _, removido) = eventos
+    assert nome == "lancamento" and id_criado and id_removido and id_criado != id_removido
+    assert criado["tipo"] == "criado"
+    assert (criado["lancamento"]["id"], criado["lancamento"]["producao_total"]) == (lancamento_id, 40.5)
+    assert "percentual_perdas" in criado["lancamento"]
+    assert [t["mes"] for t in criado["totais_mes"]] == ["2026-03"]
+    assert set(criado["totais_mes"][0]) == {"mes", *server.SSE_CAMPOS_TOTAIS}
+    assert criado["totais_mes"][0]["producao_total"] == 40.5
+
+    assert removido["tipo"] == "removido"
+    assert removido["lancamento"] == {"id": lancamento_id, "data": "2026-03-02"}
+    assert removido["totais_mes"][0]["producao_total"] == 0
+    assert assinantes == 0
+
+
+def test_stream_reconexao_repete_e_lacuna_manda_recarregar(server):
+    async def cenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://teste") as cliente:
+            mensagens, tarefa = await _assinar(server)
+            for hora in ("08:00", "09:00"):
+                await cliente.post("/api/lancamentos", json={**LANCAMENTO, "hora": hora})
+            primeiro, segundo = await _proximos(mensagens, 2)
+            await _fechar(tarefa)
+
+            # Reconecta com Last-Event-ID do primeiro: recebe o segundo de novo
+            mensagens, tarefa = await _assinar(server, ("last-event-id", primeiro[0]))
+            repetido = await _proximos(mensagens, 1)
+            await _fechar(tarefa)
+
+            # Escrita sem assinantes: ninguém pode retomar depois dela
+            await cliente.post("/api/lancamentos", json={**LANCAMENTO, "hora": "10:00"})
+            mensagens, tarefa = await _assinar(server, ("last-event-id", segundo[0]))
+            depois_da_lacuna = await _proximos(mensagens, 1)
+            await _fechar(tarefa)
+            return segundo, repetido, depois_da_lacuna
+
+    segundo, repetido, depois_da_lacuna = asyncio.run(cenario())
+    assert repetido == [segundo]
+    assert depois_da_lacuna == [(None, "lancamento", {"tipo": "recarregar"})]
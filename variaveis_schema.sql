@@ -24,3 +24,17 @@ CREATE POLICY "Enable all access for variaveis" ON variaveis
 
 -- Se a tabela já existe, adicionar coluna ordem:
 -- ALTER TABLE variaveis ADD COLUMN IF NOT EXISTS ordem INTEGER DEFAULT 0;
+
+-- Reordenação em lote (PUT /api/variaveis/ordem): aplica todas as ordens
+-- em uma única transação e devolve a lista completa já ordenada
+CREATE OR REPLACE FUNCTION reordenar_variaveis(p_itens JSONB)
+RETURNS SETOF variaveis
+LANGUAGE sql
+AS $$
+    UPDATE variaveis v
+    SET ordem = i.ordem
+    FROM jsonb_to_recordset(p_itens) AS i(id TEXT, ordem INTEGER)
+    WHERE v.id = i.id;
+
+    SELECT * FROM variaveis ORDER BY tipo, ordem NULLS LAST, nome;
+$$;
@@ -0,0 +1,90 @@
+-- SQL das versões de dados usadas pelo cache HTTP/CDN da API
+-- (ETag de /api/variaveis e dos relatórios de períodos fechados)
+-- Execute este SQL no Supabase SQL Editor.
+-- Cada escrita em variaveis ou lancamentos incrementa a versão do recurso
+-- afetado; a API deriva os ETags dessas versões e responde 304 sem carregar os
+-- dados. Sem este SQL as respostas continuam fora da CDN.
+
+CREATE TABLE IF NOT EXISTS versoes_dados (
+    recurso TEXT PRIMARY KEY,
+    versao BIGINT NOT NULL DEFAULT 0,
+    atualizado_em TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+ALTER TABLE versoes_dados ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Enable all access for versoes_dados" ON versoes_dados;
+CREATE POLICY "Enable all access for versoes_dados" ON versoes_dados
+    FOR ALL USING (true) WITH CHECK (true);
+
+CREATE OR REPLACE FUNCTION versoes_dados_incrementar(p_recursos TEXT[])
+RETURNS VOID
+LANGUAGE sql
+AS $$
+    INSERT INTO versoes_dados (recurso, versao, atualizado_em)
+    SELECT DISTINCT r, 1, now() FROM unnest(p_recursos) AS r
+    ON CONFLICT (recurso) DO UPDATE
+        SET versao = versoes_dados.versao + 1, atualizado_em = now();
+$$;
+
+-- variaveis: uma versão para a lista inteira, por comando
+CREATE OR REPLACE FUNCTION variaveis_versao_trigger()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM versoes_dados_incrementar(ARRAY['variaveis']);
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_variaveis_versao ON variaveis;
+CREATE TRIGGER trg_variaveis_versao
+    AFTER INSERT OR UPDATE OR DELETE ON variaveis
+    FOR EACH STATEMENT EXECUTE FUNCTION variaveis_versao_trigger();
+
+-- lancamentos: uma versão por mês de `data` ('lancamentos:2025-03'), para
+-- que lançar na produção de hoje não invalide relatórios de meses fechados.
+-- Por comando, com as linhas alteradas nas transition tables (uma importação
+-- em lote incrementa cada mês uma vez só). Tabelas de transição exigem um
+-- trigger por evento.
+CREATE OR REPLACE FUNCTION lancamentos_versao_trigger()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    meses TEXT[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(DISTINCT 'lancamentos:' || left(data::TEXT, 7)) INTO meses FROM novas;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(DISTINCT 'lancamentos:' || left(data::TEXT, 7)) INTO meses FROM antigas;
+    ELSE
+        -- Mudar a data de um lançamento afeta o mês antigo e o novo
+        SELECT array_agg(DISTINCT 'lancamentos:' || left(data::TEXT, 7)) INTO meses
+        FROM (SELECT data FROM novas UNION SELECT data FROM antigas) AS alteradas;
+    END IF;
+    IF meses IS NOT NULL THEN
+        PERFORM versoes_dados_incrementar(meses);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_lancamentos_versao_insert ON lancamentos;
+CREATE TRIGGER trg_lancamentos_versao_insert
+    AFTER INSERT ON lancamentos
+    REFERENCING NEW TABLE AS novas
+    FOR EACH STATEMENT EXECUTE FUNCTION lancamentos_versao_trigger();
+
+DROP TRIGGER IF EXISTS trg_lancamentos_versao_update ON lancamentos;
+CREATE TRIGGER trg_lancamentos_versao_update
+    AFTER UPDATE ON lancamentos
+    REFERENCING NEW TABLE AS novas OLD TABLE AS antigas
+    FOR EACH STATEMENT EXECUTE FUNCTION lancamentos_versao_trigger();
+
+DROP TRIGGER IF EXISTS trg_lancamentos_versao_delete ON lancamentos;
+CREATE TRIGGER trg_lancamentos_versao_delete
+    AFTER DELETE ON lancamentos
+    REFERENCING OLD TABLE AS antigas
+    FOR EACH STATEMENT EXECUTE FUNCTION lancamentos_versao_trigger();